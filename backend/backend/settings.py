@@ -11,7 +11,12 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 # Import necessary modules
+import os
 from pathlib import Path
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
 
 # Define base directory
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -69,12 +74,47 @@ TEMPLATES = [
 WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database configuration
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql selects PostgreSQL (configured by the POSTGRES_* variables);
+# the default is a local SQLite file
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'ghostwriter'),
+            'USER': os.getenv('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # Persistent connections, checked before reuse
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.getenv('DB_POOL', 'false').lower() in ('1', 'true', 'yes'):
+        # psycopg 3 connection pool, shared by all threads of a process; replaces persistent connections
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # WAL lets readers run alongside the writer; IMMEDIATE takes the write
+                # lock up front so concurrent writers queue instead of failing mid-transaction
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': int(os.getenv('SQLITE_TIMEOUT', 20)),
+            },
+        }
     }
-}
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -126,6 +166,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Opt-in: lists stay plain arrays unless ?limit= is passed
+    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
 }
 
 # JWT configuration
@@ -154,3 +196,101 @@ SIMPLE_JWT = {
 
 # CORS credentials
 CORS_ALLOW_CREDENTIALS = True
+
+# Background LLM worker pool
+LLM_WORKER_THREADS = int(os.getenv('LLM_WORKER_THREADS', 4))
+LLM_JOB_STALE_SECONDS = int(os.getenv('LLM_JOB_STALE_SECONDS', 900))  # Requeue 'running' jobs with an older heartbeat
+LLM_JOB_HEARTBEAT_SECONDS = int(os.getenv('LLM_JOB_HEARTBEAT_SECONDS', 60))
+# Resume queued jobs when a server process starts (runserver, gunicorn, uvicorn, daphne, hypercorn)
+LLM_RESUME_JOBS_ON_STARTUP = os.getenv('LLM_RESUME_JOBS_ON_STARTUP', 'true').lower() in ('1', 'true', 'yes')
+# Set to force starting the workers in this process (1) or never starting them (0),
+# e.g. for a server not detected above; unset detects server processes
+LLM_RUN_WORKERS = (
+    os.getenv('LLM_RUN_WORKERS').lower() in ('1', 'true', 'yes') if os.getenv('LLM_RUN_WORKERS') else None
+)
+
+# Ollama client
+OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+# Comma-separated Ollama hosts to spread calls over; defaults to OLLAMA_BASE_URL
+OLLAMA_HOSTS = [host.strip() for host in os.getenv('OLLAMA_HOSTS', '').split(',') if host.strip()]
+OLLAMA_HEALTH_CHECK_INTERVAL = float(os.getenv('OLLAMA_HEALTH_CHECK_INTERVAL', 15))  # Seconds between host polls
+OLLAMA_AFFINITY_PENALTY = int(os.getenv('OLLAMA_AFFINITY_PENALTY', 4))  # Extra calls charged to hosts without the model loaded
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv('OLLAMA_CONNECT_TIMEOUT', 5))
+OLLAMA_READ_TIMEOUT = float(os.getenv('OLLAMA_READ_TIMEOUT', 300))
+OLLAMA_MAX_RETRIES = int(os.getenv('OLLAMA_MAX_RETRIES', 2))
+OLLAMA_RETRY_BACKOFF = float(os.getenv('OLLAMA_RETRY_BACKOFF', 0.5))  # Base delay in seconds, jittered
+OLLAMA_POOL_SIZE = int(os.getenv('OLLAMA_POOL_SIZE', 10))
+OLLAMA_ASYNC_POOL_SIZE = int(os.getenv('OLLAMA_ASYNC_POOL_SIZE', 200))  # Connections for the async views
+OLLAMA_BREAKER_FAILURES = int(os.getenv('OLLAMA_BREAKER_FAILURES', 5))
+OLLAMA_BREAKER_RESET_SECONDS = float(os.getenv('OLLAMA_BREAKER_RESET_SECONDS', 30))
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')  # Keeps the model and its prompt cache loaded
+
+# Ollama model per operation, e.g. a smaller, faster model for analysis
+OLLAMA_ANALYSIS_MODEL = os.getenv('OLLAMA_ANALYSIS_MODEL', 'qwen2.5:32b')
+OLLAMA_GENERATION_MODEL = os.getenv('OLLAMA_GENERATION_MODEL', 'qwen2.5:32b')
+
+# Writing sample analysis cache
+ANALYSIS_CACHE_MEMORY_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MEMORY_ENTRIES', 256))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+ANALYSIS_CACHE_MAX_DB_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MAX_DB_ENTRIES', 10000))
+# Writes between eviction passes, each of which counts the table
+ANALYSIS_CACHE_EVICT_EVERY = int(os.getenv('ANALYSIS_CACHE_EVICT_EVERY', 100))
+
+# Long writing samples are split into chunks of this size and analyzed concurrently
+ANALYSIS_CHUNK_CHARS = int(os.getenv('ANALYSIS_CHUNK_CHARS', 12000))
+ANALYSIS_CHUNK_CONCURRENCY = int(os.getenv('ANALYSIS_CHUNK_CONCURRENCY', 4))
+
+# Default writing sample analysis mode: 'llm', 'hybrid' (stylometric traits
+# measured locally, the rest by the LLM) or 'fast' (local measurements only)
+ANALYSIS_MODE = os.getenv('ANALYSIS_MODE', 'hybrid')
+
+# How analysis output is constrained: 'schema' (JSON schema built from the
+# Persona fields, Ollama 0.5+), 'json' (any JSON object) or 'none'
+ANALYSIS_OUTPUT_FORMAT = os.getenv('ANALYSIS_OUTPUT_FORMAT', 'schema')
+
+# Persona system prompts: 'compact' (descriptors only, within a token
+# budget estimated at ~4 characters per token) or 'verbose' (every trait)
+PERSONA_PROMPT_ENCODING = os.getenv('PERSONA_PROMPT_ENCODING', 'compact')
+PERSONA_PROMPT_TOKEN_BUDGET = int(os.getenv('PERSONA_PROMPT_TOKEN_BUDGET', 200))
+
+# Generated content cache (uses the default Django cache)
+GENERATION_CACHE_TIMEOUT = int(os.getenv('GENERATION_CACHE_TIMEOUT', 3600))
+
+# Batch generation
+BATCH_GENERATION_CONCURRENCY = int(os.getenv('BATCH_GENERATION_CONCURRENCY', 4))
+BATCH_GENERATION_MAX_CONCURRENCY = int(os.getenv('BATCH_GENERATION_MAX_CONCURRENCY', 16))
+BATCH_GENERATION_MAX_ITEMS = int(os.getenv('BATCH_GENERATION_MAX_ITEMS', 500))
+# Larger batches are always queued as generation jobs instead of running in the request
+BATCH_GENERATION_SYNC_MAX_ITEMS = int(os.getenv('BATCH_GENERATION_SYNC_MAX_ITEMS', 10))
+
+# LLM scheduler: concurrency cap per Ollama host, and how many interactive calls may
+# wait (in total and per author) or for how long before getting a 429
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+LLM_QUEUE_LIMIT = int(os.getenv('LLM_QUEUE_LIMIT', 100))
+LLM_AUTHOR_QUEUE_LIMIT = int(os.getenv('LLM_AUTHOR_QUEUE_LIMIT', 20))
+LLM_QUEUE_TIMEOUT = int(os.getenv('LLM_QUEUE_TIMEOUT', 120))
+
+# LLM call archive
+LLM_ARCHIVE_ENABLED = os.getenv('LLM_ARCHIVE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+LLM_ARCHIVE_QUEUE_SIZE = int(os.getenv('LLM_ARCHIVE_QUEUE_SIZE', 1000))
+LLM_ARCHIVE_BATCH_SIZE = int(os.getenv('LLM_ARCHIVE_BATCH_SIZE', 50))
+LLM_ARCHIVE_RETENTION_DAYS = int(os.getenv('LLM_ARCHIVE_RETENTION_DAYS', 30))
+
+# Prometheus /metrics endpoint; set a token to require "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Persona similarity search; loaded trait indexes are rebuilt after this many seconds
+SIMILARITY_INDEX_TTL = int(os.getenv('SIMILARITY_INDEX_TTL', 300))
+
+# Semantic content search: Ollama embedding model, and the cosine similarity
+# at or above which generate-content's check_similar reports a near-duplicate
+OLLAMA_EMBED_MODEL = os.getenv('OLLAMA_EMBED_MODEL', 'nomic-embed-text')
+SEMANTIC_DUPLICATE_THRESHOLD = float(os.getenv('SEMANTIC_DUPLICATE_THRESHOLD', 0.85))
+SEMANTIC_INDEX_TTL = int(os.getenv('SEMANTIC_INDEX_TTL', 300))
+# A piece whose embedding failed is retried on index rebuilds after this
+# delay, doubling per failure up to the maximum
+SEMANTIC_EMBED_RETRY_SECONDS = int(os.getenv('SEMANTIC_EMBED_RETRY_SECONDS', 60))
+SEMANTIC_EMBED_RETRY_MAX_SECONDS = int(os.getenv('SEMANTIC_EMBED_RETRY_MAX_SECONDS', 3600))
+
+# Content pieces scoring below this (0-1) are listed by content/low-conformance/
+CONFORMANCE_THRESHOLD = float(os.getenv('CONFORMANCE_THRESHOLD', 0.7))
@@ -3,11 +3,12 @@
 
 from django.contrib import admin
 from django.urls import path, include
-from core.views import RegisterView  # Import the RegisterView
+from core.views import RegisterView, metrics_view  # Import the RegisterView and metrics endpoint
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),
     path('api/register/', RegisterView.as_view(), name='register'),
+    path('metrics', metrics_view, name='metrics'),
     
 ]  
\ No newline at end of file
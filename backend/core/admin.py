@@ -1,3 +1,15 @@
 from django.contrib import admin
 
+from .models import LLMCall
+
 # Register your models here.
+
+
+@admin.register(LLMCall)
+class LLMCallAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'operation', 'model', 'persona', 'success',
+                    'prompt_eval_count', 'eval_count', 'total_duration']
+    list_filter = ['operation', 'model', 'success']
+    search_fields = ['prompt', 'response', 'error']
+    date_hierarchy = 'created_at'
+    raw_id_fields = ['persona']
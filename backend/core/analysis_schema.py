@@ -0,0 +1,210 @@
+# core/analysis_schema.py
+
+import json
+import logging
+import math
+import re
+from functools import lru_cache
+
+from django.db import models
+
+from .metrics import registry
+from .models import Persona
+
+logger = logging.getLogger(__name__)
+
+# '[1-10]' in a trait hint gives the integer range
+RANGE_HINT_RE = re.compile(r'\[(\d+)-(\d+)\]')
+# '"[simple/complex/varied]"' gives a closed set of choices; hints with
+# 'etc.' or free-text placeholders stay open strings
+CHOICES_HINT_RE = re.compile(r'^"\[([a-z-]+(?:/[a-z-]+)+)\]"$')
+TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+LEADING_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+analysis_repairs = registry.counter(
+    'llm_analysis_repairs_total', 'Analysis responses that were not valid JSON and went through local repair.',
+    ['outcome'])
+
+
+@lru_cache(maxsize=32)
+def analysis_schema(traits):
+    """
+    Builds the JSON schema for an analysis response from the Persona fields.
+
+    Integer columns become integers limited to the range in their hint,
+    text columns become strings limited to the column's max_length, and
+    hints listing fixed options without 'etc.' become enums. Passed to
+    Ollama as 'format' so the model can only produce a matching object.
+
+    Parameters:
+    - traits (tuple[tuple[str, str]]): (field, hint) pairs, as in utils.ANALYSIS_TRAITS.
+
+    Returns:
+    - dict: The JSON schema.
+    """
+    properties = {}
+    for name, hint in traits:
+        field = Persona._meta.get_field(name)
+        if isinstance(field, models.IntegerField):
+            prop = {'type': 'integer'}
+            match = RANGE_HINT_RE.search(hint)
+            if match:
+                prop['minimum'], prop['maximum'] = int(match.group(1)), int(match.group(2))
+        else:
+            prop = {'type': 'string'}
+            if field.max_length:
+                prop['maxLength'] = field.max_length
+            match = CHOICES_HINT_RE.match(hint)
+            if match:
+                prop['enum'] = match.group(1).split('/')
+        properties[name] = prop
+    return {'type': 'object', 'properties': properties, 'required': [name for name, _ in traits]}
+
+
+def coerce_analysis(data, schema):
+    """
+    Coerces analysis output to the schema's types and ranges.
+
+    Numbers given as strings ('7', '7/10', '7.5') are parsed, rounded and
+    clamped; lists are joined and long strings truncated to fit their
+    column; enum values are matched case-insensitively, and values outside
+    the enum are kept as free text, which the column accepts. Values that
+    cannot be coerced, and keys not in the schema, are dropped.
+
+    Parameters:
+    - data (dict): Decoded model output.
+    - schema (dict): Schema from analysis_schema().
+
+    Returns:
+    - dict: The coerced values.
+    """
+    coerced = {}
+    for name, prop in schema['properties'].items():
+        value = data.get(name)
+        if value is None:
+            continue
+        if prop['type'] == 'integer':
+            value = _coerce_integer(value, prop)
+        else:
+            value = _coerce_string(value, prop)
+        if value is not None:
+            coerced[name] = value
+    return coerced
+
+
+def _coerce_integer(value, prop):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        match = LEADING_NUMBER_RE.search(value)
+        if match is None:
+            return None
+        value = match.group()
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(value):
+        return None
+    value = int(round(value))
+    return min(max(value, prop.get('minimum', value)), prop.get('maximum', value))
+
+
+def _coerce_string(value, prop):
+    if isinstance(value, (list, tuple)):
+        value = ', '.join(str(item) for item in value if item not in (None, ''))
+    elif isinstance(value, dict):
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    for choice in prop.get('enum', ()):
+        if value.lower() == choice:
+            return choice
+    return value[:prop['maxLength']] if 'maxLength' in prop else value
+
+
+def repair_json(text):
+    """
+    Recovers a JSON object from imperfect model output without another LLM call.
+
+    Handles text or code fences around the object, trailing commas, and
+    output cut off mid-object, in which case the incomplete last member is
+    dropped.
+
+    Parameters:
+    - text (str): The raw model output.
+
+    Returns:
+    - dict: The recovered object, or None if nothing could be recovered.
+    """
+    start = text.find('{')
+    if start < 0:
+        return None
+    text = text[start:]
+    for candidate in (text, TRAILING_COMMA_RE.sub(r'\1', text)):
+        data = _decode_object(candidate)
+        if data is not None:
+            return data
+
+    # Cut off: close what is open, or fall back to the last complete member
+    text = TRAILING_COMMA_RE.sub(r'\1', text)
+    stack, in_string, escaped, boundaries = [], False, False, []
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if stack:
+                stack.pop()
+        elif char == ',' and len(stack) == 1:
+            boundaries.append(index)
+
+    closed = text + ('"' if in_string else '') + ''.join(reversed(stack))
+    data = _decode_object(TRAILING_COMMA_RE.sub(r'\1', closed))
+    if data is not None:
+        return data
+    for boundary in reversed(boundaries):
+        data = _decode_object(text[:boundary] + '}')
+        if data is not None:
+            return data
+    return None
+
+
+def _decode_object(text):
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_analysis(text, schema):
+    """
+    Decodes an analysis response, repairing it locally if needed, and coerces it to the schema.
+
+    Returns:
+    - dict: The coerced analysis, or None if no trait could be recovered.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, json.JSONDecodeError):
+        data = repair_json(text or '')
+        analysis_repairs.inc(outcome='repaired' if data else 'failed')
+        if data:
+            logger.warning("Analysis response was not valid JSON; recovered it with a local repair")
+    if not isinstance(data, dict):
+        return None
+    analyzed_data = coerce_analysis(data, schema)
+    missing = len(schema['required']) - len(analyzed_data)
+    if missing:
+        logger.info(f"Analysis response is missing {missing} of {len(schema['required'])} traits")
+    return analyzed_data or None
@@ -1,6 +1,41 @@
 # core/apps.py
 
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+# WSGI/ASGI servers whose processes pick up queued LLM work
+SERVER_PROGRAMS = ('gunicorn', 'uvicorn', 'daphne', 'hypercorn')
+
+
+def _is_server_process():
+    """
+    True when this process serves requests: one of SERVER_PROGRAMS, or the
+    reloaded child of runserver. Anything else (migrate, shell, test,
+    pytest, scripts, ...) must not pick up queued LLM work; servers not
+    listed here can opt in with LLM_RUN_WORKERS.
+    """
+    if not sys.argv:
+        return False
+    program = os.path.basename(sys.argv[0])
+    if program == '__main__.py':
+        # python -m uvicorn
+        program = os.path.basename(os.path.dirname(sys.argv[0]))
+    if program in SERVER_PROGRAMS:
+        return True
+    if program in ('manage.py', 'django-admin') and sys.argv[1:2] == ['runserver']:
+        return '--noreload' in sys.argv or os.environ.get('RUN_MAIN') == 'true'
+    return False
+
+
+def _runs_workers():
+    if settings.LLM_RUN_WORKERS is not None:
+        return settings.LLM_RUN_WORKERS
+    return settings.LLM_RESUME_JOBS_ON_STARTUP and _is_server_process()
+
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -8,3 +43,7 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         import core.signals  # Ensure signals are imported
+
+        if _runs_workers():
+            from core import jobs
+            jobs.start_workers()
@@ -0,0 +1,125 @@
+# core/archive.py
+
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+from django.utils import timezone
+
+from .models import LLMCall
+
+logger = logging.getLogger(__name__)
+
+TIMING_FIELDS = (
+    'total_duration', 'load_duration', 'prompt_eval_count',
+    'prompt_eval_duration', 'eval_count', 'eval_duration',
+)
+
+_queue = queue.Queue(maxsize=settings.LLM_ARCHIVE_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+_dropped = 0
+
+
+def record(operation, payload, response=None, error=None, persona_id=None):
+    """
+    Queues an LLM call for the archive without blocking the caller.
+
+    When the queue is full the record is dropped and counted rather than
+    slowing down the request path.
+
+    Parameters:
+    - operation (str): What the call was for, e.g. 'analysis' or 'generation'.
+    - payload (dict): The request sent to Ollama.
+    - response (dict): The decoded Ollama response, or the final stream chunk
+      with 'response' holding the full text.
+    - error (str): Error message if the call failed.
+    - persona_id (int): Persona the call was made for, if any.
+    """
+    global _dropped
+    if not settings.LLM_ARCHIVE_ENABLED:
+        return
+
+    response = response or {}
+    entry = LLMCall(
+        operation=operation,
+        model=payload.get('model', ''),
+        persona_id=persona_id,
+        system=payload.get('system'),
+        prompt=payload.get('prompt', ''),
+        response=response.get('response'),
+        success=error is None,
+        error=error,
+        created_at=timezone.now(),
+        **{field: response.get(field) for field in TIMING_FIELDS},
+    )
+    _ensure_writer()
+    try:
+        _queue.put_nowait(entry)
+    except queue.Full:
+        _dropped += 1
+        logger.warning(f"LLM call archive queue full; dropped {_dropped} record(s) so far")
+
+
+def flush(timeout=5.0):
+    """Waits until every queued record has been written (used by tests and benchmarks)."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_drain, name='llm-archive-writer', daemon=True)
+            _writer.start()
+
+
+def _drain():
+    last_prune = 0.0
+    while True:
+        batch = [_queue.get()]
+        while len(batch) < settings.LLM_ARCHIVE_BATCH_SIZE:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write(batch)
+            if time.monotonic() - last_prune > 3600:
+                last_prune = time.monotonic()
+                _prune()
+        except Exception:
+            logger.exception(f"Failed to write {len(batch)} LLM call record(s)")
+        finally:
+            close_old_connections()
+            for _ in batch:
+                _queue.task_done()
+
+
+def _write(batch):
+    try:
+        LLMCall.objects.bulk_create(batch)
+    except IntegrityError:
+        # A persona was deleted while its calls were queued; keep the calls
+        # and drop only the link, row by row so one row cannot fail the rest
+        for entry in batch:
+            try:
+                LLMCall.objects.bulk_create([entry])
+            except IntegrityError:
+                entry.persona_id = None
+                LLMCall.objects.bulk_create([entry])
+
+
+def _prune():
+    cutoff = timezone.now() - timedelta(days=settings.LLM_ARCHIVE_RETENTION_DAYS)
+    deleted, _ = LLMCall.objects.filter(created_at__lt=cutoff).delete()
+    if deleted:
+        logger.info(f"Pruned {deleted} archived LLM call(s) older than {settings.LLM_ARCHIVE_RETENTION_DAYS} days")
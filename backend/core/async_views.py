@@ -0,0 +1,178 @@
+# core/async_views.py
+
+import json
+import logging
+from functools import wraps
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import ContentPiece, Persona
+from .ollama import OllamaUnavailable, get_client
+from .scheduler import LLMBusy, scheduler, context as scheduler_context
+from .serializers import ContentPieceSerializer, PersonaSerializer
+from .utils import ANALYSIS_MODES, aanalyze_writing_sample, agenerate_content, astream_content, split_content
+
+logger = logging.getLogger(__name__)
+
+# Async versions of the LLM endpoints for ASGI deployments. DRF views are
+# synchronous, so these are plain Django async views that reuse DRF's
+# authenticators, serializers and exceptions; while waiting on Ollama they
+# hold no thread, so one process can keep hundreds of generations in flight.
+
+
+def _authenticate(request):
+    """Runs the configured DRF authenticators (JWT) and returns the user."""
+    drf_request = Request(
+        request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    user = drf_request.user
+    if not user or not user.is_authenticated:
+        raise NotAuthenticated()
+    # Load the author here so async code never triggers a lazy query
+    user.author
+    return user
+
+
+def async_api_view(view):
+    """
+    Gives an async view the parts of DRF the sync API relies on: authentication,
+    request.data and request.query_params, and APIExceptions rendered as JSON.
+    """
+    @csrf_exempt
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            request.user = await sync_to_async(_authenticate)(request)
+            # Serializers read DRF's name for the query string
+            request.query_params = request.GET
+            try:
+                request.data = json.loads(request.body or b'{}')
+            except json.JSONDecodeError:
+                return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+            with scheduler_context(request.user.author.id):
+                return await view(request, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+            response = JsonResponse(detail, status=exc.status_code, safe=False)
+            if getattr(exc, 'wait', None):
+                response['Retry-After'] = str(int(exc.wait))
+            return response
+    return wrapper
+
+
+async def _get_persona(request, pk):
+    persona = await Persona.objects.filter(author=request.user.author, pk=pk).afirst()
+    if persona is None:
+        raise NotFound()
+    return persona
+
+
+async def _create_content_piece(author, persona, generated_content):
+    title, content = split_content(generated_content)
+    content_piece = await ContentPiece.objects.acreate(
+        author=author,
+        persona=persona,
+        title=title or 'Untitled',
+        content=content or '',
+        status='draft'
+    )
+    data = await sync_to_async(lambda: ContentPieceSerializer(content_piece).data)()
+    return content_piece, data
+
+
+@require_POST
+@async_api_view
+async def create_persona(request):
+    """
+    Creates a persona from a writing sample, analyzing it without blocking a thread.
+    Accepts the same fields as POST /api/personas/.
+    """
+    data = dict(request.data)
+    writing_sample = data.pop('writing_sample', None)
+    analysis_mode = data.pop('analysis_mode', None)
+    if analysis_mode is not None and analysis_mode not in ANALYSIS_MODES:
+        return JsonResponse({'analysis_mode': [f'"{analysis_mode}" is not a valid choice.']}, status=400)
+
+    serializer = PersonaSerializer(data=data, context={'request': request})
+    await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+    fields = {}
+    if writing_sample:
+        analyzed_data = await aanalyze_writing_sample(writing_sample, mode=analysis_mode)
+        if not analyzed_data:
+            logger.error("Failed to analyze writing sample.")
+            return JsonResponse({'writing_sample': 'Failed to analyze the writing sample.'}, status=400)
+        fields = Persona.fields_from_analysis(analyzed_data)
+
+    def save():
+        serializer.save(**fields)
+        return serializer.data
+
+    return JsonResponse(await sync_to_async(save)(), status=201)
+
+
+@require_POST
+@async_api_view
+async def generate_content(request, pk):
+    """Async version of POST /api/personas/<pk>/generate-content/."""
+    persona = await _get_persona(request, pk)
+    prompt = request.data.get('prompt')
+    if not prompt:
+        return JsonResponse({'error': 'Prompt is required'}, status=400)
+    fresh = str(request.data.get('fresh', False)).lower() in ('1', 'true', 'yes')
+
+    generated_content = await agenerate_content(persona, prompt, fresh=fresh)
+    if not generated_content:
+        return JsonResponse({'error': 'Failed to generate content'}, status=500)
+
+    _, data = await _create_content_piece(request.user.author, persona, generated_content)
+    return JsonResponse(data, status=201)
+
+
+@require_POST
+@async_api_view
+async def generate_content_stream(request, pk):
+    """
+    Async version of POST /api/personas/<pk>/generate-content-stream/, with
+    the same NDJSON token/done/error events.
+    """
+    persona = await _get_persona(request, pk)
+    prompt = request.data.get('prompt')
+    if not prompt:
+        return JsonResponse({'error': 'Prompt is required'}, status=400)
+
+    author = request.user.author
+    # Report an open circuit or a full queue (503/429) before the streaming response starts
+    get_client().check_available()
+    scheduler.check_admission(author.id, 'interactive')
+
+    async def events():
+        fragments = []
+        try:
+            with scheduler_context(author.id):
+                async for token in astream_content(persona, prompt):
+                    fragments.append(token)
+                    yield json.dumps({'event': 'token', 'token': token}) + '\n'
+        except (httpx.HTTPError, OllamaUnavailable, LLMBusy):
+            yield json.dumps({'event': 'error', 'error': 'Failed to generate content'}) + '\n'
+            return
+
+        generated_content = ''.join(fragments).strip()
+        if not generated_content:
+            yield json.dumps({'event': 'error', 'error': 'Failed to generate content'}) + '\n'
+            return
+
+        content_piece, data = await _create_content_piece(author, persona, generated_content)
+        yield json.dumps({'event': 'done', 'id': content_piece.id, 'content_piece': data}) + '\n'
+
+    response = StreamingHttpResponse(events(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,77 @@
+# core/batch.py
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from . import embeddings
+from .models import ContentPiece
+from .scheduler import context as scheduler_context
+from .utils import generate_content, split_content
+
+logger = logging.getLogger(__name__)
+
+
+def generate_batch(author, personas, prompts, concurrency=4, fresh=False):
+    """
+    Generates one piece per (persona, prompt) pair with concurrent fan-out.
+
+    Ollama calls run on up to `concurrency` threads; the successful pieces are
+    then written with a single bulk_create. A failed item never affects the
+    others.
+
+    Parameters:
+    - author (Author): Owner of the generated pieces.
+    - personas (list[Persona]): Personas to write as.
+    - prompts (list[str]): Prompts to write about.
+    - concurrency (int): Maximum number of simultaneous Ollama requests.
+    - fresh (bool): Skip the generation cache.
+
+    Returns:
+    - list[dict]: Per-item results in request order, each with 'persona',
+      'prompt', 'status' ('created' or 'failed') and 'content_piece' or 'error'.
+    """
+    items = [(persona, prompt) for persona in personas for prompt in prompts]
+
+    def run(item):
+        persona, prompt = item
+        try:
+            # Batch items yield to interactive requests in the scheduler
+            with scheduler_context(author.pk, 'batch'):
+                return generate_content(persona, prompt, fresh=fresh), None
+        except Exception as e:
+            logger.exception(f"Batch item for persona {persona.pk} failed")
+            return '', str(e)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='llm-batch') as executor:
+        outputs = list(executor.map(run, items))
+
+    results = []
+    pieces = []
+    for (persona, prompt), (generated_content, error) in zip(items, outputs):
+        result = {'persona': persona.pk, 'prompt': prompt}
+        if generated_content:
+            title, content = split_content(generated_content)
+            content = content or ''
+            pieces.append(ContentPiece(
+                author=author,
+                persona=persona,
+                title=title or 'Untitled',
+                content=content,
+                status='draft',
+                # bulk_create skips ContentPiece.save(), which normally sets this
+                word_count=len(content.split()),
+            ))
+            result['status'] = 'created'
+        else:
+            result['status'] = 'failed'
+            result['error'] = error or 'Failed to generate content'
+        results.append(result)
+
+    created_pieces = ContentPiece.objects.bulk_create(pieces)
+    # bulk_create sends no post_save, so queue the embeddings here
+    embeddings.schedule(piece.pk for piece in created_pieces)
+    created = iter(created_pieces)
+    for result in results:
+        if result['status'] == 'created':
+            result['content_piece'] = next(created).pk
+    return results
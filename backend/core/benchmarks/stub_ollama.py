@@ -0,0 +1,197 @@
+# core/benchmarks/stub_ollama.py
+
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from django.conf import settings
+
+DEFAULT_GENERATION_TEXT = (
+    "Title: A Day at the Hardware Store\n"
+    "I finally picked up the drill I had been eyeing for weeks. It is light, it is quick, "
+    "and it makes the small repairs around the house feel a lot less like chores. "
+    "Next up is a proper set of bits and maybe a stud finder."
+)
+
+
+def load_recorded_response(path=None):
+    """
+    Loads a recorded Ollama /api/generate response, by default the
+    generated_text.md capture in the backend directory.
+    """
+    path = Path(path) if path else Path(settings.BASE_DIR) / 'generated_text.md'
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {
+            'model': 'qwen2.5:32b',
+            'response': json.dumps({'name': 'Anonymous', 'tone': 'informal', 'vocabulary_complexity': 3}),
+            'done': True,
+        }
+
+
+class StubOllamaServer:
+    """
+    Local HTTP server that mimics the parts of the Ollama API this app uses.
+
+    Analysis prompts are answered with the recorded response and everything
+    else with canned generation text. Each call waits `latency` seconds (time
+    to first token). Output is then emitted at `tokens_per_second`, where 0
+    means instantly, as one body or as a stream of NDJSON chunks.
+    """
+
+    def __init__(self, latency=0.0, tokens_per_second=0, recorded_response=None, generation_text=None,
+                 host='127.0.0.1', port=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.recorded_response = recorded_response or load_recorded_response()
+        self.generation_text = generation_text or DEFAULT_GENERATION_TEXT
+        self.requests_served = 0
+        self.models_loaded = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-ollama', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def available_models(self):
+        """Every model the app is configured to use, as if all had been pulled."""
+        return sorted({
+            self.recorded_response.get('model', 'qwen2.5:32b'),
+            settings.OLLAMA_ANALYSIS_MODEL,
+            settings.OLLAMA_GENERATION_MODEL,
+            settings.OLLAMA_EMBED_MODEL,
+        })
+
+    def response_text(self, payload):
+        if 'Writing Sample:' in payload.get('prompt', ''):
+            return self.recorded_response.get('response', '')
+        return self.generation_text
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._send_json(stub._models_response(stub.available_models()))
+                elif self.path == '/api/ps':
+                    with stub._lock:
+                        loaded = sorted(stub.models_loaded)
+                    self._send_json(stub._models_response(loaded))
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                with stub._lock:
+                    stub.requests_served += 1
+                    if payload.get('model'):
+                        stub.models_loaded.add(payload['model'])
+                if self.path == '/api/embed':
+                    self._send_json(stub._embed_response(payload))
+                    return
+                if self.path != '/api/generate':
+                    self.send_error(404)
+                    return
+
+                time.sleep(stub.latency)
+                tokens = stub.response_text(payload).split(' ')
+                tokens = [token + ' ' for token in tokens[:-1]] + tokens[-1:]
+                if payload.get('stream', True):
+                    self._stream(payload, tokens)
+                else:
+                    if stub.tokens_per_second:
+                        time.sleep(len(tokens) / stub.tokens_per_second)
+                    self._send_json(stub._final_chunk(payload, ''.join(tokens), len(tokens)))
+
+            def _stream(self, payload, tokens):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for token in tokens:
+                    if stub.tokens_per_second:
+                        time.sleep(1 / stub.tokens_per_second)
+                    self._write_chunk({'model': payload.get('model'), 'response': token, 'done': False})
+                self._write_chunk(stub._final_chunk(payload, '', len(tokens)))
+                self.wfile.write(b'0\r\n\r\n')
+
+            def _write_chunk(self, data):
+                body = json.dumps(data).encode() + b'\n'
+                self.wfile.write(f"{len(body):x}\r\n".encode() + body + b'\r\n')
+                self.wfile.flush()
+
+            def _send_json(self, data):
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def _models_response(self, models):
+        return {'models': [{'name': model, 'model': model} for model in models]}
+
+    def _embed_response(self, payload):
+        """Deterministic pseudo-embeddings: the same text always maps to the same vector."""
+        inputs = payload.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        vectors = []
+        for text in inputs:
+            digest = hashlib.sha256(text.encode('utf-8')).digest()
+            vectors.append([(byte - 127.5) / 127.5 for byte in digest * 24])
+        return {
+            'model': payload.get('model'),
+            'embeddings': vectors,
+            'total_duration': int(self.latency * 1e9),
+            'load_duration': 0,
+            'prompt_eval_count': sum(len(text.split()) for text in inputs),
+        }
+
+    def _final_chunk(self, payload, text, token_count):
+        eval_seconds = token_count / self.tokens_per_second if self.tokens_per_second else 0.0
+        prompt_tokens = len((payload.get('system') or '').split()) + len(payload.get('prompt', '').split())
+        return {
+            'model': payload.get('model'),
+            'response': text,
+            'done': True,
+            'done_reason': 'stop',
+            'total_duration': int((self.latency + eval_seconds) * 1e9),
+            'load_duration': 0,
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': int(self.latency * 1e9),
+            'eval_count': token_count,
+            'eval_duration': int(eval_seconds * 1e9),
+        }
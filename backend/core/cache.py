@@ -0,0 +1,355 @@
+# core/cache.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+import weakref
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import registry
+from .models import AnalysisCacheEntry
+from .scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_sample(text):
+    """
+    Normalizes unicode and whitespace so trivially different uploads share a key.
+
+    Runs of spaces and tabs within a line collapse to one space, but blank
+    lines between paragraphs are kept, since paragraphing is part of the
+    style the analysis describes.
+    """
+    lines = (' '.join(line.split()) for line in unicodedata.normalize('NFC', text).splitlines())
+    paragraphs, current = [], []
+    for line in lines:
+        if line:
+            current.append(line)
+        elif current:
+            paragraphs.append('\n'.join(current))
+            current = []
+    if current:
+        paragraphs.append('\n'.join(current))
+    return '\n\n'.join(paragraphs)
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for writing sample analysis results.
+
+    Entries are keyed by a SHA-256 of (normalized sample, model, prompt version).
+    The first tier is an in-process LRU; the second is the AnalysisCacheEntry
+    table, which survives restarts and is shared between workers. Database
+    entries expire after ttl_seconds and the least recently used rows are
+    evicted once the table grows past max_db_entries. Eviction runs every
+    evict_every writes rather than on each one, so the table can briefly
+    hold up to evict_every rows over the limit.
+    """
+
+    def __init__(self, max_memory_entries=256, ttl_seconds=30 * 24 * 3600, max_db_entries=10000,
+                 evict_every=100):
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_db_entries = max_db_entries
+        self.evict_every = max(evict_every, 1)
+        self._writes_since_evict = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    @staticmethod
+    def make_key(writing_sample, model, prompt_version, variant=''):
+        parts = [normalize_sample(writing_sample), model, str(prompt_version)]
+        if variant:
+            # e.g. the narrowed trait set of a hybrid analysis
+            parts.append(variant)
+        material = '\0'.join(parts)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                result, stored_at = entry
+                if now - stored_at < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return dict(result)
+                del self._memory[key]
+
+        expires_before = timezone.now() - timedelta(seconds=self.ttl_seconds)
+        row = AnalysisCacheEntry.objects.filter(key=key, created_at__gte=expires_before).first()
+        if row is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        AnalysisCacheEntry.objects.filter(key=key).update(hits=F('hits') + 1, last_used_at=timezone.now())
+        with self._lock:
+            self._stats['db_hits'] += 1
+            self._remember(key, row.result, row.created_at.timestamp())
+        return dict(row.result)
+
+    def set(self, key, model, prompt_version, result):
+        AnalysisCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={'model': model, 'prompt_version': prompt_version, 'result': result,
+                      'created_at': timezone.now(), 'last_used_at': timezone.now()},
+        )
+        with self._lock:
+            self._remember(key, result, time.time())
+            self._writes_since_evict += 1
+            evict = self._writes_since_evict >= self.evict_every
+            if evict:
+                self._writes_since_evict = 0
+        if evict:
+            self._evict()
+
+    def get_or_compute(self, writing_sample, model, prompt_version, compute, variant=''):
+        """
+        Returns the cached analysis for the sample, or runs compute(writing_sample)
+        and caches its result. Failed analyses (None) are not cached.
+        """
+        key = self.make_key(writing_sample, model, prompt_version, variant)
+        result = self.get(key)
+        if result is not None:
+            logger.info(f"Analysis cache hit for {key[:12]} (hit rate {self.stats()['hit_rate']:.2%})")
+            return result
+
+        result = compute(writing_sample)
+        if result is not None:
+            self.set(key, model, prompt_version, result)
+        return result
+
+    def get_or_compute_many(self, writing_samples, model, prompt_version, compute_many, variant=''):
+        """
+        Batch form of get_or_compute. compute_many receives only the samples
+        that missed and must return their results in the same order. Cache
+        reads and writes happen on the calling thread.
+        """
+        keys = [self.make_key(sample, model, prompt_version, variant) for sample in writing_samples]
+        results = [self.get(key) for key in keys]
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing:
+            computed = compute_many([writing_samples[index] for index in missing])
+            for index, result in zip(missing, computed):
+                results[index] = result
+                if result is not None:
+                    self.set(keys[index], model, prompt_version, result)
+        return results
+
+    async def aget_or_compute(self, writing_sample, model, prompt_version, compute, variant=''):
+        """Async form of get_or_compute; compute is a coroutine function."""
+        results = await self.aget_or_compute_many(
+            [writing_sample], model, prompt_version,
+            lambda samples: asyncio.gather(compute(samples[0])), variant=variant,
+        )
+        return results[0]
+
+    async def aget_or_compute_many(self, writing_samples, model, prompt_version, compute_many, variant=''):
+        """
+        Async form of get_or_compute_many; compute_many is a coroutine function.
+        Cache reads and writes run in a worker thread since they touch the DB.
+        """
+        keys = [self.make_key(sample, model, prompt_version, variant) for sample in writing_samples]
+        results = await sync_to_async(lambda: [self.get(key) for key in keys])()
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing:
+            computed = await compute_many([writing_samples[index] for index in missing])
+
+            def store():
+                for index, result in zip(missing, computed):
+                    results[index] = result
+                    if result is not None:
+                        self.set(keys[index], model, prompt_version, result)
+
+            await sync_to_async(store)()
+        return results
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, memory_entries=len(self._memory))
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['db_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def _remember(self, key, result, stored_at):
+        self._memory[key] = (result, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        expires_before = timezone.now() - timedelta(seconds=self.ttl_seconds)
+        AnalysisCacheEntry.objects.filter(created_at__lt=expires_before).delete()
+        overflow = AnalysisCacheEntry.objects.count() - self.max_db_entries
+        if overflow > 0:
+            stale_keys = list(
+                AnalysisCacheEntry.objects.order_by('last_used_at').values_list('key', flat=True)[:overflow]
+            )
+            AnalysisCacheEntry.objects.filter(key__in=stale_keys).delete()
+
+
+generation_cache_requests = registry.counter(
+    'generation_cache_requests_total', 'Generation cache lookups by result.', ['result'])
+
+
+class _InFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GenerationCache:
+    """
+    Caches generated text in Django's cache and coalesces concurrent duplicates.
+
+    Keys cover the persona id and updated_at, a hash of the full payload (the
+    persona's trait snapshot, the user's prompt, the model and any options).
+    While one request for a key is running, identical requests in the same
+    process wait for its result instead of calling Ollama again. Interactive
+    callers wait no longer than the scheduler's queue timeout, as they would
+    for a slot, and then get LLMBusy.
+    """
+
+    def __init__(self, timeout=3600):
+        self.timeout = timeout
+        self._inflight = {}
+        self._lock = threading.Lock()
+        # Per event loop: key -> task, for aget_or_generate
+        self._async_inflight = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def make_key(persona_id, persona_updated_at, payload):
+        payload_hash = hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+        updated = persona_updated_at.isoformat() if persona_updated_at else ''
+        return f"generation:{persona_id}:{updated}:{payload_hash}"
+
+    def get_or_generate(self, key, compute, fresh=False):
+        """
+        Returns cached output for key, or runs compute() once for all concurrent
+        callers. With fresh=True the cache and in-flight calls are bypassed,
+        but the new output still replaces the cached value. Empty output is
+        never cached.
+        """
+        if fresh:
+            result = compute()
+            if result:
+                cache.set(key, result, self.timeout)
+            return result
+
+        result = cache.get(key)
+        if result is not None:
+            logger.info(f"Generation cache hit for {key}")
+            generation_cache_requests.inc(result='hit')
+            return result
+
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _InFlight()
+
+        generation_cache_requests.inc(result='miss' if leader else 'coalesced')
+        if not leader:
+            logger.info(f"Joining in-flight generation for {key}")
+            if not call.event.wait(scheduler.wait_timeout()):
+                raise scheduler.busy()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = compute()
+            if call.result:
+                cache.set(key, call.result, self.timeout)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+
+    async def aget_or_generate(self, key, compute, fresh=False):
+        """
+        Async form of get_or_generate; compute is a coroutine function.
+        Concurrent duplicates on the same event loop await one shared task,
+        which keeps running if the request that started it is cancelled.
+        """
+        async def run():
+            result = await compute()
+            if result:
+                await cache.aset(key, result, self.timeout)
+            return result
+
+        if fresh:
+            return await run()
+
+        result = await cache.aget(key)
+        if result is not None:
+            logger.info(f"Generation cache hit for {key}")
+            generation_cache_requests.inc(result='hit')
+            return result
+
+        inflight = self._async_inflight.setdefault(asyncio.get_running_loop(), {})
+        task = inflight.get(key)
+        leader = task is None
+        if leader:
+            task = inflight[key] = asyncio.ensure_future(run())
+            task.add_done_callback(lambda _: inflight.pop(key, None))
+        else:
+            logger.info(f"Joining in-flight generation for {key}")
+        generation_cache_requests.inc(result='miss' if leader else 'coalesced')
+        if leader:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), scheduler.wait_timeout())
+        except asyncio.TimeoutError:
+            raise scheduler.busy() from None
+
+
+analysis_cache = AnalysisCache(
+    max_memory_entries=settings.ANALYSIS_CACHE_MEMORY_ENTRIES,
+    ttl_seconds=settings.ANALYSIS_CACHE_TTL_SECONDS,
+    max_db_entries=settings.ANALYSIS_CACHE_MAX_DB_ENTRIES,
+    evict_every=settings.ANALYSIS_CACHE_EVICT_EVERY,
+)
+
+generation_cache = GenerationCache(timeout=settings.GENERATION_CACHE_TIMEOUT)
+
+
+def _analysis_cache_metrics():
+    stats = analysis_cache.stats()
+    return [
+        '# HELP analysis_cache_lookups_total Analysis cache lookups by result.',
+        '# TYPE analysis_cache_lookups_total counter',
+        f'analysis_cache_lookups_total{{result="memory_hit"}} {stats["memory_hits"]}',
+        f'analysis_cache_lookups_total{{result="db_hit"}} {stats["db_hits"]}',
+        f'analysis_cache_lookups_total{{result="miss"}} {stats["misses"]}',
+        '# HELP analysis_cache_memory_entries Entries held in the in-process analysis cache.',
+        '# TYPE analysis_cache_memory_entries gauge',
+        f'analysis_cache_memory_entries {stats["memory_entries"]}',
+    ]
+
+
+registry.add_collector(_analysis_cache_metrics)
@@ -0,0 +1,69 @@
+# core/conformance.py
+
+import numpy as np
+
+from .stylometry import MEASURED_TRAITS, analyze
+
+# Numeric traits compared on the 1-10 scale; word length preference is categorical
+SCORED_TRAITS = tuple(trait for trait in MEASURED_TRAITS if trait != 'word_length_preference')
+CATEGORICAL_TRAITS = ('word_length_preference',)
+
+# Kept free of model imports so score_batch can run in spawned worker processes
+
+
+def persona_targets(persona):
+    """Returns the persona's values for SCORED_TRAITS followed by CATEGORICAL_TRAITS."""
+    return tuple(getattr(persona, trait) for trait in SCORED_TRAITS + CATEGORICAL_TRAITS)
+
+
+def score_rows(rows):
+    """
+    Scores a batch of texts against their personas' traits.
+
+    Each text is measured with stylometry.analyze, then the whole batch is
+    compared to the persona values at once: every trait the persona has
+    contributes its distance on the 1-10 scale (normalized to 0-1), a
+    categorical mismatch counts as 1 (0.5 when either side is 'varied'),
+    and the score is one minus the mean distance.
+
+    Parameters:
+    - rows (list[tuple]): (text, targets) pairs, targets as from persona_targets.
+
+    Returns:
+    - list[float]: Scores in [0, 1], or None where the text has no words or
+      the persona has none of the traits.
+    """
+    count = len(rows)
+    numeric = len(SCORED_TRAITS)
+    measured = np.full((count, numeric), np.nan, dtype=np.float32)
+    target = np.full((count, numeric), np.nan, dtype=np.float32)
+    categorical = np.full((count, len(CATEGORICAL_TRAITS)), np.nan, dtype=np.float32)
+
+    for row, (text, targets) in enumerate(rows):
+        traits = analyze(text or '')
+        if not traits:
+            continue
+        measured[row] = [traits[trait] for trait in SCORED_TRAITS]
+        target[row] = [np.nan if value is None else value for value in targets[:numeric]]
+        for column, trait in enumerate(CATEGORICAL_TRAITS):
+            expected = targets[numeric + column]
+            if expected:
+                actual = traits[trait]
+                if expected == actual:
+                    categorical[row, column] = 0.0
+                else:
+                    categorical[row, column] = 0.5 if 'varied' in (expected, actual) else 1.0
+
+    distances = np.concatenate([np.abs(measured - target) / 9.0, categorical], axis=1)
+    present = ~np.isnan(distances)
+    counts = present.sum(axis=1)
+    totals = np.where(present, distances, 0.0).sum(axis=1)
+    scores = 1.0 - totals / np.maximum(counts, 1)
+    return [float(score) if has_traits else None for score, has_traits in zip(scores, counts > 0)]
+
+
+def score_batch(batch):
+    """
+    Process pool entry point: (pk, content, *targets) rows in, (ids, scores) out.
+    """
+    return [row[0] for row in batch], score_rows([(row[1], row[2:]) for row in batch])
@@ -0,0 +1,287 @@
+# core/embeddings.py
+
+import hashlib
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import jobs
+from .models import ContentEmbedding, ContentPiece
+from .scheduler import context as scheduler_context
+from .similarity import _top_k
+from .utils import EMBEDDING_MODEL, embed_texts
+
+logger = logging.getLogger(__name__)
+
+# Pieces embedded per Ollama request
+EMBED_BATCH_SIZE = 32
+
+
+def embedding_text(piece):
+    return f"{piece.title or ''}\n\n{piece.content or ''}".strip()
+
+
+def content_hash(text):
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\n{text}".encode('utf-8')).hexdigest()
+
+
+def unit_vector(vector):
+    """Returns the vector as L2-normalized float32."""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class EmbeddingIndex:
+    """
+    Packed float32 matrix of one author's normalized content embeddings.
+
+    Laid out like similarity.TraitIndex: rows in a preallocated array that
+    doubles when full, so a query is one matrix-vector product and single
+    updates do not copy the matrix.
+    """
+
+    def __init__(self, ids, matrix, dimensions):
+        self.size = len(ids)
+        self.dimensions = dimensions
+        capacity = max(16, self.size)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._matrix = np.zeros((capacity, dimensions), dtype=np.float32)
+        self._ids[:self.size] = ids
+        self._matrix[:self.size] = matrix
+        self._rows = {int(piece_id): row for row, piece_id in enumerate(ids)}
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls, author_id):
+        rows = list(
+            ContentEmbedding.objects.filter(author_id=author_id, model=EMBEDDING_MODEL)
+            .values_list('content_piece_id', 'dimensions', 'vector')
+        )
+        dimensions = rows[0][1] if rows else 0
+        rows = [row for row in rows if row[1] == dimensions]
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        matrix = np.frombuffer(b''.join(bytes(row[2]) for row in rows), dtype=np.float32)
+        return cls(ids, matrix.reshape(len(rows), dimensions), dimensions)
+
+    def upsert(self, piece_id, vector):
+        if self.dimensions == 0 and self.size == 0:
+            # First vector of an empty index fixes its width
+            self.dimensions = len(vector)
+            self._matrix = np.zeros((len(self._ids), self.dimensions), dtype=np.float32)
+        if len(vector) != self.dimensions:
+            return
+        row = self._rows.get(piece_id)
+        if row is None:
+            if self.size == len(self._ids):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self._ids[row] = piece_id
+            self._rows[piece_id] = row
+        self._matrix[row] = vector
+
+    def remove(self, piece_id):
+        row = self._rows.pop(piece_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            self._ids[row] = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._rows[int(self._ids[row])] = row
+        self._matrix[last] = 0.0
+        self.size -= 1
+
+    def search(self, query, k=10, min_score=None):
+        """
+        Returns up to k (content_piece_id, cosine similarity) pairs, best first.
+
+        Parameters:
+        - query (np.ndarray): A normalized query vector.
+        - k (int): Maximum number of matches.
+        - min_score (float): Drop matches below this similarity.
+        """
+        if self.size == 0 or len(query) != self.dimensions:
+            return []
+        scores = self._matrix[:self.size] @ query
+        order = _top_k(-scores, k)
+        return [
+            (int(self._ids[index]), float(scores[index])) for index in order
+            if min_score is None or scores[index] >= min_score
+        ]
+
+    def _grow(self):
+        capacity = len(self._ids) * 2
+        ids = np.zeros(capacity, dtype=np.int64)
+        matrix = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        ids[:self.size] = self._ids[:self.size]
+        matrix[:self.size] = self._matrix[:self.size]
+        self._ids, self._matrix = ids, matrix
+
+
+_indexes = {}
+# Author id -> index changes made while that author's index is rebuilt outside the lock
+_pending = {}
+# Content piece id -> (failed attempts, monotonic time before which it is not retried)
+_failures = {}
+_lock = threading.Lock()
+
+
+def _apply(author_id, change):
+    """Applies change(index) to the author's loaded index, and to one being rebuilt. Call with _lock held."""
+    index = _indexes.get(author_id)
+    if index is not None:
+        change(index)
+    if author_id in _pending:
+        _pending[author_id].append(change)
+
+
+def search(author_id, text, k=10, min_score=None):
+    """
+    Finds the author's content pieces closest in meaning to text.
+
+    The query is embedded synchronously through Ollama. The author's index
+    is loaded on first use, updated in place as embeddings are computed in
+    this process, and rebuilt after SEMANTIC_INDEX_TTL seconds. Rebuilds run
+    outside the module lock, so other authors' searches and embedding
+    updates are not held up; one request rebuilds while others keep using
+    the expired index. Pieces that have no embedding yet (e.g. created
+    before this index existed) are queued for embedding when the index is
+    built, except those still backing off after a failed attempt.
+
+    Returns:
+    - list[tuple]: (content_piece_id, cosine similarity) pairs, best first.
+    """
+    query = unit_vector(embed_texts([text])[0])
+    with _lock:
+        index = _indexes.get(author_id)
+        expired = index is None or time.monotonic() - index.built_at > settings.SEMANTIC_INDEX_TTL
+        rebuild = expired and author_id not in _pending
+        if rebuild:
+            _pending[author_id] = []
+
+    missing = None
+    if rebuild:
+        fresh = None
+        try:
+            fresh = EmbeddingIndex.build(author_id)
+            unembedded = list(
+                ContentPiece.objects.filter(author_id=author_id)
+                .exclude(embedding__model=EMBEDDING_MODEL)
+                .values_list('pk', flat=True)
+            )
+        finally:
+            with _lock:
+                changes = _pending.pop(author_id)
+                if fresh is not None:
+                    # Replay embeddings computed while the rows were being read
+                    for change in changes:
+                        change(fresh)
+                    index = _indexes[author_id] = fresh
+                    now = time.monotonic()
+                    missing = [pk for pk in unembedded if _failures.get(pk, (0, 0))[1] <= now]
+    elif index is None:
+        # Another request is building this author's first index
+        index = EmbeddingIndex.build(author_id)
+
+    with _lock:
+        matches = index.search(query, k=k, min_score=min_score)
+    if missing:
+        schedule(missing)
+    return matches
+
+
+def schedule(piece_ids):
+    """Queues content pieces for embedding on the worker pool."""
+    piece_ids = list(piece_ids)
+    for start in range(0, len(piece_ids), EMBED_BATCH_SIZE):
+        jobs.submit(compute_embeddings, piece_ids[start:start + EMBED_BATCH_SIZE])
+
+
+def compute_embeddings(piece_ids):
+    """
+    Embeds content pieces whose text changed since their last embedding.
+
+    Runs on the worker pool. Failures are logged and the pieces are picked
+    up again the next time they are saved, or when their author's index is
+    rebuilt after an exponential backoff.
+    """
+    close_old_connections()
+    try:
+        pieces = list(ContentPiece.objects.filter(pk__in=piece_ids).select_related('embedding'))
+        pending = []
+        for piece in pieces:
+            text = embedding_text(piece)
+            digest = content_hash(text)
+            existing = getattr(piece, 'embedding', None)
+            if existing is not None and existing.content_hash == digest:
+                continue
+            pending.append((piece, text, digest))
+        if not pending:
+            return
+
+        with scheduler_context(pending[0][0].author_id, 'batch'):
+            vectors = embed_texts([text for _, text, _ in pending])
+        for (piece, _, digest), vector in zip(pending, vectors):
+            vector = unit_vector(vector)
+            ContentEmbedding.objects.update_or_create(
+                content_piece=piece,
+                defaults={
+                    'author_id': piece.author_id,
+                    'model': EMBEDDING_MODEL,
+                    'dimensions': len(vector),
+                    'vector': vector.tobytes(),
+                    'content_hash': digest,
+                },
+            )
+            with _lock:
+                _failures.pop(piece.pk, None)
+                _apply(piece.author_id, lambda index, pk=piece.pk, vector=vector: index.upsert(pk, vector))
+    except Exception:
+        logger.exception(f"Embedding content pieces {piece_ids} failed")
+        _record_failure(piece_ids)
+    finally:
+        close_old_connections()
+
+
+def _record_failure(piece_ids):
+    now = time.monotonic()
+    with _lock:
+        for pk in piece_ids:
+            attempts = _failures.get(pk, (0, 0))[0] + 1
+            delay = min(settings.SEMANTIC_EMBED_RETRY_SECONDS * 2 ** (attempts - 1),
+                        settings.SEMANTIC_EMBED_RETRY_MAX_SECONDS)
+            _failures[pk] = (attempts, now + delay)
+
+
+def content_saved(piece, update_fields=None):
+    """Queues a saved piece for embedding if its text differs from the stored embedding's."""
+    if update_fields is not None and not {'title', 'content'} & set(update_fields):
+        return
+    digest = content_hash(embedding_text(piece))
+    if ContentEmbedding.objects.filter(content_piece_id=piece.pk, content_hash=digest).exists():
+        return
+    with _lock:
+        # New text is worth trying straight away, whatever failed before
+        _failures.pop(piece.pk, None)
+    schedule([piece.pk])
+
+
+def content_deleted(piece):
+    with _lock:
+        _failures.pop(piece.pk, None)
+        _apply(piece.author_id, lambda index: index.remove(piece.pk))
+
+
+def invalidate(author_id=None):
+    """Drops loaded indexes (all of them, or one author's) after bulk changes."""
+    with _lock:
+        if author_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(author_id, None)
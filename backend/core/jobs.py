@@ -0,0 +1,218 @@
+# core/jobs.py
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .metrics import llm_queue_wait
+from .models import ContentPiece, GenerationJob, Persona
+from .scheduler import context as scheduler_context
+from .utils import analyze_writing_sample, generate_content, split_content
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns the shared worker pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.LLM_WORKER_THREADS,
+                thread_name_prefix='llm-worker',
+            )
+    return _executor
+
+
+def start_workers():
+    """
+    Starts the worker pool and re-submits work left behind by a previous
+    process, so queued jobs survive restarts. Called once at server startup
+    (see CoreConfig.ready); the resume itself runs on the pool, so startup
+    does not touch the database.
+    """
+    get_executor().submit(_resume_pending_jobs_safely)
+
+
+def _resume_pending_jobs_safely():
+    close_old_connections()
+    try:
+        resume_pending_jobs()
+    except Exception:
+        logger.exception("Resuming pending background jobs failed")
+    finally:
+        close_old_connections()
+
+
+def submit(fn, *args):
+    """
+    Runs fn(*args) on the worker pool once the current transaction commits.
+    """
+    transaction.on_commit(lambda: get_executor().submit(fn, *args))
+
+
+def enqueue_generation(author, persona, prompt, fresh=False):
+    """
+    Persists a generation job and schedules it on the worker pool.
+
+    Returns:
+    - GenerationJob: The queued job.
+    """
+    job = GenerationJob.objects.create(author=author, persona=persona, prompt=prompt, fresh=fresh)
+    submit(run_generation_job, job.pk)
+    return job
+
+
+def enqueue_persona_analysis(persona, mode=None):
+    """
+    Schedules writing sample analysis for a persona saved as 'pending'.
+    Work resumed after a restart uses the default analysis mode.
+    """
+    submit(run_persona_analysis, persona.pk, mode)
+
+
+def resume_pending_jobs():
+    """
+    Re-submits queued work and requeues work whose heartbeat stopped more
+    than LLM_JOB_STALE_SECONDS ago (its worker died with a previous process).
+    Running work refreshes its heartbeat every LLM_JOB_HEARTBEAT_SECONDS,
+    including while it waits for a scheduler slot, so it is never requeued.
+    """
+    stale_before = timezone.now() - timedelta(seconds=settings.LLM_JOB_STALE_SECONDS)
+    requeued = GenerationJob.objects.filter(status='running').filter(
+        Q(heartbeat_at__lt=stale_before) | Q(heartbeat_at__isnull=True, started_at__lt=stale_before)
+    ).update(status='queued', started_at=None, heartbeat_at=None)
+    # Running analyses heartbeat through updated_at
+    requeued += Persona.objects.filter(analysis_status='analyzing', updated_at__lt=stale_before).update(
+        analysis_status='pending'
+    )
+    if requeued:
+        logger.warning(f"Requeued {requeued} stale background job(s).")
+
+    executor = get_executor()
+    for job_id in GenerationJob.objects.filter(status='queued').values_list('pk', flat=True):
+        executor.submit(run_generation_job, job_id)
+    for persona_id in Persona.objects.filter(analysis_status='pending').values_list('pk', flat=True):
+        executor.submit(run_persona_analysis, persona_id)
+
+
+@contextmanager
+def heartbeat(queryset, field):
+    """
+    Sets `field` to the current time on queryset's rows every
+    LLM_JOB_HEARTBEAT_SECONDS while the block runs, from a separate thread,
+    so long scheduler waits and map-reduce analyses still look alive.
+    """
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(settings.LLM_JOB_HEARTBEAT_SECONDS):
+                try:
+                    queryset.update(**{field: timezone.now()})
+                except Exception:
+                    logger.exception("Job heartbeat failed")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name='llm-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_generation_job(job_id):
+    """
+    Claims a queued job, generates its content and stores the ContentPiece.
+    """
+    close_old_connections()
+    try:
+        # Claim atomically so the same job never runs twice across processes
+        now = timezone.now()
+        claimed = GenerationJob.objects.filter(pk=job_id, status='queued').update(
+            status='running', started_at=now, heartbeat_at=now
+        )
+        if not claimed:
+            return
+
+        job = GenerationJob.objects.select_related('persona').get(pk=job_id)
+        llm_queue_wait.observe((job.started_at - job.created_at).total_seconds(), queue='generation')
+        with heartbeat(GenerationJob.objects.filter(pk=job_id, status='running'), 'heartbeat_at'), \
+                scheduler_context(job.author_id, 'batch'):
+            generated_content = generate_content(job.persona, job.prompt, fresh=job.fresh)
+        if not generated_content:
+            _finish_job(job, 'failed', error='Failed to generate content')
+            return
+
+        title, content = split_content(generated_content)
+        job.content_piece = ContentPiece.objects.create(
+            author_id=job.author_id,
+            persona=job.persona,
+            title=title or 'Untitled',
+            content=content or '',
+            status='draft'
+        )
+        _finish_job(job, 'succeeded')
+    except Exception as e:
+        logger.exception(f"Generation job {job_id} crashed")
+        GenerationJob.objects.filter(pk=job_id).update(
+            status='failed', error=str(e), finished_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+
+def run_persona_analysis(persona_id, mode=None):
+    """
+    Claims a pending persona, analyzes its writing sample and fills in the traits.
+    """
+    close_old_connections()
+    try:
+        claimed = Persona.objects.filter(pk=persona_id, analysis_status='pending').update(
+            analysis_status='analyzing', updated_at=timezone.now()
+        )
+        if not claimed:
+            return
+
+        persona = Persona.objects.get(pk=persona_id)
+        with heartbeat(Persona.objects.filter(pk=persona_id, analysis_status='analyzing'), 'updated_at'), \
+                scheduler_context(persona.author_id, 'batch'):
+            analyzed_data = analyze_writing_sample(persona.writing_sample, mode=mode)
+        if not analyzed_data:
+            persona.analysis_status = 'failed'
+            persona.analysis_error = 'Failed to analyze the writing sample.'
+            persona.save()
+            return
+
+        for field, value in Persona.fields_from_analysis(analyzed_data).items():
+            setattr(persona, field, value)
+        persona.analysis_status = 'complete'
+        persona.analysis_error = None
+        persona.save()
+    except Exception as e:
+        logger.exception(f"Analysis of persona {persona_id} crashed")
+        Persona.objects.filter(pk=persona_id).update(
+            analysis_status='failed', analysis_error=str(e), updated_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+
+def _finish_job(job, status, error=None):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'content_piece', 'finished_at'])
@@ -0,0 +1,254 @@
+# core/management/commands/benchmark.py
+
+import itertools
+import os
+import tempfile
+import threading
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test.utils import override_settings, setup_databases, setup_test_environment, \
+    teardown_databases, teardown_test_environment
+from rest_framework.test import APIClient
+
+from core import archive, ollama
+from core.benchmarks.stub_ollama import StubOllamaServer, load_recorded_response
+from core.models import ContentPiece, Persona
+from core.scheduler import scheduler
+from core.utils import build_generation_payload, extract_json
+from core.views import PersonaViewSet
+
+SAMPLE_TRAITS = {
+    'name': 'Benchmark Persona', 'vocabulary_complexity': 3, 'sentence_structure': 'simple',
+    'paragraph_organization': 'structured', 'tone': 'informal', 'punctuation_style': 'minimal',
+    'pronoun_preference': 'first-person', 'formality_level': 4, 'idiom_usage': 2,
+    'metaphor_frequency': 1, 'simile_frequency': 1, 'technical_jargon_usage': 3,
+    'humor_sarcasm_usage': 1, 'openness_to_experience': 5, 'conscientiousness': 6,
+    'extraversion': 4, 'agreeableness': 5, 'emotional_stability': 6, 'creativity_level': 2,
+    'age': 'adult', 'gender': 'unspecified', 'education_level': 'high school or higher',
+    'professional_background': 'retail worker', 'cultural_background': 'American',
+    'primary_language': 'English', 'language_fluency': 'native',
+}
+
+SAMPLE_TEXT = (
+    "I got my new drill and a stud finder from Amazon. I am so happy with it. "
+    "I haven't used the drill yet, but I plan on using it when I need to hang shelves."
+)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the API against a local stub Ollama server and reports p50/p95/p99 "
+        "latency and requests per second, plus micro-benchmarks of hot helpers. "
+        "Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,4,16',
+                            help='Comma-separated concurrency levels (default: 1,4,16).')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Requests per endpoint per concurrency level (default: 50).')
+        parser.add_argument('--endpoints', default='personas,generate-content,content,content-page',
+                            help='Comma-separated endpoints: personas, generate-content, content, content-page.')
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Stub Ollama time to first token in seconds (default: 0).')
+        parser.add_argument('--tokens-per-second', type=float, default=0,
+                            help='Stub Ollama token rate; 0 emits instantly (default: 0).')
+        parser.add_argument('--ollama-hosts', type=int, default=1,
+                            help='Stub Ollama servers to route calls across (default: 1).')
+        parser.add_argument('--recorded-response', default=None,
+                            help='Recorded Ollama response to replay (default: generated_text.md).')
+        parser.add_argument('--cached', action='store_true',
+                            help='Let repeated requests hit the analysis and generation caches.')
+        parser.add_argument('--content-rows', type=int, default=20,
+                            help='Content pieces to seed before measuring list endpoints, e.g. 1000000 '
+                                 '(default: 20). The unpaginated "content" endpoint is skipped above 10000.')
+        parser.add_argument('--micro-iterations', type=int, default=2000,
+                            help='Iterations per micro-benchmark; 0 skips them (default: 2000).')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',') if level]
+        endpoints = [endpoint for endpoint in options['endpoints'].split(',') if endpoint]
+
+        run_endpoints = bool(endpoints and options['requests'])
+        if not options['micro_iterations'] and not run_endpoints:
+            return
+
+        with tempfile.TemporaryDirectory() as tmpdir, self.test_database(tmpdir):
+            # Micro-benchmarks also run against the test database, never the configured one
+            if options['micro_iterations']:
+                self.run_micro_benchmarks(options['micro_iterations'], options['recorded_response'])
+            if not run_endpoints:
+                return
+
+            recorded_response = load_recorded_response(options['recorded_response'])
+            stubs = [
+                StubOllamaServer(
+                    latency=options['latency'],
+                    tokens_per_second=options['tokens_per_second'],
+                    recorded_response=recorded_response,
+                )
+                for _ in range(max(options['ollama_hosts'], 1))
+            ]
+            max_concurrency = scheduler.max_concurrency
+            with ExitStack() as stack:
+                for stub in stubs:
+                    stack.enter_context(stub)
+                hosts = [stub.url for stub in stubs]
+                stack.enter_context(override_settings(
+                    OLLAMA_BASE_URL=hosts[0], OLLAMA_HOSTS=hosts, LLM_ARCHIVE_ENABLED=False))
+                # The scheduler's cap is sized from OLLAMA_HOSTS at startup
+                scheduler.max_concurrency = settings.LLM_MAX_CONCURRENCY * len(hosts)
+                ollama.reset_client()
+                try:
+                    self.run_endpoint_benchmarks(endpoints, levels, options)
+                finally:
+                    ollama.reset_client()
+                    scheduler.max_concurrency = max_concurrency
+            served = ', '.join(str(stub.requests_served) for stub in stubs)
+            self.stdout.write(f"Stub Ollama served {served} request(s).")
+
+    # Database setup
+
+    def test_database(self, tmpdir):
+        command = self
+
+        class TestDatabase:
+            def __enter__(self):
+                setup_test_environment()
+                if connection.vendor == 'sqlite':
+                    # A file database lets concurrent request threads share data
+                    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+                self.old_config = setup_databases(verbosity=0, interactive=False)
+                return command
+
+            def __exit__(self, *exc_info):
+                archive.flush()
+                teardown_databases(self.old_config, verbosity=0)
+                teardown_test_environment()
+
+        return TestDatabase()
+
+    # Micro-benchmarks
+
+    def run_micro_benchmarks(self, iterations, recorded_response_path):
+        recorded = load_recorded_response(recorded_response_path)
+        raw_text = f"Here is the analysis:\n{recorded.get('response', '{}')}\nHope this helps."
+        persona = Persona(**SAMPLE_TRAITS)
+        generated = "Title: \"A Day Out\"\n" + "Some generated body text.\n" * 40
+        split = PersonaViewSet()._split_content
+
+        benchmarks = [
+            ('extract_json', lambda: extract_json(raw_text)),
+            ('build_generation_payload', lambda: build_generation_payload(persona, 'a trip to the store')),
+            ('_split_content', lambda: split(generated)),
+        ]
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Micro-benchmarks'))
+        self.stdout.write(f"{'name':<28}{'iterations':>12}{'mean (us)':>14}{'ops/s':>14}")
+        for name, fn in benchmarks:
+            seconds = min(timeit.repeat(fn, number=iterations, repeat=3))
+            mean_us = seconds / iterations * 1e6
+            self.stdout.write(f"{name:<28}{iterations:>12}{mean_us:>14.2f}{iterations / seconds:>14.0f}")
+
+    # Endpoint benchmarks
+
+    def run_endpoint_benchmarks(self, endpoints, levels, options):
+        user = User.objects.create_user('benchmark', password='benchmark')
+        persona = Persona.objects.create(author=user.author, **SAMPLE_TRAITS)
+        self.seed_content(user, persona, options['content_rows'])
+        if options['content_rows'] > 10000 and 'content' in endpoints:
+            self.stderr.write("Skipping the unpaginated 'content' endpoint at this row count; use 'content-page'.")
+            endpoints = [endpoint for endpoint in endpoints if endpoint != 'content']
+        counter = itertools.count()
+        cached = options['cached']
+
+        def unique(text):
+            return text if cached else f"{text} #{next(counter)}"
+
+        requests = {
+            'personas': lambda client: client.post(
+                '/api/personas/', {'name': 'Bench', 'writing_sample': unique(SAMPLE_TEXT)}, format='json'),
+            'generate-content': lambda client: client.post(
+                f'/api/personas/{persona.pk}/generate-content/',
+                {'prompt': unique('a trip to the hardware store'), 'fresh': not cached}, format='json'),
+            'content': lambda client: client.get('/api/content/'),
+            'content-page': lambda client: client.get('/api/content/?limit=20'),
+        }
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Endpoint benchmarks'))
+        self.stdout.write(
+            f"{'endpoint':<20}{'conc':>6}{'reqs':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}"
+        )
+        for endpoint in endpoints:
+            if endpoint not in requests:
+                self.stderr.write(f"Unknown endpoint '{endpoint}', skipping.")
+                continue
+            for level in levels:
+                result = self.measure(user, requests[endpoint], level, options['requests'])
+                self.stdout.write(
+                    f"{endpoint:<20}{level:>6}{result['requests']:>7}{result['errors']:>8}"
+                    f"{result['p50']:>10.1f}{result['p95']:>10.1f}{result['p99']:>10.1f}{result['rps']:>10.1f}"
+                )
+
+    def seed_content(self, user, persona, rows, batch_size=10000):
+        """Bulk-inserts content rows, plus rows for a second author so author filters have work to do."""
+        other = User.objects.create_user('benchmark-other', password='benchmark')
+        started = time.perf_counter()
+        for start in range(0, rows, batch_size):
+            count = min(batch_size, rows - start)
+            ContentPiece.objects.bulk_create([
+                ContentPiece(author=user.author if index % 2 == 0 else other.author,
+                             persona=persona if index % 2 == 0 else None,
+                             title=f'Seed {start + index}', content=SAMPLE_TEXT,
+                             word_count=len(SAMPLE_TEXT.split()))
+                for index in range(count)
+            ], batch_size=1000)
+        if rows > 10000:
+            self.stdout.write(f"Seeded {rows} content pieces in {time.perf_counter() - started:.1f}s.")
+
+    def measure(self, user, send, concurrency, total):
+        local = threading.local()
+
+        def one(_):
+            if not hasattr(local, 'client'):
+                local.client = APIClient()
+                local.client.force_authenticate(user)
+            started = time.perf_counter()
+            try:
+                response = send(local.client)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            finally:
+                close_old_connections()
+            return (time.perf_counter() - started) * 1000, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(one, range(total)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, _ in samples)
+        return {
+            'requests': total,
+            'errors': sum(1 for _, ok in samples if not ok),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'rps': total / elapsed if elapsed else 0.0,
+        }
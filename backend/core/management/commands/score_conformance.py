@@ -0,0 +1,93 @@
+# core/management/commands/score_conformance.py
+
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.conformance import CATEGORICAL_TRAITS, SCORED_TRAITS, score_batch
+from core.models import ContentPiece
+
+
+class Command(BaseCommand):
+    help = (
+        "Scores how closely each content piece's measured style matches its persona "
+        "and stores the result in ContentPiece.conformance_score. Batches are scored "
+        "across a process pool and written back with bulk_update."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Rescore pieces that were already scored.')
+        parser.add_argument('--author', type=int,
+                            help='Only score this author id.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Pieces per batch (default: 500).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes; 1 scores in this process (default: CPU count).')
+
+    def handle(self, *args, **options):
+        queryset = ContentPiece.objects.filter(persona__isnull=False).order_by()
+        if not options['all']:
+            # Pieces that could not be scored keep a null score but are not retried
+            queryset = queryset.filter(conformance_scored_at__isnull=True)
+        if options['author']:
+            queryset = queryset.filter(author_id=options['author'])
+
+        columns = ['pk', 'content'] + [f'persona__{trait}' for trait in SCORED_TRAITS + CATEGORICAL_TRAITS]
+        rows = queryset.values_list(*columns).iterator(chunk_size=options['batch_size'])
+
+        started = time.perf_counter()
+        batches = _batches(rows, options['batch_size'])
+        if options['workers'] > 1:
+            # Spawned workers only import core.conformance and never inherit a DB connection
+            with ProcessPoolExecutor(max_workers=options['workers'],
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                scored = self._save(_bounded_map(executor, batches, options['workers'] * 2))
+        else:
+            scored = self._save(map(score_batch, batches))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {scored} content pieces in {elapsed:.1f}s ({scored / elapsed if elapsed else 0:.0f}/s)"
+        ))
+
+    def _save(self, results):
+        scored = 0
+        for ids, scores in results:
+            now = timezone.now()
+            pieces = [
+                ContentPiece(pk=pk, conformance_score=score, conformance_scored_at=now)
+                for pk, score in zip(ids, scores)
+            ]
+            ContentPiece.objects.bulk_update(pieces, ['conformance_score', 'conformance_scored_at'])
+            scored += len(pieces)
+            self.stdout.write(f"  {scored} scored")
+        return scored
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bounded_map(executor, batches, window):
+    """Like executor.map, but keeps at most `window` batches in flight so rows stream from the DB."""
+    pending = deque()
+    for batch in batches:
+        pending.append(executor.submit(score_batch, batch))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
@@ -0,0 +1,171 @@
+# core/metrics.py
+
+import threading
+
+# Minimal Prometheus text-format metrics. Values are per process; with several
+# gunicorn workers each one reports its own series and Prometheus aggregates them.
+
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120, 180, 300, 600)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 200)
+TOKEN_COUNT_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Registers a callable returning extra exposition lines at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+llm_requests = registry.counter(
+    'llm_requests_total', 'LLM calls made, by outcome.', ['model', 'operation', 'status'])
+llm_failures = registry.counter(
+    'llm_request_failures_total', 'LLM calls that failed.', ['model', 'operation'])
+# Persona is only used as a label on counters to keep histogram cardinality bounded
+llm_prompt_tokens = registry.counter(
+    'llm_prompt_tokens_total', 'Prompt tokens evaluated by the model.', ['model', 'operation', 'persona'])
+llm_completion_tokens = registry.counter(
+    'llm_completion_tokens_total', 'Tokens generated by the model.', ['model', 'operation', 'persona'])
+llm_request_duration = registry.histogram(
+    'llm_request_duration_seconds', 'Total Ollama time per call (total_duration).', ['model', 'operation'])
+llm_load_duration = registry.histogram(
+    'llm_load_duration_seconds', 'Time Ollama spent loading the model (load_duration).', ['model', 'operation'])
+llm_prompt_eval_duration = registry.histogram(
+    'llm_prompt_eval_duration_seconds', 'Prompt evaluation time (prompt_eval_duration).', ['model', 'operation'])
+llm_prompt_size = registry.histogram(
+    'llm_prompt_tokens', 'Prompt tokens per call (prompt_eval_count).', ['model', 'operation'],
+    buckets=TOKEN_COUNT_BUCKETS)
+llm_tokens_per_second = registry.histogram(
+    'llm_tokens_per_second', 'Generation speed (eval_count / eval_duration).', ['model', 'operation'],
+    buckets=TOKENS_PER_SECOND_BUCKETS)
+persona_prompt_size = registry.histogram(
+    'persona_prompt_estimated_tokens', 'Estimated tokens in compiled persona system prompts, by encoding.',
+    ['encoding'], buckets=TOKEN_COUNT_BUCKETS)
+llm_queue_wait = registry.histogram(
+    'llm_queue_wait_seconds', 'Time background LLM work waited before a worker picked it up.', ['queue'])
+
+
+def observe_llm_call(operation, model, response=None, error=None, persona_id=None):
+    """
+    Records the Ollama timing fields of one call.
+
+    Parameters:
+    - operation (str): What the call was for, e.g. 'analysis' or 'generation'.
+    - model (str): The Ollama model name.
+    - response (dict): The decoded Ollama response or final stream chunk.
+    - error (str): Error message if the call failed.
+    - persona_id (int): Persona the call was made for, if any.
+    """
+    response = response or {}
+    status = 'failure' if error else 'success'
+    llm_requests.inc(model=model, operation=operation, status=status)
+    if error:
+        llm_failures.inc(model=model, operation=operation)
+
+    persona = persona_id if persona_id is not None else ''
+    if response.get('prompt_eval_count'):
+        llm_prompt_tokens.inc(response['prompt_eval_count'], model=model, operation=operation, persona=persona)
+        llm_prompt_size.observe(response['prompt_eval_count'], model=model, operation=operation)
+    if response.get('eval_count'):
+        llm_completion_tokens.inc(response['eval_count'], model=model, operation=operation, persona=persona)
+
+    # Ollama reports durations in nanoseconds
+    if response.get('total_duration'):
+        llm_request_duration.observe(response['total_duration'] / 1e9, model=model, operation=operation)
+    if response.get('load_duration'):
+        llm_load_duration.observe(response['load_duration'] / 1e9, model=model, operation=operation)
+    if response.get('prompt_eval_duration'):
+        llm_prompt_eval_duration.observe(response['prompt_eval_duration'] / 1e9, model=model, operation=operation)
+    if response.get('eval_count') and response.get('eval_duration'):
+        llm_tokens_per_second.observe(
+            response['eval_count'] / (response['eval_duration'] / 1e9), model=model, operation=operation)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='persona',
+            name='analysis_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='persona',
+            name='analysis_status',
+            field=models.CharField(choices=[('pending', 'Pending analysis'), ('analyzing', 'Analyzing'), ('complete', 'Complete'), ('failed', 'Failed')], default='complete', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='persona',
+            name='writing_sample',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
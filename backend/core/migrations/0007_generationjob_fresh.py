@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_analysiscacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='fresh',
+            field=models.BooleanField(default=False),
+        ),
+    ]
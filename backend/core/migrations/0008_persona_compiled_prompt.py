@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_generationjob_fresh'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='persona',
+            name='compiled_prompt',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
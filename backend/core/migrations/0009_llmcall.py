@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_persona_compiled_prompt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(db_index=True, max_length=30)),
+                ('model', models.CharField(max_length=100)),
+                ('system', models.TextField(blank=True, null=True)),
+                ('prompt', models.TextField()),
+                ('response', models.TextField(blank=True, null=True)),
+                ('success', models.BooleanField(default=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('total_duration', models.BigIntegerField(blank=True, null=True)),
+                ('load_duration', models.BigIntegerField(blank=True, null=True)),
+                ('prompt_eval_count', models.IntegerField(blank=True, null=True)),
+                ('prompt_eval_duration', models.BigIntegerField(blank=True, null=True)),
+                ('eval_count', models.IntegerField(blank=True, null=True)),
+                ('eval_duration', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('persona', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='llm_calls', to='core.persona')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
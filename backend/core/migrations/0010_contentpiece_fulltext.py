@@ -0,0 +1,74 @@
+# Full-text index over ContentPiece title and content.
+#
+# SQLite: an external-content FTS5 table kept in sync by triggers, so bulk
+# inserts and raw updates are indexed too. PostgreSQL: a GIN expression
+# index over the same tsvector expression that core.search queries.
+
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE core_contentpiece_fts USING fts5(
+        title, content, content='core_contentpiece', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER core_contentpiece_fts_ai AFTER INSERT ON core_contentpiece BEGIN
+        INSERT INTO core_contentpiece_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER core_contentpiece_fts_ad AFTER DELETE ON core_contentpiece BEGIN
+        INSERT INTO core_contentpiece_fts(core_contentpiece_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER core_contentpiece_fts_au AFTER UPDATE OF title, content ON core_contentpiece BEGIN
+        INSERT INTO core_contentpiece_fts(core_contentpiece_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO core_contentpiece_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    "INSERT INTO core_contentpiece_fts(core_contentpiece_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS core_contentpiece_fts_au",
+    "DROP TRIGGER IF EXISTS core_contentpiece_fts_ad",
+    "DROP TRIGGER IF EXISTS core_contentpiece_fts_ai",
+    "DROP TABLE IF EXISTS core_contentpiece_fts",
+]
+
+POSTGRES_FORWARD = [
+    """
+    CREATE INDEX core_contentpiece_fts_idx ON core_contentpiece USING GIN (
+        to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, ''))
+    )
+    """,
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS core_contentpiece_fts_idx",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_llmcall'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_contentpiece_fulltext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentEmbedding',
+            fields=[
+                ('content_piece', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='embedding', serialize=False, to='core.contentpiece')),
+                ('model', models.CharField(max_length=100)),
+                ('dimensions', models.PositiveIntegerField()),
+                ('vector', models.BinaryField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='content_embeddings', to='core.author')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_contentembedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contentpiece',
+            name='conformance_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contentpiece',
+            name='conformance_scored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_contentpiece_conformance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contentpiece',
+            index=models.Index(fields=['author', '-created_at'], name='content_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contentpiece',
+            index=models.Index(fields=['persona', '-created_at'], name='content_persona_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contentpiece',
+            index=models.Index(fields=['status'], name='content_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='persona',
+            index=models.Index(fields=['author', '-created_at'], name='persona_author_created_idx'),
+        ),
+    ]
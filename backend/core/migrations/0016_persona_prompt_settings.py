@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_generationjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='persona',
+            name='compiled_prompt_budget',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='persona',
+            name='compiled_prompt_encoding',
+            field=models.CharField(blank=True, max_length=10, null=True),
+        ),
+    ]
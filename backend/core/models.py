@@ -2,6 +2,7 @@
 
 from django.db import models
 from django.contrib.auth.models import User
+from .prompts import compile_prompt
 
 class Author(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='author')
@@ -13,6 +14,13 @@ class Author(models.Model):
         return f"{self.user.username}'s Author Profile"
 
 class Persona(models.Model):
+    ANALYSIS_STATUS_CHOICES = [
+        ('pending', 'Pending analysis'),
+        ('analyzing', 'Analyzing'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed')
+    ]
+
     # Relationship fields
     author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='personas', null=True, blank=True)
     
@@ -100,6 +108,17 @@ class Persona(models.Model):
     language_fluency = models.CharField(max_length=50, null=True, blank=True)
     
     
+    # Writing sample analysis
+    writing_sample = models.TextField(null=True, blank=True)
+    analysis_status = models.CharField(max_length=10, choices=ANALYSIS_STATUS_CHOICES, default='complete')
+    analysis_error = models.TextField(null=True, blank=True)
+
+    # System prompt compiled from the traits above, rebuilt on every save,
+    # with the encoding and token budget it was compiled with
+    compiled_prompt = models.TextField(null=True, blank=True)
+    compiled_prompt_encoding = models.CharField(max_length=10, null=True, blank=True)
+    compiled_prompt_budget = models.PositiveIntegerField(null=True, blank=True)
+
     # Metadata
     is_active = models.BooleanField(default=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
@@ -110,10 +129,53 @@ class Persona(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Backs PersonaViewSet.get_queryset with the default ordering
+            models.Index(fields=['author', '-created_at'], name='persona_author_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.author.user.username}'s persona: {self.name}"
 
+    @classmethod
+    def fields_from_analysis(cls, analyzed_data):
+        """
+        Maps writing sample analysis output onto Persona field values.
+
+        Keys that are not trait columns (including bookkeeping fields) are ignored.
+        """
+        excluded = {'id', 'author', 'writing_sample', 'analysis_status', 'analysis_error',
+                    'is_active', 'created_at', 'updated_at', 'data', *PROMPT_FIELDS}
+        field_names = {f.name for f in cls._meta.concrete_fields} - excluded
+        return {field: value for field, value in analyzed_data.items() if field in field_names}
+
+    def save(self, *args, **kwargs):
+        compile_prompt(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(PROMPT_FIELDS)
+        super().save(*args, **kwargs)
+
+    def refresh_compiled_prompt(self):
+        """
+        Recompiles the prompt after the encoding or budget settings changed
+        and stores it, without touching updated_at or sending signals.
+        Unsaved personas are only compiled in memory.
+        """
+        compile_prompt(self)
+        if self.pk is not None:
+            type(self).objects.filter(pk=self.pk).update(**{field: getattr(self, field) for field in PROMPT_FIELDS})
+
+
+# Columns written by prompts.compile_prompt
+PROMPT_FIELDS = ('compiled_prompt', 'compiled_prompt_encoding', 'compiled_prompt_budget')
+
+# Numeric 1-10 trait columns, in declaration order
+PERSONA_NUMERIC_TRAITS = [
+    field.name for field in Persona._meta.concrete_fields
+    if isinstance(field, models.IntegerField) and not field.primary_key and field.name not in PROMPT_FIELDS
+]
+
 class ContentPiece(models.Model):
     STATUS_CHOICES = [
         ('draft', 'Draft'),
@@ -131,9 +193,18 @@ class ContentPiece(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     published_at = models.DateTimeField(null=True, blank=True)
+    # How closely the text's measured style matches its persona, 0-1 (see core.conformance)
+    conformance_score = models.FloatField(null=True, blank=True)
+    conformance_scored_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Back ContentPieceViewSet.get_queryset, per-persona lists and status filters
+            models.Index(fields=['author', '-created_at'], name='content_author_created_idx'),
+            models.Index(fields=['persona', '-created_at'], name='content_persona_created_idx'),
+            models.Index(fields=['status'], name='content_status_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -141,3 +212,83 @@ class ContentPiece(models.Model):
     def save(self, *args, **kwargs):
         self.word_count = len(self.content.split())
         super().save(*args, **kwargs)
+
+class GenerationJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed')
+    ]
+
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='generation_jobs')
+    persona = models.ForeignKey(Persona, on_delete=models.CASCADE, related_name='generation_jobs')
+    prompt = models.TextField()
+    fresh = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    content_piece = models.ForeignKey(ContentPiece, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed while the job runs; a stale heartbeat means its worker died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Generation job {self.pk} ({self.status})"
+
+class AnalysisCacheEntry(models.Model):
+    key = models.CharField(max_length=64, primary_key=True)
+    model = models.CharField(max_length=100)
+    prompt_version = models.IntegerField()
+    result = models.JSONField()
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(db_index=True)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Analysis cache entry {self.key[:12]} ({self.model})"
+
+class LLMCall(models.Model):
+    operation = models.CharField(max_length=30, db_index=True)
+    model = models.CharField(max_length=100)
+    persona = models.ForeignKey(Persona, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_calls')
+    system = models.TextField(null=True, blank=True)
+    prompt = models.TextField()
+    response = models.TextField(null=True, blank=True)
+    success = models.BooleanField(default=True)
+    error = models.TextField(null=True, blank=True)
+
+    # Ollama timing fields; durations are in nanoseconds
+    total_duration = models.BigIntegerField(null=True, blank=True)
+    load_duration = models.BigIntegerField(null=True, blank=True)
+    prompt_eval_count = models.IntegerField(null=True, blank=True)
+    prompt_eval_duration = models.BigIntegerField(null=True, blank=True)
+    eval_count = models.IntegerField(null=True, blank=True)
+    eval_duration = models.BigIntegerField(null=True, blank=True)
+
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.operation} call to {self.model} at {self.created_at}"
+
+class ContentEmbedding(models.Model):
+    """Embedding of a content piece's title and body, stored as packed float32."""
+    content_piece = models.OneToOneField(ContentPiece, on_delete=models.CASCADE, primary_key=True, related_name='embedding')
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='content_embeddings')
+    model = models.CharField(max_length=100)
+    dimensions = models.PositiveIntegerField()
+    # L2-normalized, so cosine similarity is a dot product
+    vector = models.BinaryField()
+    # Hash of the embedded text; unchanged content is not re-embedded
+    content_hash = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Embedding of content piece {self.content_piece_id} ({self.model})"
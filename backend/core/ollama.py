@@ -0,0 +1,576 @@
+# core/ollama.py
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from rest_framework.exceptions import APIException
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaUnavailable(APIException):
+    status_code = 503
+    default_detail = 'The language model backend is unavailable. Please try again later.'
+    default_code = 'llm_unavailable'
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated upstream failures.
+
+    Closed: calls go through. Open: calls are rejected until reset_timeout has
+    passed. Half-open: a single trial call decides whether to close again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.error(f"Ollama circuit opened after {self._failures} consecutive failures.")
+                self._opened_at = time.monotonic()
+
+
+class OllamaClient:
+    """
+    Pooled HTTP client for the Ollama API with timeouts, retries and a circuit breaker.
+
+    Only failures that happen before Ollama starts working on a request are
+    retried: connection errors and 502/503/504 responses. Read timeouts are not
+    retried, since the model may still be busy with the original request.
+    """
+
+    RETRY_STATUSES = {502, 503, 504}
+
+    def __init__(self, base_url, connect_timeout=5, read_timeout=300, max_retries=2,
+                 backoff=0.5, pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    def check_available(self):
+        """Raises OllamaUnavailable if the circuit is open."""
+        if self.breaker.state == 'open':
+            raise OllamaUnavailable()
+
+    def generate(self, payload):
+        """
+        Runs a non-streaming /api/generate request.
+
+        Returns:
+        - dict: The decoded Ollama response.
+        """
+        response = self._post('/api/generate', dict(payload, stream=False))
+        return response.json()
+
+    def embed(self, payload):
+        """
+        Runs an /api/embed request; payload['input'] may be a string or a list.
+
+        Returns:
+        - dict: The decoded Ollama response, with one vector per input in 'embeddings'.
+        """
+        response = self._post('/api/embed', payload)
+        return response.json()
+
+    def stream_generate(self, payload):
+        """
+        Runs a streaming /api/generate request.
+
+        Yields:
+        - dict: Each decoded chunk as Ollama emits it.
+        """
+        with self._post('/api/generate', dict(payload, stream=True), stream=True) as response:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def list_models(self, path='/api/tags'):
+        """
+        Lists the models on /api/tags (pulled) or /api/ps (loaded in memory).
+        Used by health checks, so it is not retried and bypasses the breaker.
+
+        Returns:
+        - set[str]: Model names, e.g. 'qwen2.5:32b'.
+        """
+        connect_timeout = self.timeout[0]
+        response = self.session.get(f"{self.base_url}{path}", timeout=(connect_timeout, connect_timeout))
+        response.raise_for_status()
+        return {model.get('name') or model.get('model') for model in response.json().get('models', [])}
+
+    def _post(self, path, payload, stream=False):
+        if not self.breaker.allow():
+            raise OllamaUnavailable()
+
+        url = f"{self.base_url}{path}"
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout, stream=stream)
+                if response.status_code in self.RETRY_STATUSES and attempt < self.max_retries:
+                    response.close()
+                    raise requests.ConnectionError(f"Ollama returned {response.status_code}")
+                response.raise_for_status()
+            except requests.ConnectionError as e:
+                if attempt < self.max_retries:
+                    attempt += 1
+                    delay = random.uniform(0, self.backoff * (2 ** attempt))
+                    logger.warning(f"Ollama request failed ({e}); retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                    time.sleep(delay)
+                    continue
+                self.breaker.record_failure()
+                raise OllamaUnavailable() from e
+            except requests.HTTPError:
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                raise
+            except requests.RequestException:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return response
+
+
+class AsyncOllamaClient:
+    """
+    Non-blocking counterpart of OllamaClient for async views, built on httpx.
+
+    Applies the same timeouts and retry policy. The circuit breaker is shared
+    with the sync client so both paths see the same upstream health. An
+    httpx client is bound to one event loop, so the router keeps one per
+    host and loop; use get_async_client().
+    """
+
+    RETRY_STATUSES = OllamaClient.RETRY_STATUSES
+
+    def __init__(self, base_url, connect_timeout=5, read_timeout=300, max_retries=2,
+                 backoff=0.5, pool_size=200, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def generate(self, payload):
+        """
+        Runs a non-streaming /api/generate request.
+
+        Returns:
+        - dict: The decoded Ollama response.
+        """
+        response = await self._post('/api/generate', dict(payload, stream=False))
+        return response.json()
+
+    async def embed(self, payload):
+        """
+        Runs an /api/embed request.
+
+        Returns:
+        - dict: The decoded Ollama response, with one vector per input in 'embeddings'.
+        """
+        response = await self._post('/api/embed', payload)
+        return response.json()
+
+    async def stream_generate(self, payload):
+        """
+        Runs a streaming /api/generate request.
+
+        Yields:
+        - dict: Each decoded chunk as Ollama emits it.
+        """
+        response = await self._post('/api/generate', dict(payload, stream=True), stream=True)
+        try:
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+        finally:
+            await response.aclose()
+
+    async def _post(self, path, payload, stream=False):
+        if not self.breaker.allow():
+            raise OllamaUnavailable()
+
+        attempt = 0
+        while True:
+            try:
+                request = self.client.build_request('POST', path, json=payload)
+                response = await self.client.send(request, stream=stream)
+                if response.status_code in self.RETRY_STATUSES and attempt < self.max_retries:
+                    await response.aclose()
+                    raise httpx.ConnectError(f"Ollama returned {response.status_code}")
+                response.raise_for_status()
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if attempt < self.max_retries:
+                    attempt += 1
+                    delay = random.uniform(0, self.backoff * (2 ** attempt))
+                    logger.warning(f"Ollama request failed ({e}); retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                self.breaker.record_failure()
+                raise OllamaUnavailable() from e
+            except httpx.HTTPStatusError:
+                await response.aclose()
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                raise
+            except httpx.HTTPError:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return response
+
+
+def _model_name(name):
+    """Normalizes a model name the way Ollama lists it ('llama3' -> 'llama3:latest')."""
+    return name if ':' in name else f'{name}:latest'
+
+
+class Backend:
+    """One Ollama host in a router's pool, with its own clients and circuit breaker."""
+
+    def __init__(self, client, async_options=None):
+        self.client = client
+        self.url = client.base_url
+        self.outstanding = 0
+        self.healthy = True
+        # Pulled models (/api/tags) and models in memory (/api/ps); None
+        # until the first health check, meaning any model may be requested
+        self.models = None
+        self.loaded = set()
+        self.async_options = async_options or {}
+        self.async_clients = weakref.WeakKeyDictionary()
+
+    def serves(self, model):
+        return self.models is None or model is None or _model_name(model) in self.models
+
+    def is_warm(self, model):
+        return model is not None and _model_name(model) in self.loaded
+
+
+class OllamaRouter:
+    """
+    Spreads Ollama calls over a pool of hosts behind the OllamaClient interface.
+
+    Each call goes to the host with the fewest calls outstanding from this
+    process, among the healthy hosts with a usable circuit that have the
+    requested model pulled. A host that does not have the model in memory
+    counts as affinity_penalty extra calls, so requests stay on warm hosts
+    until those are clearly busier than a cold one. A daemon thread polls
+    /api/tags and /api/ps on every host to track health and models. A call
+    that cannot reach its host is tried on the other hosts before
+    OllamaUnavailable is raised; streams are not retried once started.
+    """
+
+    def __init__(self, backends, affinity_penalty=4, health_check_interval=15):
+        self.backends = backends
+        self.affinity_penalty = affinity_penalty
+        self.health_check_interval = health_check_interval
+        self._turn = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._health_thread = None
+
+    @property
+    def base_url(self):
+        return ', '.join(backend.url for backend in self.backends)
+
+    def check_available(self):
+        """Raises OllamaUnavailable if the circuit is open on every host."""
+        if all(backend.client.breaker.state == 'open' for backend in self.backends):
+            raise OllamaUnavailable()
+
+    def generate(self, payload):
+        return self._call(payload, lambda client: client.generate(payload))
+
+    def embed(self, payload):
+        return self._call(payload, lambda client: client.embed(payload))
+
+    def stream_generate(self, payload):
+        model = payload.get('model')
+        backend = self.acquire(model)
+        completed = False
+        try:
+            yield from backend.client.stream_generate(payload)
+            completed = True
+        finally:
+            self.release(backend, model, completed)
+
+    def acquire(self, model, exclude=()):
+        """Picks the host for a call to model and counts the call as outstanding on it."""
+        with self._lock:
+            backends = [backend for backend in self.backends if backend not in exclude]
+            candidates = [
+                backend for backend in backends
+                if backend.healthy and backend.serves(model) and backend.client.breaker.state != 'open'
+            ]
+            # With no good candidate, let the circuit breakers and retries decide
+            candidates = candidates or backends
+            # Rotate the starting point so ties are spread evenly
+            self._turn += 1
+            start = self._turn % len(candidates)
+            candidates = candidates[start:] + candidates[:start]
+            backend = min(candidates, key=lambda candidate: candidate.outstanding + (
+                0 if candidate.is_warm(model) else self.affinity_penalty))
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend, model, success):
+        with self._lock:
+            backend.outstanding -= 1
+            if success and model:
+                # Ollama keeps the model loaded after the call (see OLLAMA_KEEP_ALIVE)
+                backend.loaded.add(_model_name(model))
+
+    def async_client(self, backend):
+        """Returns the backend's AsyncOllamaClient for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = backend.async_clients.get(loop)
+            if client is None:
+                client = backend.async_clients[loop] = AsyncOllamaClient(
+                    backend.url, breaker=backend.client.breaker, **backend.async_options)
+            return client
+
+    def start_health_checks(self):
+        """Starts polling the hosts in the background; only useful with more than one host."""
+        if self._health_thread is None and len(self.backends) > 1 and self.health_check_interval > 0:
+            self._health_thread = threading.Thread(target=self._health_loop, name='ollama-health', daemon=True)
+            self._health_thread.start()
+
+    def stop_health_checks(self):
+        self._stopped.set()
+
+    def check_health(self):
+        """Polls every host once, updating whether it is healthy and which models it has."""
+        for backend in self.backends:
+            try:
+                models = {_model_name(name) for name in backend.client.list_models('/api/tags') if name}
+            except (requests.RequestException, ValueError) as e:
+                if backend.healthy:
+                    logger.warning(f"Ollama host {backend.url} failed its health check: {e}")
+                backend.healthy = False
+                continue
+            try:
+                loaded = {_model_name(name) for name in backend.client.list_models('/api/ps') if name}
+            except (requests.RequestException, ValueError):
+                # Older Ollama versions have no /api/ps; keep what the calls themselves showed
+                loaded = backend.loaded
+            if not backend.healthy:
+                logger.info(f"Ollama host {backend.url} passed its health check again")
+            with self._lock:
+                backend.healthy = True
+                backend.models = models
+                backend.loaded = loaded
+
+    def _health_loop(self):
+        while not self._stopped.is_set():
+            self.check_health()
+            self._stopped.wait(self.health_check_interval)
+
+    def _call(self, payload, call):
+        model = payload.get('model')
+        tried = []
+        while True:
+            backend = self.acquire(model, exclude=tried)
+            success = False
+            try:
+                result = call(backend.client)
+                success = True
+                return result
+            except OllamaUnavailable:
+                tried.append(backend)
+                if len(tried) == len(self.backends):
+                    raise
+                logger.warning(f"Ollama host {backend.url} is unavailable; trying another host")
+            finally:
+                self.release(backend, model, success)
+
+
+class AsyncOllamaRouter:
+    """
+    The router's AsyncOllamaClient interface for one event loop: picks hosts
+    the same way and shares their outstanding counts and breakers with the
+    sync path.
+    """
+
+    def __init__(self, router):
+        self.router = router
+
+    async def generate(self, payload):
+        return await self._call(payload, lambda client: client.generate(payload))
+
+    async def embed(self, payload):
+        return await self._call(payload, lambda client: client.embed(payload))
+
+    async def stream_generate(self, payload):
+        model = payload.get('model')
+        backend = self.router.acquire(model)
+        completed = False
+        try:
+            async for chunk in self.router.async_client(backend).stream_generate(payload):
+                yield chunk
+            completed = True
+        finally:
+            self.router.release(backend, model, completed)
+
+    async def _call(self, payload, call):
+        model = payload.get('model')
+        tried = []
+        while True:
+            backend = self.router.acquire(model, exclude=tried)
+            success = False
+            try:
+                result = await call(self.router.async_client(backend))
+                success = True
+                return result
+            except OllamaUnavailable:
+                tried.append(backend)
+                if len(tried) == len(self.router.backends):
+                    raise
+                logger.warning(f"Ollama host {backend.url} is unavailable; trying another host")
+            finally:
+                self.router.release(backend, model, success)
+
+
+def ollama_hosts():
+    """Returns the configured Ollama host URLs (OLLAMA_HOSTS, else OLLAMA_BASE_URL)."""
+    return list(settings.OLLAMA_HOSTS) or [settings.OLLAMA_BASE_URL]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the process-wide OllamaRouter built from settings."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            backends = [
+                Backend(
+                    OllamaClient(
+                        url,
+                        connect_timeout=settings.OLLAMA_CONNECT_TIMEOUT,
+                        read_timeout=settings.OLLAMA_READ_TIMEOUT,
+                        max_retries=settings.OLLAMA_MAX_RETRIES,
+                        backoff=settings.OLLAMA_RETRY_BACKOFF,
+                        pool_size=settings.OLLAMA_POOL_SIZE,
+                        breaker=CircuitBreaker(
+                            failure_threshold=settings.OLLAMA_BREAKER_FAILURES,
+                            reset_timeout=settings.OLLAMA_BREAKER_RESET_SECONDS,
+                        ),
+                    ),
+                    async_options={
+                        'connect_timeout': settings.OLLAMA_CONNECT_TIMEOUT,
+                        'read_timeout': settings.OLLAMA_READ_TIMEOUT,
+                        'max_retries': settings.OLLAMA_MAX_RETRIES,
+                        'backoff': settings.OLLAMA_RETRY_BACKOFF,
+                        'pool_size': settings.OLLAMA_ASYNC_POOL_SIZE,
+                    },
+                )
+                for url in ollama_hosts()
+            ]
+            _client = OllamaRouter(
+                backends,
+                affinity_penalty=settings.OLLAMA_AFFINITY_PENALTY,
+                health_check_interval=settings.OLLAMA_HEALTH_CHECK_INTERVAL,
+            )
+            _client.start_health_checks()
+        return _client
+
+
+def get_async_client():
+    """Returns the router's async interface for the running event loop."""
+    return AsyncOllamaRouter(get_client())
+
+
+def reset_client():
+    """Drops the shared router so the next get_client() picks up changed settings."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.stop_health_checks()
+        _client = None
+
+
+def _router_metrics():
+    router = _client
+    if router is None:
+        return []
+    lines = [
+        '# HELP ollama_host_outstanding Ollama calls in flight per host.',
+        '# TYPE ollama_host_outstanding gauge',
+    ]
+    lines.extend(f'ollama_host_outstanding{{host="{backend.url}"}} {backend.outstanding}' for backend in router.backends)
+    lines.extend([
+        '# HELP ollama_host_healthy Whether the host passed its last health check.',
+        '# TYPE ollama_host_healthy gauge',
+    ])
+    lines.extend(f'ollama_host_healthy{{host="{backend.url}"}} {int(backend.healthy)}' for backend in router.backends)
+    return lines
+
+
+registry.add_collector(_router_metrics)
@@ -0,0 +1,293 @@
+# core/prompts.py
+
+import logging
+import math
+
+from django.conf import settings
+
+from .metrics import persona_prompt_size
+
+logger = logging.getLogger(__name__)
+
+# Prompt builders kept free of model imports so models.py can use them.
+
+# Budgeting estimate: English text averages about four characters per token
+CHARS_PER_TOKEN = 4
+
+PROMPT_HEADER = "You are a writer with these traits."
+PROMPT_FOOTER = "Write in a way that naturally reflects these characteristics. The response should include a title."
+
+# 1-10 values in this range are the model's default behaviour and are left out
+NEUTRAL_VALUES = (5, 6)
+
+# Descriptors for 1-10 style scales: (low end, high end)
+STYLE_SCALES = {
+    'vocabulary_complexity': ('plain vocabulary', 'sophisticated vocabulary'),
+    'formality_level': ('casual register', 'formal register'),
+}
+# Categorical style traits, worded as descriptors
+STYLE_DESCRIPTORS = {
+    'sentence_structure': '{} sentences',
+    'paragraph_organization': '{} paragraphs',
+    'tone': '{} tone',
+    'punctuation_style': '{} punctuation',
+    'pronoun_preference': '{} voice',
+}
+# Device usage traits, merged by how often the device is used
+DEVICES = {
+    'idiom_usage': 'idioms',
+    'metaphor_frequency': 'metaphors',
+    'simile_frequency': 'similes',
+    'technical_jargon_usage': 'technical jargon',
+    'humor_sarcasm_usage': 'humor/sarcasm',
+}
+DEVICE_LEVELS = ('almost never uses', 'rarely uses', None, 'often uses', 'constantly uses')
+# Personality scales, merged by level
+PERSONALITY_SCALES = {
+    'openness_to_experience': 'openness',
+    'conscientiousness': 'conscientiousness',
+    'extraversion': 'extraversion',
+    'agreeableness': 'agreeableness',
+    'emotional_stability': 'emotional stability',
+    'creativity_level': 'creativity',
+}
+PERSONALITY_LEVELS = ('very low', 'low', None, 'high', 'very high')
+PERSONALITY_DESCRIPTORS = {
+    'dominant_motivations': 'motivated by {}',
+    'core_values': 'values {}',
+    'decision_making_style': '{} decision-making',
+    'emotional_response_tendency': '{} emotional responses',
+}
+BACKGROUND_FIELDS = ('age', 'gender', 'education_level', 'professional_background', 'cultural_background')
+# Free-text background values are cut to this many characters
+BACKGROUND_MAX_CHARS = 80
+# Placeholder answers the analysis sometimes gives instead of leaving a field empty
+UNKNOWN_VALUES = frozenset(('unknown', 'unspecified', 'not specified', 'n/a', 'none', 'null', 'neutral'))
+
+# Sections in prompt order with their weight; when over budget, the lowest
+# weighted descriptors (background first, then mild traits) are dropped first
+SECTIONS = (('Style', 3), ('Language', 3), ('Personality', 2), ('Background', 1))
+
+
+def estimate_tokens(text):
+    """Estimates the token count of text for budgeting (about four characters per token)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def build_system_prompt(persona):
+    """
+    Builds the system prompt that makes the model write as a persona.
+    
+    Uses the compact encoding unless settings.PERSONA_PROMPT_ENCODING is
+    'verbose', and records both encodings' estimated sizes.
+    
+    Parameters:
+    - persona (Persona): The persona object with individual fields.
+    
+    Returns:
+    - str: The system prompt describing the persona's traits.
+    """
+    verbose = build_verbose_system_prompt(persona)
+    if settings.PERSONA_PROMPT_ENCODING == 'verbose':
+        return verbose
+    compact = build_compact_system_prompt(persona, settings.PERSONA_PROMPT_TOKEN_BUDGET)
+    before, after = estimate_tokens(verbose), estimate_tokens(compact)
+    persona_prompt_size.observe(before, encoding='verbose')
+    persona_prompt_size.observe(after, encoding='compact')
+    logger.info(f"Compiled prompt for persona {persona.pk}: ~{before} -> ~{after} tokens")
+    return compact
+
+
+def prompt_settings():
+    """
+    Returns the (encoding, token budget) that build_system_prompt currently uses.
+
+    The budget is None for the verbose encoding, which ignores it.
+    """
+    if settings.PERSONA_PROMPT_ENCODING == 'verbose':
+        return 'verbose', None
+    return 'compact', settings.PERSONA_PROMPT_TOKEN_BUDGET
+
+
+def compile_prompt(persona):
+    """Compiles the persona's system prompt and records the settings it was built with."""
+    persona.compiled_prompt = build_system_prompt(persona)
+    persona.compiled_prompt_encoding, persona.compiled_prompt_budget = prompt_settings()
+
+
+def prompt_is_current(persona):
+    """Returns True if the stored prompt was compiled with the current encoding and budget."""
+    return persona.compiled_prompt is not None and (
+        (persona.compiled_prompt_encoding, persona.compiled_prompt_budget) == prompt_settings())
+
+
+def build_compact_system_prompt(persona, token_budget=None):
+    """
+    Encodes a persona as a short descriptor list instead of every raw trait.
+    
+    Empty, placeholder and neutral (5-6) values are left out, and related
+    traits are merged ("often uses idioms, metaphors"). If the prompt is
+    still over token_budget, the lowest-weighted descriptors are dropped:
+    background before style, and mild values before extreme ones.
+    
+    Parameters:
+    - persona (Persona): The persona object with individual fields.
+    - token_budget (int): Maximum estimated tokens; None or 0 for no limit.
+    
+    Returns:
+    - str: The system prompt.
+    """
+    descriptors = _persona_descriptors(persona)
+    prompt = _render_prompt(descriptors)
+    while token_budget and estimate_tokens(prompt) > token_budget and descriptors:
+        # Drop the lowest weight; among equals, the one latest in the prompt
+        lowest = min(range(len(descriptors)), key=lambda index: (descriptors[index][1], -index))
+        del descriptors[lowest]
+        prompt = _render_prompt(descriptors)
+    return prompt
+
+
+def _persona_descriptors(persona):
+    """Returns (section, weight, text) descriptors for the persona's non-default traits."""
+    weights = dict(SECTIONS)
+    descriptors = []
+
+    def add(section, text, extreme=False):
+        descriptors.append((section, weights[section] + (0.5 if extreme else 0), text))
+
+    for field, template in STYLE_DESCRIPTORS.items():
+        value = _text(getattr(persona, field, None))
+        if value:
+            add('Style', template.format(value))
+    for field, (low, high) in STYLE_SCALES.items():
+        level = _level(getattr(persona, field, None))
+        if level is not None:
+            add('Style', ('very ' if level in (0, 4) else '') + (low if level < 2 else high), level in (0, 4))
+
+    for level, traits in _merge_levels(persona, DEVICES):
+        add('Language', f"{DEVICE_LEVELS[level]} {', '.join(traits)}", level in (0, 4))
+
+    for level, traits in _merge_levels(persona, PERSONALITY_SCALES):
+        add('Personality', f"{PERSONALITY_LEVELS[level]} {', '.join(traits)}", level in (0, 4))
+    for field, template in PERSONALITY_DESCRIPTORS.items():
+        value = _text(getattr(persona, field, None))
+        if value:
+            add('Personality', template.format(value))
+
+    for field in BACKGROUND_FIELDS:
+        value = _text(getattr(persona, field, None))
+        if value:
+            if len(value) > BACKGROUND_MAX_CHARS:
+                value = value[:BACKGROUND_MAX_CHARS].rsplit(' ', 1)[0].rstrip(',;.')
+            add('Background', value)
+    language = _text(getattr(persona, 'primary_language', None))
+    if language:
+        fluency = _text(getattr(persona, 'language_fluency', None))
+        add('Background', f"{fluency} {language} speaker" if fluency else f"{language} speaker")
+    return descriptors
+
+
+def _merge_levels(persona, labels):
+    """Groups the labels of non-neutral 1-10 traits by level, extremes first."""
+    groups = {}
+    for field, label in labels.items():
+        level = _level(getattr(persona, field, None))
+        if level is not None:
+            groups.setdefault(level, []).append(label)
+    return sorted(groups.items(), key=lambda item: (-abs(item[0] - 2), -item[0]))
+
+
+def _level(value):
+    """Buckets a 1-10 value: 0 (1-2), 1 (3-4), 3 (7-8), 4 (9-10); None when neutral or unset."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if NEUTRAL_VALUES[0] <= value <= NEUTRAL_VALUES[1]:
+        return None
+    return min(int((max(value, 1) - 1) // 2), 4)
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = ' '.join(str(value).split())
+    return value if value and value.lower() not in UNKNOWN_VALUES else None
+
+
+def _render_prompt(descriptors):
+    lines = [PROMPT_HEADER]
+    for section, _ in SECTIONS:
+        texts = [text for name, _, text in descriptors if name == section]
+        if texts:
+            lines.append(f"{section}: {'; '.join(texts)}.")
+    lines.append(PROMPT_FOOTER)
+    return '\n'.join(lines)
+
+
+def build_verbose_system_prompt(persona):
+    """
+    Builds the original system prompt, which lists every trait as a dict.
+    
+    Parameters:
+    - persona (Persona): The persona object with individual fields.
+    
+    Returns:
+    - str: The system prompt describing the persona's traits.
+    """
+    # Convert persona fields into a format suitable for the prompt
+    persona_traits = {
+        "Writing Style": {
+            "vocabulary_complexity": f"{persona.vocabulary_complexity}/10",
+            "sentence_structure": persona.sentence_structure,
+            "paragraph_organization": persona.paragraph_organization,
+            "tone": persona.tone,
+            "punctuation_style": persona.punctuation_style,
+            "pronoun_preference": persona.pronoun_preference,
+            "formality_level": f"{persona.formality_level}/10",
+        },
+        "Language Patterns": {
+            "idiom_usage": f"{persona.idiom_usage}/10",
+            "metaphor_frequency": f"{persona.metaphor_frequency}/10",
+            "simile_frequency": f"{persona.simile_frequency}/10",
+            "technical_jargon_usage": f"{persona.technical_jargon_usage}/10",
+            "humor_sarcasm_usage": f"{persona.humor_sarcasm_usage}/10",
+        },
+        "Personality": {
+            "openness_to_experience": f"{persona.openness_to_experience}/10",
+            "conscientiousness": f"{persona.conscientiousness}/10",
+            "extraversion": f"{persona.extraversion}/10",
+            "agreeableness": f"{persona.agreeableness}/10",
+            "emotional_stability": f"{persona.emotional_stability}/10",
+            "dominant_motivations": persona.dominant_motivations,
+            "core_values": persona.core_values,
+            "decision_making_style": persona.decision_making_style,
+            "emotional_response_tendency": persona.emotional_response_tendency,
+            "creativity_level": f"{persona.creativity_level}/10",
+        },
+        "Demographics": {
+            "age": persona.age,
+            "gender": persona.gender,
+            "education_level": persona.education_level,
+            "professional_background": persona.professional_background,
+            "cultural_background": persona.cultural_background,
+            "primary_language": persona.primary_language,
+            "language_fluency": persona.language_fluency,
+        },
+    }
+
+    # Create the system prompt
+    system_prompt = f"""You are a writer with the following characteristics:
+
+Writing Style:
+{persona_traits['Writing Style']}
+
+Language Patterns:
+{persona_traits['Language Patterns']}
+
+Personality:
+{persona_traits['Personality']}
+
+Demographics:
+    {persona_traits['Demographics']}
+
+Write in a way that naturally reflects these characteristics. The response should include a title."""
+    return system_prompt
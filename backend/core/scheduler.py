@@ -0,0 +1,241 @@
+# core/scheduler.py
+
+import asyncio
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+
+from .metrics import llm_queue_wait, registry
+
+logger = logging.getLogger(__name__)
+
+# Interactive requests are always dispatched before batch/background work
+PRIORITIES = ('interactive', 'batch')
+
+_author = contextvars.ContextVar('llm_author', default=None)
+_priority = contextvars.ContextVar('llm_priority', default='interactive')
+
+llm_scheduler_rejections = registry.counter(
+    'llm_scheduler_rejections_total', 'LLM calls refused because the queue was full.', ['reason'])
+
+
+class LLMBusy(Throttled):
+    default_detail = 'The language model is busy. Please retry later.'
+    default_code = 'llm_busy'
+
+
+class _Ticket:
+    def __init__(self, author_id, priority):
+        self.author_id = author_id
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.granted = threading.Event()
+        # Set for async waiters: (loop, future) to resolve on grant
+        self.waiter = None
+
+
+class Scheduler:
+    """
+    Admission control and fair-share dispatch for LLM calls.
+
+    At most max_concurrency calls run at once. Waiting calls are queued per
+    priority and, within a priority, per author; slots go round-robin across
+    authors so one author's burst cannot starve the others, and interactive
+    calls always go before batch ones. Interactive calls are refused with
+    LLMBusy (429 + Retry-After) when the interactive queue, or the author's
+    share of it, is full or when they wait longer than queue_timeout. Batch calls come
+    from persistent jobs and simply wait their turn.
+    """
+
+    def __init__(self, max_concurrency=4, queue_limit=100, author_queue_limit=20, queue_timeout=120):
+        self.max_concurrency = max_concurrency
+        self.queue_limit = queue_limit
+        self.author_queue_limit = author_queue_limit
+        self.queue_timeout = queue_timeout
+        self._running = 0
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._queued = dict.fromkeys(PRIORITIES, 0)
+        # Moving average of how long a call holds its slot, for Retry-After
+        self._average_hold = 30.0
+        self._lock = threading.Lock()
+
+    def check_admission(self, author_id=None, priority=None):
+        """Raises LLMBusy if a call with this author and priority would be refused."""
+        author_id = _author.get() if author_id is None else author_id
+        priority = priority or _priority.get()
+        with self._lock:
+            self._admit(author_id, priority)
+
+    @contextmanager
+    def slot(self):
+        """Holds one LLM slot for the current author and priority (see context())."""
+        ticket = self._enqueue(_author.get(), _priority.get())
+        if not ticket.granted.wait(self._wait_timeout(ticket)):
+            self._abandon(ticket)
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Async form of slot(); waiting does not block the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        ticket = self._enqueue(_author.get(), _priority.get(), waiter=(loop, future))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self._wait_timeout(ticket))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # Gives the slot back if it was granted in the meantime
+            self._abandon(ticket, raise_busy=isinstance(e, asyncio.TimeoutError))
+            raise
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def wait_timeout(self, priority=None):
+        """Seconds a call of priority (default: the current one) may wait; None for no limit."""
+        return self.queue_timeout if (priority or _priority.get()) == 'interactive' else None
+
+    def busy(self, reason='timeout'):
+        """Returns the LLMBusy for a call that gave up waiting, with a Retry-After estimate."""
+        llm_scheduler_rejections.inc(reason=reason)
+        return LLMBusy(wait=self._retry_after(self._queued['interactive']))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._running,
+                'queued': {
+                    priority: sum(len(tickets) for tickets in queue.values())
+                    for priority, queue in self._queues.items()
+                },
+                'max_concurrency': self.max_concurrency,
+            }
+
+    def _admit(self, author_id, priority):
+        if priority != 'interactive':
+            return
+        # Batch work queued behind interactive calls does not count against them
+        queued = self._queued['interactive']
+        if self._running < self.max_concurrency and not queued:
+            return
+        if queued >= self.queue_limit:
+            llm_scheduler_rejections.inc(reason='queue_full')
+            raise LLMBusy(wait=self._retry_after(queued))
+        waiting = len(self._queues[priority].get(author_id, ()))
+        if waiting >= self.author_queue_limit:
+            llm_scheduler_rejections.inc(reason='author_limit')
+            raise LLMBusy(wait=self._retry_after(waiting))
+
+    def _enqueue(self, author_id, priority, waiter=None):
+        ticket = _Ticket(author_id, priority)
+        ticket.waiter = waiter
+        with self._lock:
+            self._admit(author_id, priority)
+            self._queues[priority].setdefault(author_id, deque()).append(ticket)
+            self._queued[priority] += 1
+            self._dispatch()
+        return ticket
+
+    def _wait_timeout(self, ticket):
+        return self.wait_timeout(ticket.priority)
+
+    def _abandon(self, ticket, raise_busy=True):
+        with self._lock:
+            if ticket.granted.is_set():
+                self._running -= 1
+                self._dispatch()
+            else:
+                tickets = self._queues[ticket.priority].get(ticket.author_id)
+                if tickets is not None and ticket in tickets:
+                    tickets.remove(ticket)
+                    self._queued[ticket.priority] -= 1
+                    if not tickets:
+                        del self._queues[ticket.priority][ticket.author_id]
+        if raise_busy:
+            raise self.busy()
+
+    def _release(self, ticket):
+        held = time.monotonic() - ticket.started_at
+        with self._lock:
+            self._average_hold = 0.9 * self._average_hold + 0.1 * held
+            self._running -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        # Called with the lock held
+        while self._running < self.max_concurrency and any(self._queued.values()):
+            queue = next(queue for priority, queue in self._queues.items() if queue)
+            # Round-robin: serve the author at the front, then move them to the back
+            author_id, tickets = next(iter(queue.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                queue.move_to_end(author_id)
+            else:
+                del queue[author_id]
+            self._queued[ticket.priority] -= 1
+            self._running += 1
+            ticket.started_at = time.monotonic()
+            llm_queue_wait.observe(ticket.started_at - ticket.queued_at, queue=f'scheduler_{ticket.priority}')
+            ticket.granted.set()
+            if ticket.waiter is not None:
+                loop, future = ticket.waiter
+                loop.call_soon_threadsafe(_resolve, future)
+
+    def _retry_after(self, ahead):
+        return max(1, math.ceil(self._average_hold * (ahead + 1) / self.max_concurrency))
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+@contextmanager
+def context(author_id=None, priority='interactive'):
+    """
+    Tags LLM calls made inside the block with an author and priority.
+
+    Context variables follow the code through awaits; threads started inside
+    the block need contextvars.copy_context() to inherit them.
+    """
+    author_token = _author.set(author_id)
+    priority_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _author.reset(author_token)
+        _priority.reset(priority_token)
+
+
+scheduler = Scheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY * max(len(settings.OLLAMA_HOSTS), 1),
+    queue_limit=settings.LLM_QUEUE_LIMIT,
+    author_queue_limit=settings.LLM_AUTHOR_QUEUE_LIMIT,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+)
+
+
+def _scheduler_metrics():
+    stats = scheduler.stats()
+    lines = [
+        '# HELP llm_scheduler_running LLM calls currently holding a slot.',
+        '# TYPE llm_scheduler_running gauge',
+        f'llm_scheduler_running {stats["running"]}',
+        '# HELP llm_scheduler_queued LLM calls waiting for a slot.',
+        '# TYPE llm_scheduler_queued gauge',
+    ]
+    lines.extend(f'llm_scheduler_queued{{priority="{priority}"}} {count}' for priority, count in stats['queued'].items())
+    return lines
+
+
+registry.add_collector(_scheduler_metrics)
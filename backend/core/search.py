@@ -0,0 +1,104 @@
+# core/search.py
+
+import html
+import re
+
+from django.db import connection
+
+from .models import ContentPiece
+
+# The database marks matches with private-use characters, which cannot be
+# mistaken for markup; they become <mark> tags once the text is escaped
+SNIPPET_START = '\ue000'
+SNIPPET_END = '\ue001'
+
+
+def _fts5_query(text):
+    """Quotes each word so user input can never be parsed as FTS5 syntax."""
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def search_content(author_id, query, persona_id=None, status=None, created_after=None,
+                   created_before=None, limit=20, offset=0):
+    """
+    Ranked full-text search over an author's content pieces.
+
+    Uses the FTS5 table on SQLite and the tsvector GIN index on PostgreSQL
+    (both created by migration 0010). Other backends fall back to an
+    unranked icontains scan.
+
+    Parameters:
+    - author_id (int): Only this author's pieces are searched.
+    - query (str): Free-text search terms.
+    - persona_id, status, created_after, created_before: Optional filters.
+    - limit, offset (int): Pagination.
+
+    Returns:
+    - list[dict]: Matches in rank order with 'id', 'rank' (higher is better)
+      and 'snippet' (HTML-escaped matching text with <mark> highlights).
+    """
+    filters = ['c.author_id = %s']
+    params = [author_id]
+    for clause, value in (
+        ('c.persona_id = %s', persona_id),
+        ('c.status = %s', status),
+        ('c.created_at >= %s', created_after),
+        ('c.created_at < %s', created_before),
+    ):
+        if value is not None:
+            filters.append(clause)
+            params.append(value)
+    where = ' AND '.join(filters)
+
+    if connection.vendor == 'sqlite':
+        match = _fts5_query(query)
+        if not match:
+            return []
+        # bm25() is lower-is-better, so negate it; title matches weigh 5x
+        sql = f"""
+            SELECT c.id, -bm25(core_contentpiece_fts, 5.0, 1.0) AS rank,
+                   snippet(core_contentpiece_fts, 1, %s, %s, '...', 24) AS snippet
+            FROM core_contentpiece_fts
+            JOIN core_contentpiece c ON c.id = core_contentpiece_fts.rowid
+            WHERE core_contentpiece_fts MATCH %s AND {where}
+            ORDER BY rank DESC
+            LIMIT %s OFFSET %s
+        """
+        params = [SNIPPET_START, SNIPPET_END, match] + params + [limit, offset]
+    elif connection.vendor == 'postgresql':
+        # The document expression must match the GIN index expression exactly
+        document = "to_tsvector('english', coalesce(c.title, '') || ' ' || coalesce(c.content, ''))"
+        sql = f"""
+            SELECT c.id, ts_rank_cd({document}, q) AS rank,
+                   ts_headline('english', coalesce(c.content, ''), q,
+                               'StartSel=' || %s || ', StopSel=' || %s || ', MaxFragments=2') AS snippet
+            FROM core_contentpiece c, websearch_to_tsquery('english', %s) q
+            WHERE {document} @@ q AND {where}
+            ORDER BY rank DESC
+            LIMIT %s OFFSET %s
+        """
+        params = [SNIPPET_START, SNIPPET_END, query] + params + [limit, offset]
+    else:
+        queryset = ContentPiece.objects.filter(author_id=author_id, content__icontains=query)
+        if persona_id is not None:
+            queryset = queryset.filter(persona_id=persona_id)
+        if status is not None:
+            queryset = queryset.filter(status=status)
+        if created_after is not None:
+            queryset = queryset.filter(created_at__gte=created_after)
+        if created_before is not None:
+            queryset = queryset.filter(created_at__lt=created_before)
+        return [{'id': pk, 'rank': 0.0, 'snippet': None}
+                for pk in queryset.values_list('pk', flat=True)[offset:offset + limit]]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [{'id': row[0], 'rank': row[1], 'snippet': _highlight(row[2])} for row in cursor.fetchall()]
+
+
+def _highlight(snippet):
+    """Escapes a snippet's content, then turns the match markers into <mark> tags."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
@@ -1,8 +1,10 @@
 # core/serializers.py
 
+from django.conf import settings
 from rest_framework import serializers
-from .models import Author, Persona, ContentPiece
-from .utils import analyze_writing_sample, generate_content
+from .models import Author, Persona, ContentPiece, GenerationJob, LLMCall
+from .utils import ANALYSIS_MODES, analyze_writing_sample, generate_content
+from . import jobs
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,8 +17,36 @@ class AuthorSerializer(serializers.ModelSerializer):
         model = Author
         fields = ['id', 'username', 'email', 'bio', 'created_at']
 
-class PersonaSerializer(serializers.ModelSerializer):
-    writing_sample = serializers.CharField(write_only=True, required=False)
+class SparseFieldsetsMixin:
+    """
+    Lets clients trim the response with ?fields=a,b or ?omit=a,b, or switch
+    to the serializer's Meta.compact_fields with ?view=compact.
+
+    Only applies to the top-level serializer of a request, never to nested ones.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or self.parent is not None:
+            return
+
+        params = request.query_params
+        keep = None
+        if params.get('view') == 'compact' and hasattr(self.Meta, 'compact_fields'):
+            keep = set(self.Meta.compact_fields)
+        if params.get('fields'):
+            requested = {name.strip() for name in params['fields'].split(',') if name.strip()}
+            keep = requested if keep is None else keep & requested
+        omit = {name.strip() for name in params.get('omit', '').split(',') if name.strip()}
+
+        for name in list(self.fields):
+            if (keep is not None and name not in keep) or name in omit:
+                self.fields.pop(name)
+
+class PersonaSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    writing_sample = serializers.CharField(write_only=True, required=False, allow_null=True)
+    analysis_mode = serializers.ChoiceField(choices=ANALYSIS_MODES, write_only=True, required=False)
     content_count = serializers.SerializerMethodField()
 
     class Meta:
@@ -54,27 +84,38 @@ class PersonaSerializer(serializers.ModelSerializer):
             'cultural_background',
             'primary_language',
             'language_fluency',
-            'is_active', 'created_at', 'updated_at', 'writing_sample'
+            'analysis_status', 'analysis_error',
+            'is_active', 'created_at', 'updated_at', 'writing_sample', 'analysis_mode'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'content_count']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'content_count',
+                            'analysis_status', 'analysis_error']
+        compact_fields = ['id', 'name', 'description', 'content_count', 'analysis_status',
+                          'is_active', 'created_at', 'updated_at']
 
     def get_content_count(self, obj):
-        return obj.contentpiece_set.count()
+        # PersonaViewSet annotates this in one query; freshly saved instances fall back to COUNT
+        count = getattr(obj, 'content_count', None)
+        return count if count is not None else obj.contentpiece_set.count()
 
     def create(self, validated_data):
         writing_sample = validated_data.pop('writing_sample', None)
+        analysis_mode = validated_data.pop('analysis_mode', None)
         author = self.context['request'].user.author
         validated_data['author'] = author
 
+        if writing_sample and self.context.get('async_analysis'):
+            # Save right away and let the worker pool fill in the traits
+            validated_data['writing_sample'] = writing_sample
+            validated_data['analysis_status'] = 'pending'
+            persona = super().create(validated_data)
+            jobs.enqueue_persona_analysis(persona, mode=analysis_mode)
+            return persona
+
         if writing_sample:
-            analyzed_data = analyze_writing_sample(writing_sample)
+            analyzed_data = analyze_writing_sample(writing_sample, mode=analysis_mode)
             if analyzed_data:
                 # Map analyzed data to individual fields
-                for field, value in analyzed_data.items():
-                    if hasattr(Persona, field):
-                        validated_data[field] = value                
-                        if 'name' in analyzed_data:
-                            validated_data['name'] = analyzed_data['name']
+                validated_data.update(Persona.fields_from_analysis(analyzed_data))
             else:
                 logger.error("Failed to analyze writing sample.")
                 raise serializers.ValidationError({"writing_sample": "Failed to analyze the writing sample."})
@@ -87,5 +128,31 @@ class ContentPieceSerializer(serializers.ModelSerializer):
     class Meta:
         model = ContentPiece
         fields = ['id', 'title', 'content', 'persona', 'persona_name', 'status',
-                 'tags', 'word_count', 'created_at', 'updated_at', 'published_at']
-        read_only_fields = ['id', 'word_count', 'created_at', 'updated_at']
+                 'tags', 'word_count', 'conformance_score', 'conformance_scored_at',
+                 'created_at', 'updated_at', 'published_at']
+        read_only_fields = ['id', 'word_count', 'conformance_score', 'conformance_scored_at',
+                            'created_at', 'updated_at']
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    persona_name = serializers.CharField(source='persona.name', read_only=True)
+
+    class Meta:
+        model = GenerationJob
+        fields = ['id', 'persona', 'persona_name', 'prompt', 'fresh', 'status', 'content_piece',
+                 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+class LLMCallSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LLMCall
+        fields = ['id', 'operation', 'model', 'persona', 'system', 'prompt', 'response',
+                  'success', 'error', 'total_duration', 'load_duration', 'prompt_eval_count',
+                  'prompt_eval_duration', 'eval_count', 'eval_duration', 'created_at']
+        read_only_fields = fields
+
+class BatchGenerateSerializer(serializers.Serializer):
+    prompts = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+    persona_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    concurrency = serializers.IntegerField(min_value=1, max_value=settings.BATCH_GENERATION_MAX_CONCURRENCY,
+                                           required=False, default=settings.BATCH_GENERATION_CONCURRENCY)
+    fresh = serializers.BooleanField(required=False, default=False)
@@ -1,9 +1,10 @@
 # core/signals.py
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Author  # Adjust the import based on your project structure
+from .models import Author, ContentPiece, Persona  # Adjust the import based on your project structure
+from . import embeddings, similarity
 
 @receiver(post_save, sender=User)
 def create_author_profile(sender, instance, created, **kwargs):
@@ -14,3 +15,19 @@ def create_author_profile(sender, instance, created, **kwargs):
 def save_author_profile(sender, instance, **kwargs):
     if hasattr(instance, 'author'):
         instance.author.save()
+
+@receiver(post_save, sender=Persona)
+def update_similarity_index(sender, instance, **kwargs):
+    similarity.persona_saved(instance)
+
+@receiver(post_delete, sender=Persona)
+def remove_from_similarity_index(sender, instance, **kwargs):
+    similarity.persona_deleted(instance)
+
+@receiver(post_save, sender=ContentPiece)
+def embed_content_piece(sender, instance, update_fields=None, **kwargs):
+    embeddings.content_saved(instance, update_fields)
+
+@receiver(post_delete, sender=ContentPiece)
+def remove_from_embedding_index(sender, instance, **kwargs):
+    embeddings.content_deleted(instance)
@@ -0,0 +1,183 @@
+# core/similarity.py
+
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .models import PERSONA_NUMERIC_TRAITS, Persona
+
+# Midpoint of the 1-10 trait scale; traits are centered on it so cosine
+# similarity measures direction away from "neutral" rather than magnitude.
+NEUTRAL = 5.5
+
+
+def _unit_rows(matrix):
+    """Centers rows on NEUTRAL, treats missing traits as neutral and L2-normalizes."""
+    centered = np.nan_to_num(matrix - NEUTRAL, nan=0.0)
+    norms = np.linalg.norm(centered, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (centered / norms).astype(np.float32)
+
+
+def trait_vector(persona):
+    """Returns a persona's numeric traits as float32, with NaN for missing values."""
+    return np.array(
+        [np.nan if getattr(persona, field) is None else getattr(persona, field) for field in PERSONA_NUMERIC_TRAITS],
+        dtype=np.float32,
+    )
+
+
+class TraitIndex:
+    """
+    Packed float32 matrix of one author's persona trait vectors.
+
+    Rows live in a preallocated array that doubles when full, so single
+    inserts, updates and deletes do not copy the whole matrix. A normalized
+    copy of every row is kept up to date alongside, so a cosine query is a
+    single matrix-vector product.
+    """
+
+    def __init__(self, ids, matrix):
+        self.size = len(ids)
+        capacity = max(16, self.size)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._matrix = np.full((capacity, len(PERSONA_NUMERIC_TRAITS)), np.nan, dtype=np.float32)
+        self._ids[:self.size] = ids
+        self._matrix[:self.size] = matrix
+        self._unit = _unit_rows(self._matrix)
+        self._rows = {int(persona_id): row for row, persona_id in enumerate(ids)}
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls, author_id):
+        rows = list(Persona.objects.filter(author_id=author_id).values_list('pk', *PERSONA_NUMERIC_TRAITS))
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        matrix = np.array(
+            [[np.nan if value is None else value for value in row[1:]] for row in rows],
+            dtype=np.float32,
+        ).reshape(len(rows), len(PERSONA_NUMERIC_TRAITS))
+        return cls(ids, matrix)
+
+    def upsert(self, persona_id, vector):
+        row = self._rows.get(persona_id)
+        if row is None:
+            if self.size == len(self._ids):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self._ids[row] = persona_id
+            self._rows[persona_id] = row
+        self._matrix[row] = vector
+        self._unit[row] = _unit_rows(vector)
+
+    def remove(self, persona_id):
+        row = self._rows.pop(persona_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            # Move the last row into the gap
+            self._ids[row] = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._unit[row] = self._unit[last]
+            self._rows[int(self._ids[row])] = row
+        self._matrix[last] = np.nan
+        self._unit[last] = 0.0
+        self.size -= 1
+
+    def nearest(self, persona_id, k=10, metric='cosine'):
+        """
+        Returns up to k (persona_id, score) pairs closest to persona_id.
+
+        For 'cosine' the score is the similarity in [-1, 1] (higher is closer)
+        and missing traits count as neutral. For 'euclidean' the score is the
+        distance over the traits both personas have, rescaled to the full
+        trait count (lower is closer); pairs with no traits in common are
+        skipped.
+        """
+        row = self._rows.get(persona_id)
+        if row is None:
+            return []
+        ids = self._ids[:self.size]
+        matrix = self._matrix[:self.size]
+        query = matrix[row]
+
+        if metric == 'euclidean':
+            present = ~np.isnan(matrix) & ~np.isnan(query)
+            diff = np.where(present, matrix - query, 0.0)
+            overlap = present.sum(axis=1)
+            scores = np.sqrt((diff ** 2).sum(axis=1) * matrix.shape[1] / np.maximum(overlap, 1))
+            scores[overlap == 0] = np.inf
+            scores[row] = np.inf
+            order = _top_k(scores, k)
+        else:
+            unit = self._unit[:self.size]
+            scores = unit @ unit[row]
+            scores[row] = -np.inf
+            order = _top_k(-scores, k)
+
+        return [(int(ids[index]), float(scores[index])) for index in order if np.isfinite(scores[index])]
+
+    def _grow(self):
+        capacity = len(self._ids) * 2
+        ids = np.zeros(capacity, dtype=np.int64)
+        matrix = np.full((capacity, self._matrix.shape[1]), np.nan, dtype=np.float32)
+        unit = np.zeros_like(matrix)
+        ids[:self.size] = self._ids[:self.size]
+        matrix[:self.size] = self._matrix[:self.size]
+        unit[:self.size] = self._unit[:self.size]
+        self._ids, self._matrix, self._unit = ids, matrix, unit
+
+
+def _top_k(keys, k):
+    """Indices of the k smallest keys, sorted, without sorting the whole array."""
+    if k < len(keys):
+        candidates = np.argpartition(keys, k)[:k]
+    else:
+        candidates = np.arange(len(keys))
+    return candidates[np.argsort(keys[candidates])]
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def find_similar(persona, k=10, metric='cosine'):
+    """
+    Finds the author's personas most similar to the given one.
+
+    The author's index is built on first use, kept current by the Persona
+    save/delete signals in this process, and rebuilt after
+    SIMILARITY_INDEX_TTL seconds to pick up changes made by other processes.
+    """
+    with _lock:
+        index = _indexes.get(persona.author_id)
+        if index is None or time.monotonic() - index.built_at > settings.SIMILARITY_INDEX_TTL:
+            index = _indexes[persona.author_id] = TraitIndex.build(persona.author_id)
+        return index.nearest(persona.pk, k=k, metric=metric)
+
+
+def persona_saved(persona):
+    """Updates the author's loaded index in place after a persona is saved."""
+    with _lock:
+        index = _indexes.get(persona.author_id)
+        if index is not None:
+            index.upsert(persona.pk, trait_vector(persona))
+
+
+def persona_deleted(persona):
+    with _lock:
+        index = _indexes.get(persona.author_id)
+        if index is not None:
+            index.remove(persona.pk)
+
+
+def invalidate(author_id=None):
+    """Drops loaded indexes (all of them, or one author's) after bulk changes."""
+    with _lock:
+        if author_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(author_id, None)
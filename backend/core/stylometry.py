@@ -0,0 +1,97 @@
+# core/stylometry.py
+
+import re
+
+import numpy as np
+
+# Traits measured here instead of asked of the LLM
+MEASURED_TRAITS = (
+    'contraction_usage',
+    'passive_voice_frequency',
+    'rhetorical_question_usage',
+    'list_usage_tendency',
+    'ellipsis_usage',
+    'word_length_preference',
+    'subordinate_clause_frequency',
+    'parenthetical_aside_frequency',
+    'quotation_frequency',
+)
+
+WORD_RE = re.compile(r"[A-Za-z]+(?:['’][A-Za-z]+)*")
+CONTRACTION_RE = re.compile(
+    r"\b[A-Za-z]+(?:n['’]t|['’](?:re|ll|ve|m|d))\b"
+    r"|\b(?:it|that|there|here|what|who|he|she|let|where|how)['’]s\b",
+    re.IGNORECASE,
+)
+# Splits after terminal punctuation (keeping it) followed by whitespace or end of text
+SENTENCE_RE = re.compile(r'[^.!?…]+(?:[.!?…]+["”\')\]]*|$)')
+ELLIPSIS_RE = re.compile(r'\.{3}|…')
+LIST_ITEM_RE = re.compile(r'^\s*(?:[-*•]|\d+[.)]|[a-zA-Z][.)])\s+\S')
+PASSIVE_RE = re.compile(
+    r"\b(?:am|is|are|was|were|be|been|being|get|gets|got|gotten)\s+(?:\w+ly\s+)?"
+    r"(?:\w+ed|born|built|given|taken|made|done|seen|known|shown|written|told|found|held|kept|"
+    r"left|lost|paid|sent|set|spent|thought|understood|won|bought|brought|caught|chosen|driven|"
+    r"eaten|forgotten|hidden|hit|hurt|put|read|run|said|sold|shut|spoken|stolen|taught|thrown|worn)\b",
+    re.IGNORECASE,
+)
+SUBORDINATORS = frozenset((
+    'although', 'though', 'because', 'since', 'unless', 'whereas', 'while', 'whenever',
+    'wherever', 'whether', 'if', 'when', 'until', 'after', 'before', 'once', 'that',
+    'which', 'who', 'whom', 'whose',
+))
+PARENTHETICAL_RE = re.compile(r'\([^()]*\)|\s[—–]\s?[^—–]+?[—–]|\s--\s[^-]+?--')
+QUOTATION_RE = re.compile(r'"[^"]+"|“[^”]+”')
+
+
+def _scale(rate, high):
+    """Maps a rate in [0, high] linearly onto the 1-10 trait scale."""
+    return int(round(1 + 9 * min(max(rate / high, 0.0), 1.0)))
+
+
+def analyze(text):
+    """
+    Measures surface-level style traits directly from a writing sample.
+
+    The result is deterministic and takes milliseconds, so these traits
+    can be left out of the LLM analysis prompt. Rates are mapped onto the
+    persona's 1-10 scale with ceilings chosen so that typical prose lands
+    mid-scale and heavy use saturates at 10.
+
+    Parameters:
+    - text (str): The writing sample.
+
+    Returns:
+    - dict: Values for MEASURED_TRAITS, or an empty dict when the sample
+      has no words.
+    """
+    words = WORD_RE.findall(text)
+    if not words:
+        return {}
+    word_count = len(words)
+    sentences = [sentence for sentence in SENTENCE_RE.findall(text) if WORD_RE.search(sentence)]
+    sentence_count = max(len(sentences), 1)
+    lines = [line for line in text.splitlines() if line.strip()]
+
+    lengths = np.fromiter((len(word) for word in words), dtype=np.float32, count=word_count)
+    mean_length = float(lengths.mean())
+    if mean_length <= 4.3:
+        word_length_preference = 'short'
+    elif mean_length >= 5.2:
+        word_length_preference = 'long'
+    else:
+        word_length_preference = 'varied'
+
+    subordinate_count = sum(1 for word in words if word.lower() in SUBORDINATORS)
+    question_count = sum(1 for sentence in sentences if sentence.rstrip('"”\')] ').endswith('?'))
+
+    return {
+        'contraction_usage': _scale(len(CONTRACTION_RE.findall(text)) / word_count, 0.04),
+        'passive_voice_frequency': _scale(len(PASSIVE_RE.findall(text)) / sentence_count, 0.4),
+        'rhetorical_question_usage': _scale(question_count / sentence_count, 0.25),
+        'list_usage_tendency': _scale(sum(1 for line in lines if LIST_ITEM_RE.match(line)) / max(len(lines), 1), 0.3),
+        'ellipsis_usage': _scale(len(ELLIPSIS_RE.findall(text)) / sentence_count, 0.15),
+        'word_length_preference': word_length_preference,
+        'subordinate_clause_frequency': _scale(subordinate_count / sentence_count, 1.5),
+        'parenthetical_aside_frequency': _scale(len(PARENTHETICAL_RE.findall(text)) / sentence_count, 0.3),
+        'quotation_frequency': _scale(len(QUOTATION_RE.findall(text)) / sentence_count, 0.3),
+    }
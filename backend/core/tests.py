@@ -1,3 +1,1162 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+import requests
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
 
 # Create your tests here.
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import apps, archive, embeddings, jobs, similarity, stylometry, transfer
+from .cache import AnalysisCache, GenerationCache, normalize_sample
+from .metrics import Registry, observe_llm_call
+from .models import AnalysisCacheEntry, ContentEmbedding, ContentPiece, GenerationJob, LLMCall, Persona
+from .analysis_schema import analysis_schema, coerce_analysis, parse_analysis, repair_json
+from .benchmarks.stub_ollama import StubOllamaServer
+from .ollama import Backend, CircuitBreaker, OllamaClient, OllamaRouter, OllamaUnavailable
+from .scheduler import LLMBusy, Scheduler, context as scheduler_context
+from . import utils
+from .utils import build_generation_payload, merge_analyses, split_writing_sample
+
+
+class PersonaListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_personas(self, count):
+        for index in range(count):
+            persona = Persona.objects.create(author=self.user.author, name=f'Persona {index}', tone='dry')
+            ContentPiece.objects.create(author=self.user.author, persona=persona, title='Post', content='a b c')
+
+    def test_list_query_count_does_not_grow_with_personas(self):
+        self.create_personas(3)
+        with self.assertNumQueries(1):  # one annotated persona query
+            response = self.client.get('/api/personas/')
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['content_count'], 1)
+
+        self.create_personas(10)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/personas/')
+        self.assertEqual(len(response.data), 13)
+
+    def test_sparse_fieldsets(self):
+        self.create_personas(1)
+
+        response = self.client.get('/api/personas/?fields=id,name,content_count')
+        self.assertEqual(set(response.data[0]), {'id', 'name', 'content_count'})
+
+        response = self.client.get('/api/personas/?omit=tone,content_count')
+        self.assertNotIn('tone', response.data[0])
+        self.assertIn('vocabulary_complexity', response.data[0])
+
+        response = self.client.get('/api/personas/?view=compact')
+        self.assertEqual(set(response.data[0]), {
+            'id', 'name', 'description', 'content_count', 'analysis_status',
+            'is_active', 'created_at', 'updated_at',
+        })
+
+
+class ResumePendingJobsTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('writer', password='secret').author
+        self.persona = Persona.objects.create(author=self.author, name='Persona')
+
+    def create_running_job(self, started_ago, heartbeat_ago):
+        now = timezone.now()
+        return GenerationJob.objects.create(
+            author=self.author, persona=self.persona, prompt='cats', status='running',
+            started_at=now - timedelta(seconds=started_ago),
+            heartbeat_at=now - timedelta(seconds=heartbeat_ago) if heartbeat_ago is not None else None,
+        )
+
+    def test_requeues_only_jobs_with_a_stale_heartbeat(self):
+        stale = self.settings(LLM_JOB_STALE_SECONDS=900)
+        alive = self.create_running_job(started_ago=5000, heartbeat_ago=30)
+        dead = self.create_running_job(started_ago=5000, heartbeat_ago=1000)
+        legacy = self.create_running_job(started_ago=5000, heartbeat_ago=None)
+
+        executor = mock.Mock()
+        with stale, mock.patch.object(jobs, 'get_executor', return_value=executor):
+            jobs.resume_pending_jobs()
+
+        statuses = dict(GenerationJob.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[alive.pk], 'running')
+        self.assertEqual(statuses[dead.pk], 'queued')
+        self.assertEqual(statuses[legacy.pk], 'queued')
+        submitted = sorted(call.args[1] for call in executor.submit.call_args_list)
+        self.assertEqual(submitted, sorted([dead.pk, legacy.pk]))
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    # The heartbeat writes from its own thread, so rows must be committed
+
+    def test_heartbeat_refreshes_the_timestamp_while_running(self):
+        author = User.objects.create_user('writer', password='secret').author
+        persona = Persona.objects.create(author=author, name='Persona')
+        job = GenerationJob.objects.create(
+            author=author, persona=persona, prompt='cats', status='running',
+            heartbeat_at=timezone.now() - timedelta(seconds=1000),
+        )
+        with self.settings(LLM_JOB_HEARTBEAT_SECONDS=0.05):
+            with jobs.heartbeat(GenerationJob.objects.filter(pk=job.pk), 'heartbeat_at'):
+                deadline = timezone.now() + timedelta(seconds=5)
+                while timezone.now() < deadline:
+                    job.refresh_from_db()
+                    if timezone.now() - job.heartbeat_at < timedelta(seconds=60):
+                        break
+        self.assertLess(timezone.now() - job.heartbeat_at, timedelta(seconds=60))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('core.ollama.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    def test_opens_after_threshold_and_rejects_calls(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_allows_a_single_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 30
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+    def test_trial_success_closes_and_failure_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertTrue(self.breaker.allow())
+
+
+def _response(status):
+    response = requests.Response()
+    response.status_code = status
+    response.raw = io.BytesIO(b'{"response": "ok"}')
+    return response
+
+
+class OllamaClientRetryTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('core.ollama.time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = OllamaClient('http://ollama.test', max_retries=2, backoff=0,
+                                   breaker=CircuitBreaker(failure_threshold=5))
+
+    def post_returns(self, *results):
+        return mock.patch.object(self.client.session, 'post', side_effect=list(results))
+
+    def test_retries_connection_errors(self):
+        with self.post_returns(requests.ConnectionError(), requests.ConnectionError(), _response(200)) as post:
+            self.assertEqual(self.client.generate({'model': 'm'}), {'response': 'ok'})
+        self.assertEqual(post.call_count, 3)
+
+    def test_retries_gateway_statuses(self):
+        for status in (502, 503, 504):
+            with self.post_returns(_response(status), _response(200)) as post:
+                self.client.generate({'model': 'm'})
+            self.assertEqual(post.call_count, 2)
+
+    def test_gives_up_after_max_retries_and_counts_a_failure(self):
+        with self.post_returns(*[requests.ConnectionError()] * 3) as post:
+            with self.assertRaises(OllamaUnavailable):
+                self.client.generate({'model': 'm'})
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual(self.client.breaker._failures, 1)
+
+    def test_does_not_retry_other_errors(self):
+        for result in (_response(500), _response(404), requests.ReadTimeout()):
+            with self.post_returns(result) as post:
+                with self.assertRaises(requests.RequestException):
+                    self.client.generate({'model': 'm'})
+            self.assertEqual(post.call_count, 1)
+
+    def test_open_circuit_fails_fast(self):
+        self.client.breaker._opened_at = time.monotonic()
+        with self.post_returns() as post:
+            with self.assertRaises(OllamaUnavailable):
+                self.client.generate({'model': 'm'})
+        post.assert_not_called()
+
+
+class NormalizeSampleTests(SimpleTestCase):
+    def test_collapses_spaces_within_lines(self):
+        self.assertEqual(normalize_sample('  One   two\tthree  '), 'One two three')
+
+    def test_keeps_paragraph_boundaries(self):
+        first = normalize_sample('First  paragraph.\n\nSecond one.')
+        self.assertEqual(first, 'First paragraph.\n\nSecond one.')
+        self.assertEqual(normalize_sample('First paragraph.\n \n\n\nSecond one.\n'), first)
+        self.assertNotEqual(normalize_sample('First paragraph. Second one.'), first)
+
+
+class AnalysisCacheEvictionTests(TestCase):
+    def test_evicts_every_n_writes(self):
+        cache = AnalysisCache(max_db_entries=2, evict_every=3)
+        for index in range(2):
+            cache.set(f'key{index}', 'model', 1, {'tone': 'dry'})
+        self.assertEqual(AnalysisCacheEntry.objects.count(), 2)
+
+        with mock.patch.object(cache, '_evict', wraps=cache._evict) as evict:
+            for index in range(2, 5):
+                cache.set(f'key{index}', 'model', 1, {'tone': 'dry'})
+                if index == 2:
+                    self.assertEqual(AnalysisCacheEntry.objects.count(), 2)
+        # Rows written since the last pass wait for the next one
+        self.assertEqual(evict.call_count, 1)
+        self.assertEqual(AnalysisCacheEntry.objects.count(), 4)
+
+
+class ArchiveWriteTests(TransactionTestCase):
+    def test_calls_for_a_deleted_persona_are_kept_without_it(self):
+        user = User.objects.create_user('writer', password='secret')
+        kept = Persona.objects.create(author=user.author, name='Kept')
+        deleted = Persona.objects.create(author=user.author, name='Deleted')
+        deleted_id = deleted.pk
+        deleted.delete()
+
+        archive._write([
+            LLMCall(operation='analysis', model='m', prompt='a', persona_id=kept.pk, created_at=timezone.now()),
+            LLMCall(operation='analysis', model='m', prompt='b', persona_id=deleted_id, created_at=timezone.now()),
+        ])
+        self.assertEqual(
+            dict(LLMCall.objects.values_list('prompt', 'persona_id')), {'a': kept.pk, 'b': None})
+
+
+class LLMCallFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='secret'))
+        LLMCall.objects.create(operation='analysis', model='m', prompt='a', success=False, created_at=timezone.now())
+        LLMCall.objects.create(operation='generation', model='m', prompt='b', created_at=timezone.now())
+
+    def test_filters(self):
+        response = self.client.get('/api/llm-calls/?success=false')
+        self.assertEqual([call['prompt'] for call in response.data], ['a'])
+        response = self.client.get('/api/llm-calls/?operation=generation&success=true')
+        self.assertEqual([call['prompt'] for call in response.data], ['b'])
+
+    def test_invalid_params_are_rejected(self):
+        for query in ('persona=abc', 'success=maybe'):
+            response = self.client.get(f'/api/llm-calls/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('error', response.data)
+
+
+class ContentSearchTests(TestCase):
+    def test_snippets_escape_content_and_mark_matches(self):
+        user = User.objects.create_user('writer', password='secret')
+        ContentPiece.objects.create(
+            author=user.author, title='Post', content='A <script>alert(1)</script> about hardware stores')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.get('/api/content/search/?q=hardware')
+        snippet = response.data[0]['snippet']
+        self.assertNotIn('<script>', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertIn('<mark>hardware</mark>', snippet)
+
+
+@mock.patch('core.embeddings.schedule')
+class EmbeddingSchedulingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        embeddings.invalidate()
+        embeddings._failures.clear()
+        self.addCleanup(embeddings._failures.clear)
+
+    def test_schedules_only_when_the_text_changed(self, schedule):
+        piece = ContentPiece.objects.create(author=self.user.author, title='Post', content='a b c')
+        schedule.assert_called_once_with([piece.pk])
+        ContentEmbedding.objects.create(
+            content_piece=piece, author=self.user.author, model=embeddings.EMBEDDING_MODEL, dimensions=2,
+            vector=embeddings.unit_vector([1, 0]).tobytes(),
+            content_hash=embeddings.content_hash(embeddings.embedding_text(piece)))
+        schedule.reset_mock()
+
+        piece.save()
+        piece.status = 'published'
+        piece.save(update_fields=['status'])
+        schedule.assert_not_called()
+
+        piece.content = 'a b c d'
+        piece.save()
+        schedule.assert_called_once_with([piece.pk])
+
+    def test_failed_pieces_back_off_on_index_rebuilds(self, schedule):
+        piece = ContentPiece.objects.create(author=self.user.author, title='Post', content='a b c')
+        with mock.patch('core.embeddings.embed_texts', side_effect=RuntimeError('down')):
+            embeddings.compute_embeddings([piece.pk])
+        schedule.reset_mock()
+
+        with mock.patch('core.embeddings.embed_texts', return_value=[[1.0, 0.0]]):
+            embeddings.search(self.user.author.pk, 'query')
+            schedule.assert_not_called()
+
+            embeddings.invalidate()
+            with mock.patch('core.embeddings.time.monotonic', return_value=time.monotonic() + 61):
+                embeddings.search(self.user.author.pk, 'query')
+        schedule.assert_called_once_with([piece.pk])
+
+    def test_embeddings_computed_during_a_rebuild_are_kept(self, schedule):
+        piece = ContentPiece.objects.create(author=self.user.author, title='Post', content='a b c')
+        build = embeddings.EmbeddingIndex.build
+
+        def build_while_embedding(author_id):
+            index = build(author_id)
+            # Would deadlock if the rebuild held the module lock
+            embeddings.compute_embeddings([piece.pk])
+            return index
+
+        with mock.patch('core.embeddings.embed_texts', return_value=[[1.0, 0.0]]), \
+                mock.patch.object(embeddings.EmbeddingIndex, 'build', side_effect=build_while_embedding):
+            matches = embeddings.search(self.user.author.pk, 'query')
+        self.assertEqual([piece_id for piece_id, _ in matches], [piece.pk])
+        self.assertEqual(embeddings._pending, {})
+
+    def test_unavailable_backend_does_not_block_generation(self, schedule):
+        persona = Persona.objects.create(author=self.user.author, name='Persona')
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        for error in (OllamaUnavailable(), LLMBusy(wait=5)):
+            with mock.patch('core.embeddings.embed_texts', side_effect=error), \
+                    mock.patch('core.views.generate_content', return_value='Title\n\nBody') as generate:
+                response = client.post(f'/api/personas/{persona.pk}/generate-content/',
+                                       {'prompt': 'cats', 'check_similar': True}, format='json')
+                self.assertEqual(response.status_code, 201)
+                generate.assert_called_once()
+
+                response = client.get('/api/content/semantic-search/?q=cats')
+                self.assertEqual(response.status_code, 500)
+                self.assertEqual(response.data, {'error': 'Failed to embed the query'})
+
+
+@mock.patch('core.embeddings.schedule')
+class ConformanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.persona = Persona.objects.create(author=self.user.author, name='Dry', tone='dry')
+
+    def test_scoring_skips_pieces_already_scored_even_without_a_score(self, _schedule):
+        unscored = ContentPiece.objects.create(
+            author=self.user.author, persona=self.persona, title='Post', content='Short and plain. It works.')
+        unscorable = ContentPiece.objects.create(
+            author=self.user.author, persona=self.persona, title='Post', content='',
+            conformance_scored_at=timezone.now())
+
+        with mock.patch('core.management.commands.score_conformance.score_batch',
+                        side_effect=lambda batch: ([row[0] for row in batch], [0.5] * len(batch))) as score_batch:
+            call_command('score_conformance', workers=1, stdout=io.StringIO())
+        self.assertEqual([row[0] for row in score_batch.call_args.args[0]], [unscored.pk])
+        unscorable.refresh_from_db()
+        self.assertIsNone(unscorable.conformance_score)
+
+    def test_low_conformance_rejects_a_non_integer_persona(self, _schedule):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        ContentPiece.objects.create(author=self.user.author, persona=self.persona, title='Post',
+                                    content='a', conformance_score=0.1, conformance_scored_at=timezone.now())
+
+        response = client.get(f'/api/content/low-conformance/?persona={self.persona.pk}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        response = client.get('/api/content/low-conformance/?persona=abc')
+        self.assertEqual(response.status_code, 400)
+
+
+class SchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = Scheduler(max_concurrency=1, queue_limit=3, author_queue_limit=2)
+        # Occupies the only slot so later tickets queue
+        self.running = self.scheduler._enqueue(None, 'interactive')
+
+    def grant_order(self, tickets):
+        order, current = [], self.running
+        while True:
+            self.scheduler._release(current)
+            current = next((ticket for ticket in tickets if ticket.granted.is_set() and ticket not in order), None)
+            if current is None:
+                return order
+            order.append(current)
+
+    def test_slots_rotate_between_authors(self):
+        a1, a2 = self.scheduler._enqueue('a', 'interactive'), self.scheduler._enqueue('a', 'interactive')
+        b1 = self.scheduler._enqueue('b', 'interactive')
+        batch = self.scheduler._enqueue('c', 'batch')
+        self.assertEqual(self.grant_order([a1, a2, b1, batch]), [a1, b1, a2, batch])
+
+    def test_author_queue_limit(self):
+        self.scheduler._enqueue('a', 'interactive')
+        self.scheduler._enqueue('a', 'interactive')
+        with self.assertRaises(LLMBusy):
+            self.scheduler._enqueue('a', 'interactive')
+        self.scheduler._enqueue('b', 'interactive')
+
+    def test_queue_full_sets_retry_after(self):
+        for author_id in ('a', 'b', 'c'):
+            self.scheduler._enqueue(author_id, 'interactive')
+        with self.assertRaises(LLMBusy) as raised:
+            self.scheduler.check_admission('d', 'interactive')
+        response = exception_handler(raised.exception, {})
+        self.assertEqual(response.status_code, 429)
+        # 30s average hold, 3 calls ahead plus this one, one slot
+        self.assertEqual(response['Retry-After'], '120')
+
+    def test_queued_batch_work_does_not_fill_the_interactive_queue(self):
+        for _ in range(5):
+            self.scheduler._enqueue('jobs', 'batch')
+        self.scheduler.check_admission('a', 'interactive')
+        self.scheduler._enqueue('a', 'interactive')
+
+
+class OllamaRouterTests(SimpleTestCase):
+    # Nothing listens here, so connections are refused at once
+    DEAD_URL = 'http://127.0.0.1:1'
+
+    def setUp(self):
+        self.stubs = [StubOllamaServer().start(), StubOllamaServer().start()]
+        for stub in self.stubs:
+            self.addCleanup(stub.stop)
+
+    def router(self, urls, affinity_penalty=0):
+        backends = [Backend(OllamaClient(url, max_retries=0, backoff=0)) for url in urls]
+        return OllamaRouter(backends, affinity_penalty=affinity_penalty, health_check_interval=0)
+
+    def served(self):
+        return [stub.requests_served for stub in self.stubs]
+
+    def test_picks_the_host_with_fewest_outstanding_calls(self):
+        router = self.router([stub.url for stub in self.stubs])
+        first = router.acquire('m')
+        second = router.acquire('m')
+        self.assertIsNot(first, second)
+        router.release(second, 'm', True)
+
+        router.generate({'model': 'm', 'prompt': 'x'})
+        self.assertEqual(self.served(), [0, 1] if first is router.backends[0] else [1, 0])
+        self.assertEqual([backend.outstanding for backend in router.backends], [
+            1 if backend is first else 0 for backend in router.backends])
+
+    def test_prefers_hosts_with_the_model_loaded(self):
+        router = self.router([stub.url for stub in self.stubs], affinity_penalty=4)
+        router.backends[1].loaded.add('small:latest')
+        for _ in range(3):
+            router.generate({'model': 'small', 'prompt': 'x'})
+        self.assertEqual(self.served(), [0, 3])
+
+        # A warm host busier than the penalty loses to a cold one
+        router.backends[1].outstanding = 5
+        router.generate({'model': 'small', 'prompt': 'x'})
+        self.assertEqual(self.served(), [1, 3])
+
+    def test_health_checks_steer_calls_and_fall_back_when_all_hosts_fail(self):
+        router = self.router([self.DEAD_URL, self.stubs[0].url])
+        router.check_health()
+        self.assertFalse(router.backends[0].healthy)
+        self.assertIn(settings.OLLAMA_GENERATION_MODEL, router.backends[1].models)
+        self.assertIs(router.acquire('m'), router.backends[1])
+        self.assertFalse(router.backends[1].serves('missing-model'))
+
+        for backend in router.backends:
+            backend.healthy = False
+        # With no healthy candidate every host stays eligible
+        picked = {router.acquire('m') for _ in range(4)}
+        self.assertEqual(picked, set(router.backends))
+
+    def test_call_fails_over_to_another_host(self):
+        router = self.router([self.DEAD_URL, self.stubs[0].url], affinity_penalty=4)
+        router.backends[0].loaded.add('m:latest')
+
+        self.assertEqual(router.generate({'model': 'm', 'prompt': 'x'})['done'], True)
+        self.assertEqual(self.served(), [1, 0])
+        self.assertEqual([backend.outstanding for backend in router.backends], [0, 0])
+
+        dead_only = self.router([self.DEAD_URL])
+        with self.assertRaises(OllamaUnavailable):
+            dead_only.generate({'model': 'm', 'prompt': 'x'})
+
+
+class AnalysisRepairTests(SimpleTestCase):
+    def test_strips_code_fences_and_surrounding_text(self):
+        text = 'Here is the analysis:\n```json\n{"tone": "dry", "vocabulary_complexity": 7}\n```\nHope it helps.'
+        self.assertEqual(repair_json(text), {'tone': 'dry', 'vocabulary_complexity': 7})
+
+    def test_drops_trailing_commas(self):
+        self.assertEqual(repair_json('{"tone": "dry", "themes": ["a", "b",],}'), {'tone': 'dry', 'themes': ['a', 'b']})
+
+    def test_closes_truncated_output(self):
+        self.assertEqual(repair_json('{"tone": "dry", "themes": ["a", "b'), {'tone': 'dry', 'themes': ['a', 'b']})
+        self.assertEqual(repair_json('{"tone": "dry", "vocabulary_complexity": '), {'tone': 'dry'})
+
+    def test_gives_up_without_an_object(self):
+        self.assertIsNone(repair_json('I cannot analyze this sample.'))
+        self.assertIsNone(parse_analysis('I cannot analyze this sample.', analysis_schema((('tone', ''),))))
+
+
+class AnalysisCoercionTests(SimpleTestCase):
+    schema = analysis_schema((
+        ('vocabulary_complexity', '[1-10]'),
+        ('sentence_structure', '"[simple/complex/varied]"'),
+        ('tone', '"[formal/informal/academic/conversational/etc.]"'),
+    ))
+
+    def test_schema_follows_persona_fields(self):
+        properties = self.schema['properties']
+        self.assertEqual(properties['vocabulary_complexity'], {'type': 'integer', 'minimum': 1, 'maximum': 10})
+        self.assertEqual(properties['sentence_structure']['enum'], ['simple', 'complex', 'varied'])
+        self.assertNotIn('enum', properties['tone'])
+
+    def test_numbers_are_parsed_and_clamped(self):
+        for value, expected in (('7/10', 7), ('7.6', 8), (42, 10), (-3, 1)):
+            self.assertEqual(coerce_analysis({'vocabulary_complexity': value}, self.schema),
+                             {'vocabulary_complexity': expected}, value)
+        self.assertEqual(coerce_analysis({'vocabulary_complexity': 'high'}, self.schema), {})
+
+    def test_out_of_enum_values(self):
+        self.assertEqual(coerce_analysis({'sentence_structure': 'Complex'}, self.schema),
+                         {'sentence_structure': 'complex'})
+        # Neither dropped nor forced onto a choice: the column still takes free text
+        self.assertEqual(coerce_analysis({'sentence_structure': 'mostly compound'}, self.schema),
+                         {'sentence_structure': 'mostly compound'})
+
+    def test_drops_unknown_keys_and_uncoercible_values(self):
+        data = {'tone': {'primary': 'dry'}, 'mood': 'calm', 'sentence_structure': ['simple', 'varied']}
+        self.assertEqual(coerce_analysis(data, self.schema), {'sentence_structure': 'simple, varied'})
+
+
+@override_settings(PERSONA_PROMPT_ENCODING='compact', PERSONA_PROMPT_TOKEN_BUDGET=200)
+class CompiledPromptTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('writer', password='secret')
+        self.persona = Persona.objects.create(author=user.author, name='Dry', tone='dry', idiom_usage=9)
+
+    def test_prompt_records_its_settings(self):
+        self.assertEqual((self.persona.compiled_prompt_encoding, self.persona.compiled_prompt_budget), ('compact', 200))
+        self.assertEqual(build_generation_payload(self.persona, 'x')['system'], self.persona.compiled_prompt)
+
+    def test_stale_prompt_is_recompiled_and_stored(self):
+        compact = self.persona.compiled_prompt
+        updated_at = self.persona.updated_at
+        with override_settings(PERSONA_PROMPT_ENCODING='verbose'):
+            persona = Persona.objects.get(pk=self.persona.pk)
+            system = build_generation_payload(persona, 'x')['system']
+            self.assertNotEqual(system, compact)
+            self.assertIn('Writing Style:', system)
+
+            persona.refresh_from_db()
+            self.assertEqual((persona.compiled_prompt, persona.compiled_prompt_encoding), (system, 'verbose'))
+            self.assertEqual(persona.updated_at, updated_at)
+            with self.assertNumQueries(0):
+                build_generation_payload(persona, 'x')
+
+        with override_settings(PERSONA_PROMPT_TOKEN_BUDGET=20):
+            persona = Persona.objects.get(pk=self.persona.pk)
+            self.assertLess(len(build_generation_payload(persona, 'x')['system']), len(compact))
+
+    def test_unsaved_persona_is_compiled_in_memory(self):
+        persona = Persona(name='Draft', tone='dry')
+        with self.assertNumQueries(0):
+            system = build_generation_payload(persona, 'x')['system']
+        self.assertIn('dry tone', system)
+        self.assertEqual(persona.compiled_prompt_encoding, 'compact')
+
+
+@mock.patch('core.jobs.enqueue_persona_analysis')
+class PersonaTransferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.other = User.objects.create_user('reader', password='secret')
+
+    def export(self, user):
+        return list(transfer.export_personas(user.author))
+
+    def test_round_trip(self, enqueue):
+        Persona.objects.create(author=self.user.author, name='Dry', tone='dry', idiom_usage=2,
+                               writing_sample='Plain words.', analysis_status='failed')
+        Persona.objects.create(author=self.user.author, name='Loud', tone='excited', is_active=False)
+
+        summary = transfer.import_personas(self.other.author, self.export(self.user), skip_analysis=True)
+        self.assertEqual((summary['created'], summary['failed'], summary['analysis_queued']), (2, 0, 0))
+        enqueue.assert_not_called()
+
+        fields = [field for field in transfer.EXPORT_FIELDS if field not in ('id', 'created_at', 'updated_at')]
+        exported = [{field: row[field] for field in fields} for row in map(json.loads, self.export(self.user))]
+        imported = [{field: row[field] for field in fields} for row in map(json.loads, self.export(self.other))]
+        self.assertEqual(imported, exported)
+        self.assertEqual([row['analysis_status'] for row in imported], ['failed', 'complete'])
+
+    def test_reports_failed_lines_and_imports_the_rest(self, enqueue):
+        lines = [
+            json.dumps({'name': 'Good', 'writing_sample': 'Some text.'}),
+            '{"name": "Broken",',
+            '',
+            json.dumps(['not', 'an', 'object']),
+            json.dumps({'name': 'Bad', 'idiom_usage': 'often'}),
+            json.dumps({'name': 'Also good'}).encode('utf-8'),
+        ]
+        summary = transfer.import_personas(self.user.author, lines, chunk_size=2)
+
+        self.assertEqual((summary['created'], summary['failed'], summary['analysis_queued']), (2, 3, 1))
+        self.assertEqual([error['line'] for error in summary['errors']], [2, 4, 5])
+        self.assertIn('idiom_usage', summary['errors'][2]['errors'])
+        self.assertEqual(Persona.objects.get(name='Good').analysis_status, 'pending')
+        enqueue.assert_called_once()
+
+    def test_update_existing(self, enqueue):
+        own = Persona.objects.create(author=self.user.author, name='Old', tone='dry')
+        foreign = Persona.objects.create(author=self.other.author, name='Foreign')
+        lines = [json.dumps({'id': own.pk, 'name': 'New', 'tone': 'warm'}),
+                 json.dumps({'id': foreign.pk, 'name': 'Copy'})]
+
+        summary = transfer.import_personas(self.user.author, lines, update_existing=True)
+        self.assertEqual((summary['created'], summary['updated']), (1, 1))
+        own.refresh_from_db()
+        self.assertEqual((own.name, own.tone), ('New', 'warm'))
+        self.assertIn('warm', own.compiled_prompt)
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.name, 'Foreign')
+
+        # Without update_existing ids are ignored
+        summary = transfer.import_personas(self.user.author, lines[:1])
+        self.assertEqual((summary['created'], summary['updated']), (1, 0))
+
+
+def _stream_client(*chunks, error=None):
+    def stream_generate(payload):
+        yield from chunks
+        if error is not None:
+            raise error
+    client = mock.Mock(base_url='http://ollama.test')
+    client.stream_generate.side_effect = stream_generate
+    return client
+
+
+@override_settings(LLM_ARCHIVE_ENABLED=False)
+@mock.patch('core.embeddings.schedule')
+class GenerateContentStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.persona = Persona.objects.create(author=self.user.author, name='Dry', tone='dry')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def stream(self, ollama):
+        with mock.patch('core.views.get_client', return_value=ollama), \
+                mock.patch('core.utils.get_client', return_value=ollama):
+            response = self.client.post(f'/api/personas/{self.persona.pk}/generate-content-stream/',
+                                        {'prompt': 'rain'}, format='json')
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_streams_tokens_then_the_saved_piece(self, _schedule):
+        events = self.stream(_stream_client(
+            {'response': 'Title: Rain\n'}, {'response': 'It '}, {'response': 'rained.'}, {'done': True}))
+
+        self.assertEqual([event['event'] for event in events], ['token', 'token', 'token', 'done'])
+        self.assertEqual(''.join(event['token'] for event in events[:-1]), 'Title: Rain\nIt rained.')
+        piece = ContentPiece.objects.get()
+        self.assertEqual(events[-1]['id'], piece.pk)
+        self.assertEqual(events[-1]['content_piece']['id'], piece.pk)
+        self.assertEqual(piece.persona, self.persona)
+        self.assertIn('It rained.', piece.content)
+
+    def test_reports_a_backend_failure_mid_stream(self, _schedule):
+        events = self.stream(_stream_client({'response': 'It '}, error=requests.ConnectionError('reset')))
+
+        self.assertEqual([event['event'] for event in events], ['token', 'error'])
+        self.assertFalse(ContentPiece.objects.exists())
+
+    def test_reports_a_stream_cut_off_before_done(self, _schedule):
+        events = self.stream(_stream_client({'response': 'It '}))
+        self.assertEqual(events[-1]['event'], 'error')
+        self.assertFalse(ContentPiece.objects.exists())
+
+
+class WorkerStartupTests(SimpleTestCase):
+    def is_server(self, *argv, run_main=''):
+        with mock.patch.object(apps.sys, 'argv', list(argv)), mock.patch.dict(apps.os.environ, {'RUN_MAIN': run_main}):
+            return apps._is_server_process()
+
+    def test_servers_start_workers(self):
+        self.assertTrue(self.is_server('/venv/bin/gunicorn', 'backend.wsgi'))
+        self.assertTrue(self.is_server('/venv/lib/python3.11/site-packages/uvicorn/__main__.py', 'backend.asgi:app'))
+        self.assertTrue(self.is_server('manage.py', 'runserver', run_main='true'))
+        self.assertTrue(self.is_server('manage.py', 'runserver', '--noreload'))
+
+    def test_other_processes_do_not(self):
+        for argv in (('manage.py', 'runserver'), ('manage.py', 'migrate'),
+                     ('/usr/lib/python3.11/site-packages/django/__main__.py', 'migrate'),
+                     ('/venv/bin/pytest',), ('/venv/bin/celery', 'worker'), ('script.py',), ('-c',)):
+            self.assertFalse(self.is_server(*argv), argv)
+
+    def test_explicit_setting_wins(self):
+        with mock.patch.object(apps, '_is_server_process', return_value=False):
+            with override_settings(LLM_RUN_WORKERS=True):
+                self.assertTrue(apps._runs_workers())
+            with override_settings(LLM_RUN_WORKERS=None):
+                self.assertFalse(apps._runs_workers())
+        with mock.patch.object(apps, '_is_server_process', return_value=True), override_settings(LLM_RUN_WORKERS=False):
+            self.assertFalse(apps._runs_workers())
+
+
+class PersonaAnalysisTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @mock.patch('core.serializers.analyze_writing_sample')
+    @mock.patch('core.jobs.enqueue_persona_analysis')
+    def test_async_create_returns_202_and_pending(self, enqueue, analyze):
+        response = self.client.post('/api/personas/?async=true',
+                                    {'name': 'Dry', 'writing_sample': 'Plain words.'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['analysis_status'], 'pending')
+        analyze.assert_not_called()
+        persona = Persona.objects.get()
+        enqueue.assert_called_once_with(persona, mode=None)
+
+        response = self.client.get(f'/api/personas/{persona.pk}/analysis-status/')
+        self.assertEqual(response.data, {'id': persona.pk, 'analysis_status': 'pending', 'analysis_error': None})
+
+    def pending_persona(self):
+        return Persona.objects.create(author=self.user.author, name='Dry', writing_sample='Plain words.',
+                                      analysis_status='pending')
+
+    @mock.patch('core.jobs.analyze_writing_sample', return_value={'tone': 'dry', 'idiom_usage': 2, 'id': 99})
+    def test_analysis_completes_and_fills_traits(self, analyze):
+        persona = self.pending_persona()
+        jobs.run_persona_analysis(persona.pk, mode='fast')
+
+        analyze.assert_called_once_with('Plain words.', mode='fast')
+        persona.refresh_from_db()
+        self.assertEqual((persona.analysis_status, persona.tone, persona.idiom_usage), ('complete', 'dry', 2))
+        self.assertIn('dry', persona.compiled_prompt)
+
+        response = self.client.get(f'/api/personas/{persona.pk}/analysis-status/')
+        self.assertEqual(response.data['analysis_status'], 'complete')
+
+    @mock.patch('core.jobs.analyze_writing_sample', return_value=None)
+    def test_analysis_without_a_result_fails(self, analyze):
+        persona = self.pending_persona()
+        jobs.run_persona_analysis(persona.pk)
+        persona.refresh_from_db()
+        self.assertEqual(persona.analysis_status, 'failed')
+        self.assertTrue(persona.analysis_error)
+
+    @mock.patch('core.jobs.analyze_writing_sample', side_effect=RuntimeError('model crashed'))
+    def test_analysis_crash_fails_with_the_error(self, analyze):
+        persona = self.pending_persona()
+        jobs.run_persona_analysis(persona.pk)
+        persona.refresh_from_db()
+        self.assertEqual((persona.analysis_status, persona.analysis_error), ('failed', 'model crashed'))
+
+    @mock.patch('core.jobs.analyze_writing_sample')
+    def test_only_pending_personas_are_claimed(self, analyze):
+        persona = Persona.objects.create(author=self.user.author, name='Done', analysis_status='complete')
+        jobs.run_persona_analysis(persona.pk)
+        analyze.assert_not_called()
+
+
+class GenerationCoalescingTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = GenerationCache()
+        self.key = f'generation:test:{time.monotonic_ns()}'
+        self.release = threading.Event()
+        self.calls = 0
+
+    def run_concurrently(self, compute, count=5, priority='batch'):
+        outcomes = [None] * count
+        lookups = []
+
+        def call(index):
+            with scheduler_context(None, priority):
+                try:
+                    outcomes[index] = self.cache.get_or_generate(self.key, compute)
+                except Exception as e:
+                    outcomes[index] = e
+
+        count_lookup = mock.patch('core.cache.generation_cache_requests.inc',
+                                  side_effect=lambda **labels: lookups.append(labels))
+        with count_lookup:
+            threads = [threading.Thread(target=call, args=(index,)) for index in range(count)]
+            for thread in threads:
+                thread.start()
+            # Release the leader once every caller has missed or joined it
+            deadline = time.monotonic() + 5
+            while len(lookups) < count and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.release.set()
+            for thread in threads:
+                thread.join(5)
+        return outcomes
+
+    def blocking(self, result=None, error=None):
+        def compute():
+            self.calls += 1
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return compute
+
+    def test_concurrent_duplicates_make_one_call(self):
+        outcomes = self.run_concurrently(self.blocking(result='Title: Rain'))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(outcomes, ['Title: Rain'] * 5)
+        # Later calls are served from the cache
+        self.assertEqual(self.cache.get_or_generate(self.key, self.blocking(result='other')), 'Title: Rain')
+
+    def test_leader_error_reaches_followers(self):
+        error = requests.ConnectionError('down')
+        outcomes = self.run_concurrently(self.blocking(error=error))
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(outcome is error for outcome in outcomes))
+
+    def test_interactive_follower_gives_up_after_the_queue_timeout(self):
+        leader = threading.Thread(target=self.cache.get_or_generate, args=(self.key, self.blocking(result='x')))
+        leader.start()
+        self.addCleanup(leader.join, 5)
+        self.addCleanup(self.release.set)
+        while not self.calls:
+            time.sleep(0.01)
+
+        with mock.patch('core.cache.scheduler.queue_timeout', 0.05), scheduler_context(None, 'interactive'):
+            with self.assertRaises(LLMBusy):
+                self.cache.get_or_generate(self.key, self.blocking(result='y'))
+        self.assertEqual(self.calls, 1)
+
+
+@override_settings(BATCH_GENERATION_SYNC_MAX_ITEMS=4)
+@mock.patch('core.embeddings.schedule')
+class BatchGenerateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.personas = [Persona.objects.create(author=self.user.author, name=name) for name in ('A', 'B')]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_failed_items_are_reported_and_not_saved(self, schedule):
+        def generate(persona, prompt, fresh=False):
+            if prompt == 'boom':
+                raise requests.ConnectionError('down')
+            return '' if persona.name == 'B' else f'Title: {prompt}\nAbout {prompt}.'
+
+        with mock.patch('core.batch.generate_content', side_effect=generate):
+            response = self.client.post('/api/personas/batch-generate/', {
+                'prompts': ['rain', 'boom'], 'persona_ids': [persona.pk for persona in self.personas],
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 3))
+        statuses = {(result['persona'], result['prompt']): result for result in response.data['results']}
+        a, b = self.personas
+        created = statuses[(a.pk, 'rain')]
+        self.assertEqual(created['status'], 'created')
+        self.assertEqual(statuses[(a.pk, 'boom')],
+                         {'persona': a.pk, 'prompt': 'boom', 'status': 'failed', 'error': 'down'})
+        self.assertEqual(statuses[(b.pk, 'rain')]['status'], 'failed')
+
+        piece = ContentPiece.objects.get()
+        self.assertEqual((piece.pk, piece.persona, piece.title), (created['content_piece'], a, 'rain'))
+        self.assertEqual(list(schedule.call_args.args[0]), [piece.pk])
+
+    @mock.patch('core.jobs.submit')
+    def test_large_batches_are_queued_as_jobs(self, submit, schedule):
+        with mock.patch('core.batch.generate_content') as generate:
+            response = self.client.post('/api/personas/batch-generate/', {
+                'prompts': ['a', 'b', 'c'], 'persona_ids': [persona.pk for persona in self.personas],
+            }, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(GenerationJob.objects.filter(status='queued').count(), 6)
+        generate.assert_not_called()
+
+
+class WritingSampleChunkingTests(SimpleTestCase):
+    def test_chunks_break_on_paragraph_boundaries(self):
+        paragraphs = ['First paragraph here.', 'Second one, a bit longer.', 'Third.', 'Fourth paragraph.']
+        chunks = split_writing_sample('\n\n'.join(paragraphs), 50)
+        self.assertEqual(chunks, [
+            'First paragraph here.\n\nSecond one, a bit longer.',
+            'Third.\n\nFourth paragraph.',
+        ])
+
+    def test_oversized_paragraphs_split_on_sentences_then_hard(self):
+        chunks = split_writing_sample('One two three. Four five six. Seven eight nine.', 20)
+        self.assertEqual(chunks, ['One two three.', 'Four five six.', 'Seven eight nine.'])
+        chunks = split_writing_sample('x' * 25, 10)
+        self.assertEqual(chunks, ['x' * 10, 'x' * 10, 'x' * 5])
+
+    def test_numeric_traits_are_averaged(self):
+        merged = merge_analyses([
+            {'idiom_usage': 2}, {'idiom_usage': '7'}, {'idiom_usage': 4, 'humor_sarcasm_usage': 9},
+        ])
+        self.assertEqual(merged, {'idiom_usage': 4, 'humor_sarcasm_usage': 9})
+
+    def test_categorical_traits_take_the_majority(self):
+        merged = merge_analyses([
+            {'tone': 'dry', 'sentence_structure': 'varied'},
+            {'tone': 'warm', 'sentence_structure': ''},
+            {'tone': 'dry', 'sentence_structure': None},
+        ])
+        self.assertEqual(merged, {'tone': 'dry', 'sentence_structure': 'varied'})
+
+
+class StylometryTests(SimpleTestCase):
+    SAMPLE = (
+        "I don't think it's ready. Why would it be? The report was written in haste (by Sam), "
+        "and we'll fix it when we can. She said \"soon\"... Maybe.\n"
+        "- check the numbers\n- send it back\n"
+    )
+
+    def test_measures_a_fixed_sample(self):
+        self.assertEqual(stylometry.analyze(self.SAMPLE), {
+            'contraction_usage': 10,  # don't, it's, we'll in 34 words
+            'passive_voice_frequency': 5,  # "was written" in 6 sentences
+            'rhetorical_question_usage': 7,  # 1 question in 6 sentences
+            'list_usage_tendency': 10,
+            'ellipsis_usage': 10,
+            'word_length_preference': 'short',
+            'subordinate_clause_frequency': 2,
+            'parenthetical_aside_frequency': 6,
+            'quotation_frequency': 6,
+        })
+
+    def test_formal_prose_scores_low_and_long(self):
+        traits = stylometry.analyze(
+            'Extraordinarily comprehensive documentation necessitates considerable organizational commitment.')
+        self.assertEqual(traits.pop('word_length_preference'), 'long')
+        self.assertEqual(set(traits.values()), {1})
+
+    def test_sample_without_words_measures_nothing(self):
+        self.assertEqual(stylometry.analyze('123 --- !!!'), {})
+
+    @mock.patch('core.utils.analysis_cache')
+    @mock.patch('core.utils.get_client')
+    def test_fast_mode_never_calls_the_llm(self, get_client, cache):
+        self.assertEqual(utils.analyze_writing_sample(self.SAMPLE, mode='fast'), stylometry.analyze(self.SAMPLE))
+        self.assertIsNone(utils.analyze_writing_sample('123', mode='fast'))
+        get_client.assert_not_called()
+        cache.get_or_compute.assert_not_called()
+
+    @mock.patch('core.utils.analysis_cache')
+    @mock.patch('core.utils.get_async_client')
+    async def test_async_fast_mode_never_calls_the_llm(self, get_async_client, cache):
+        traits = await utils.aanalyze_writing_sample(self.SAMPLE, mode='fast')
+        self.assertEqual(traits, stylometry.analyze(self.SAMPLE))
+        get_async_client.assert_not_called()
+        cache.aget_or_compute.assert_not_called()
+
+
+@override_settings(ANALYSIS_CHUNK_CHARS=30)
+class ChunkedAnalysisTests(TestCase):
+    def test_chunks_are_analyzed_separately_and_merged(self):
+        results = {'Alpha beta.': {'tone': 'dry', 'idiom_usage': 2},
+                   'Gamma delta.': {'tone': 'dry', 'idiom_usage': 6},
+                   'Epsilon zeta.': None}
+        sample = '\n\n'.join([f'{text} ' + 'x' * 15 for text in results])
+
+        def analyze_chunk(chunk, traits=None):
+            return results[chunk.split(' x')[0]]
+
+        with mock.patch('core.utils._analyze_chunk', side_effect=analyze_chunk) as analyze:
+            merged = utils._analyze_writing_sample(sample, ['tone', 'idiom_usage'])
+        self.assertEqual(analyze.call_count, 3)
+        # The failed chunk is left out of the merge
+        self.assertEqual(merged, {'tone': 'dry', 'idiom_usage': 4})
+
+
+class MetricsTests(SimpleTestCase):
+    def test_counter_exposition_escapes_labels(self):
+        registry = Registry()
+        requests_total = registry.counter('requests_total', 'Requests.', ['model'])
+        requests_total.inc(model='plain')
+        requests_total.inc(2, model='say "hi"\\\n')
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{model="plain"} 1.0',
+            'requests_total{model="say \\"hi\\"\\\\\\n"} 2.0',
+        ])
+
+    def test_histogram_buckets_sum_and_count(self):
+        registry = Registry()
+        duration = registry.histogram('duration_seconds', 'Duration.', ['op'], buckets=(1, 5))
+        for value in (0.5, 3, 7):
+            duration.observe(value, op='gen')
+        self.assertEqual(registry.render().splitlines()[2:], [
+            'duration_seconds_bucket{op="gen",le="1.0"} 1',
+            'duration_seconds_bucket{op="gen",le="5.0"} 2',
+            'duration_seconds_bucket{op="gen",le="+Inf"} 3',
+            'duration_seconds_sum{op="gen"} 10.5',
+            'duration_seconds_count{op="gen"} 3',
+        ])
+
+    @override_settings(METRICS_TOKEN='')
+    def test_llm_call_is_exposed(self):
+        model = f'metrics-test-{time.monotonic_ns()}'
+        observe_llm_call('generation', model, {
+            'total_duration': 2_000_000_000, 'prompt_eval_count': 100, 'eval_count': 50, 'eval_duration': 5_000_000_000,
+        }, persona_id=7)
+        observe_llm_call('generation', model, error='timed out')
+
+        body = self.client.get('/metrics').content.decode()
+        labels = f'model="{model}",operation="generation"'
+        for line in (
+            f'llm_requests_total{{{labels},status="success"}} 1.0',
+            f'llm_requests_total{{{labels},status="failure"}} 1.0',
+            f'llm_request_failures_total{{{labels}}} 1.0',
+            f'llm_prompt_tokens_total{{{labels},persona="7"}} 100.0',
+            f'llm_request_duration_seconds_bucket{{{labels},le="1.0"}} 0',
+            f'llm_request_duration_seconds_bucket{{{labels},le="2.5"}} 1',
+            f'llm_request_duration_seconds_sum{{{labels}}} 2.0',
+            f'llm_request_duration_seconds_count{{{labels}}} 1',
+            f'llm_tokens_per_second_bucket{{{labels},le="10.0"}} 1',
+            f'llm_tokens_per_second_sum{{{labels}}} 10.0',
+        ):
+            self.assertIn(line, body.splitlines())
+
+
+class TraitSimilarityTests(TestCase):
+    def setUp(self):
+        similarity.invalidate()
+        self.addCleanup(similarity.invalidate)
+        self.user = User.objects.create_user('writer', password='secret')
+        self.query = self.create_persona('Query', 9, 9)
+        # Same direction as the query but further out: closest by cosine, not by distance
+        self.stronger = self.create_persona('Stronger', 10, 10)
+        self.nearby = self.create_persona('Nearby', 8, 9)
+        self.opposite = self.create_persona('Opposite', 2, 2)
+
+    def create_persona(self, name, vocabulary, idioms):
+        return Persona.objects.create(
+            author=self.user.author, name=name, vocabulary_complexity=vocabulary, idiom_usage=idioms)
+
+    def ranking(self, metric):
+        return [persona_id for persona_id, _ in similarity.find_similar(self.query, metric=metric)]
+
+    def test_cosine_ranks_by_direction(self):
+        matches = similarity.find_similar(self.query, metric='cosine')
+        self.assertEqual([persona_id for persona_id, _ in matches],
+                         [self.stronger.pk, self.nearby.pk, self.opposite.pk])
+        self.assertAlmostEqual(matches[0][1], 1.0, places=5)
+        self.assertAlmostEqual(matches[-1][1], -1.0, places=5)
+
+    def test_euclidean_ranks_by_distance(self):
+        matches = similarity.find_similar(self.query, metric='euclidean')
+        self.assertEqual([persona_id for persona_id, _ in matches],
+                         [self.nearby.pk, self.stronger.pk, self.opposite.pk])
+        # Distance over the two shared traits, rescaled to the full trait count
+        scale = len(similarity.PERSONA_NUMERIC_TRAITS) / 2
+        self.assertAlmostEqual(matches[0][1], (1 * scale) ** 0.5, places=4)
+
+    def test_query_persona_is_excluded(self):
+        for metric in ('cosine', 'euclidean'):
+            self.assertNotIn(self.query.pk, self.ranking(metric))
+        self.assertEqual(len(similarity.find_similar(self.query, k=2)), 2)
+
+    def test_save_and_delete_update_a_loaded_index(self):
+        self.ranking('cosine')  # loads the author's index
+
+        self.opposite.vocabulary_complexity = self.opposite.idiom_usage = 9
+        self.opposite.save()
+        added = self.create_persona('Added', 3, 3)
+        self.stronger.delete()
+
+        with self.assertNumQueries(0):
+            ranking = self.ranking('euclidean')
+        self.assertEqual(ranking, [self.opposite.pk, self.nearby.pk, added.pk])
+
+    def test_similar_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get(f'/api/personas/{self.query.pk}/similar/?k=1&metric=euclidean')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([match['name'] for match in response.data], ['Nearby'])
+        self.assertEqual(client.get(f'/api/personas/{self.query.pk}/similar/?metric=manhattan').status_code, 400)
+
+    def test_top_k_returns_the_smallest_keys_in_order(self):
+        keys = np.array([5.0, 1.0, 4.0, 2.0, 3.0])
+        self.assertEqual(similarity._top_k(keys, 3).tolist(), [1, 3, 4])
+        self.assertEqual(similarity._top_k(keys, 10).tolist(), [1, 3, 4, 2, 0])
+
+
+@mock.patch('core.embeddings.schedule')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.persona = Persona.objects.create(author=self.user.author, name='Persona')
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        self.url = f'/api/async/personas/{self.persona.pk}/generate-content/'
+
+    async def test_unauthenticated_requests_are_rejected(self, schedule):
+        for headers in ({}, {'Authorization': 'Bearer not-a-token'}):
+            response = await self.async_client.post(self.url, {'prompt': 'cats'},
+                                                     content_type='application/json', headers=headers)
+            self.assertEqual(response.status_code, 401)
+
+    @mock.patch('core.async_views.agenerate_content')
+    async def test_generate_content(self, agenerate_content, schedule):
+        agenerate_content.return_value = 'Title: Cats\n\nCats are great.'
+
+        response = await self.async_client.post(self.url, {'prompt': 'cats', 'fresh': True},
+                                                 content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        piece = await ContentPiece.objects.aget(pk=response.json()['id'])
+        self.assertEqual((piece.author_id, piece.persona_id), (self.user.author.pk, self.persona.pk))
+        persona, prompt = agenerate_content.call_args.args
+        self.assertEqual((persona.pk, prompt), (self.persona.pk, 'cats'))
+        self.assertIs(agenerate_content.call_args.kwargs['fresh'], True)
+
+    @mock.patch('core.async_views.agenerate_content')
+    async def test_errors_are_rendered_as_json(self, agenerate_content, schedule):
+        response = await self.async_client.post(self.url, {}, content_type='application/json', headers=self.headers)
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Prompt is required'}))
+
+        other = await sync_to_async(User.objects.create_user)('other', password='secret')
+        # Another author's persona is not found rather than forbidden
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(other).access_token}'}
+        response = await self.async_client.post(self.url, {'prompt': 'cats'},
+                                                 content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+        agenerate_content.side_effect = LLMBusy(wait=7)
+        response = await self.async_client.post(self.url, {'prompt': 'cats'},
+                                                 content_type='application/json', headers=self.headers)
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '7'))
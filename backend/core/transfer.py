@@ -0,0 +1,174 @@
+# core/transfer.py
+
+import json
+import logging
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import jobs, similarity
+from .models import PROMPT_FIELDS, Persona
+from .prompts import compile_prompt
+from .serializers import PersonaSerializer
+
+logger = logging.getLogger(__name__)
+
+# Lines validated and written per bulk statement, and rows fetched per export query
+CHUNK_SIZE = 500
+# Per-line errors listed in an import summary; later ones are only counted
+MAX_REPORTED_ERRORS = 100
+# Exported analysis states kept on import; 'pending' and 'analyzing' only
+# mean something alongside a queued job, so they are derived afresh
+IMPORTED_STATUSES = ('complete', 'failed')
+
+_NOT_IMPORTED = set(PersonaSerializer.Meta.read_only_fields) | {'analysis_mode'}
+IMPORT_FIELDS = [field for field in PersonaSerializer.Meta.fields if field not in _NOT_IMPORTED]
+TRAIT_FIELDS = [
+    field for field in IMPORT_FIELDS if field not in ('name', 'description', 'is_active', 'writing_sample')
+]
+EXPORT_FIELDS = ['id'] + IMPORT_FIELDS + ['analysis_status', 'created_at', 'updated_at']
+
+
+def export_personas(author):
+    """
+    Yields an author's personas as NDJSON, one JSON object per line.
+
+    Rows are read as plain values through .iterator(), so memory stays
+    flat however many personas the author has.
+
+    Parameters:
+    - author (Author): Owner of the personas.
+
+    Yields:
+    - str: One line per persona, in id order.
+    """
+    rows = (
+        Persona.objects.filter(author=author).order_by('pk')
+        .values(*EXPORT_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+    )
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def import_personas(author, lines, skip_analysis=False, update_existing=False, analysis_mode=None,
+                    chunk_size=CHUNK_SIZE):
+    """
+    Imports personas from NDJSON lines such as those export_personas writes.
+
+    Lines are read one at a time and validated with PersonaSerializer; valid
+    ones are written per chunk with bulk_create/bulk_update, so memory is
+    bounded by chunk_size rather than by the size of the import. Invalid
+    lines are reported and skipped without affecting the others.
+
+    A line with a writing_sample is saved as 'pending' and queued for
+    analysis on the worker pool, unless skip_analysis is set and the line
+    already carries traits. Analysis never runs inside the request. Other
+    lines keep their analysis_status if it is 'complete' or 'failed' and
+    are otherwise marked 'complete'.
+
+    Parameters:
+    - author (Author): Owner of the imported personas.
+    - lines (iterable): NDJSON lines, as str or bytes.
+    - skip_analysis (bool): Keep the traits in the file instead of re-analyzing the writing sample.
+    - update_existing (bool): Update the author's persona with a line's "id"
+      instead of creating a new one. Otherwise ids are ignored.
+    - analysis_mode (str): One of ANALYSIS_MODES for queued analyses; a
+      line's own "analysis_mode" takes precedence.
+    - chunk_size (int): Lines written per bulk statement.
+
+    Returns:
+    - dict: Counts of 'created', 'updated', 'failed' and 'analysis_queued'
+      personas, and 'errors' with the line number and errors of the first
+      MAX_REPORTED_ERRORS failed lines.
+    """
+    summary = {'created': 0, 'updated': 0, 'failed': 0, 'analysis_queued': 0, 'errors': []}
+    # One serializer validates every line, so its fields are only built once
+    validator = PersonaSerializer()
+    options = {'skip_analysis': skip_analysis, 'update_existing': update_existing, 'analysis_mode': analysis_mode}
+
+    chunk = []
+    for number, line in enumerate(lines, start=1):
+        try:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            record = json.loads(line)
+        except ValueError as e:
+            _record_error(summary, number, f'Invalid JSON: {e}')
+            continue
+        if not isinstance(record, dict):
+            _record_error(summary, number, 'Each line must be a JSON object.')
+            continue
+        try:
+            chunk.append((number, record.get('id'), record.get('analysis_status'), validator.run_validation(record)))
+        except serializers.ValidationError as e:
+            _record_error(summary, number, e.detail)
+        if len(chunk) >= chunk_size:
+            _write_chunk(author, chunk, summary, **options)
+            chunk = []
+    if chunk:
+        _write_chunk(author, chunk, summary, **options)
+
+    if summary['created'] or summary['updated']:
+        # bulk writes skip the post_save signal that keeps the index current
+        similarity.invalidate(author.pk)
+    logger.info(
+        f"Imported personas for author {author.pk}: {summary['created']} created, "
+        f"{summary['updated']} updated, {summary['failed']} failed"
+    )
+    return summary
+
+
+def _record_error(summary, number, errors):
+    summary['failed'] += 1
+    if len(summary['errors']) < MAX_REPORTED_ERRORS:
+        summary['errors'].append({'line': number, 'errors': errors})
+
+
+def _write_chunk(author, chunk, summary, skip_analysis, update_existing, analysis_mode):
+    existing = {}
+    if update_existing:
+        ids = [record_id for _, record_id, _, _ in chunk if isinstance(record_id, int)]
+        existing = Persona.objects.filter(author=author, pk__in=ids).in_bulk()
+
+    now = timezone.now()
+    created, updated, update_fields, analyses = [], [], set(), []
+    for _, record_id, status, data in chunk:
+        mode = data.pop('analysis_mode', None) or analysis_mode
+        persona = existing.get(record_id)
+        if persona is None:
+            persona = Persona(author=author, **data)
+            created.append(persona)
+        else:
+            for field, value in data.items():
+                setattr(persona, field, value)
+            # bulk_update does not apply auto_now
+            persona.updated_at = now
+            update_fields.update(data)
+            updated.append(persona)
+
+        has_traits = any(getattr(persona, field) is not None for field in TRAIT_FIELDS)
+        if data.get('writing_sample') and not (skip_analysis and has_traits):
+            persona.analysis_status = 'pending'
+            persona.analysis_error = None
+            analyses.append((persona, mode))
+        else:
+            persona.analysis_status = status if status in IMPORTED_STATUSES else 'complete'
+        update_fields.update(('analysis_status', 'analysis_error'))
+        # bulk writes bypass Persona.save(), which normally compiles the prompt
+        compile_prompt(persona)
+
+    with transaction.atomic():
+        if created:
+            Persona.objects.bulk_create(created)
+        if updated:
+            Persona.objects.bulk_update(updated, sorted(update_fields | {*PROMPT_FIELDS, 'updated_at'}))
+        for persona, mode in analyses:
+            jobs.enqueue_persona_analysis(persona, mode=mode)
+
+    summary['created'] += len(created)
+    summary['updated'] += len(updated)
+    summary['analysis_queued'] += len(analyses)
@@ -2,7 +2,10 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PersonaViewSet, ContentPieceViewSet
+from . import async_views
+from .views import (
+    PersonaViewSet, ContentPieceViewSet, GenerationJobViewSet, AnalysisCacheStatsView, LLMCallViewSet
+)
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -11,9 +14,18 @@ from rest_framework_simplejwt.views import (
 router = DefaultRouter()
 router.register(r'personas', PersonaViewSet, basename='persona')
 router.register(r'content', ContentPieceViewSet, basename='content')
+router.register(r'jobs', GenerationJobViewSet, basename='job')
+router.register(r'llm-calls', LLMCallViewSet, basename='llm-call')
 
 urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('analysis-cache/stats/', AnalysisCacheStatsView.as_view(), name='analysis_cache_stats'),
+    # Non-blocking versions of the LLM endpoints, for ASGI servers
+    path('async/personas/', async_views.create_persona, name='async_persona_create'),
+    path('async/personas/<int:pk>/generate-content/', async_views.generate_content,
+         name='async_generate_content'),
+    path('async/personas/<int:pk>/generate-content-stream/', async_views.generate_content_stream,
+         name='async_generate_content_stream'),
     path('', include(router.urls)),
 ]
@@ -1,17 +1,119 @@
 # Import necessary libraries
+import asyncio
+import contextvars
 import logging
 import json
 import os
 import re
+import httpx
 import requests
+from asgiref.sync import sync_to_async
+from collections import Counter
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from django.conf import settings
+from .analysis_schema import analysis_schema, coerce_analysis, parse_analysis, repair_json
+from .ollama import get_async_client, get_client
+from .cache import analysis_cache, generation_cache
+from .prompts import prompt_is_current
+from .scheduler import scheduler
+from . import archive, metrics, stylometry
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-OLLAMA_BASE_URL = 'http://localhost:11434/api/generate'
+
+ANALYSIS_MODEL = settings.OLLAMA_ANALYSIS_MODEL
+GENERATION_MODEL = settings.OLLAMA_GENERATION_MODEL
+EMBEDDING_MODEL = settings.OLLAMA_EMBED_MODEL
+# Bump whenever the analysis prompt changes so cached results are not reused
+ANALYSIS_PROMPT_VERSION = 1
+
+# 'llm' asks the model for every trait, 'hybrid' measures the stylometric
+# traits locally and asks the model for the rest, 'fast' skips the model
+ANALYSIS_MODES = ('llm', 'hybrid', 'fast')
+
+# Persona fields the analysis prompt asks for, with the value format for each
+ANALYSIS_TRAITS = [
+    ('name', '"[Author/Character Name]"'),
+    ('vocabulary_complexity', '[1-10]'),
+    ('sentence_structure', '"[simple/complex/varied]"'),
+    ('paragraph_organization', '"[structured/loose/stream-of-consciousness]"'),
+    ('idiom_usage', '[1-10]'),
+    ('metaphor_frequency', '[1-10]'),
+    ('simile_frequency', '[1-10]'),
+    ('tone', '"[formal/informal/academic/conversational/etc.]"'),
+    ('punctuation_style', '"[minimal/heavy/unconventional]"'),
+    ('contraction_usage', '[1-10]'),
+    ('pronoun_preference', '"[first-person/third-person/etc.]"'),
+    ('passive_voice_frequency', '[1-10]'),
+    ('rhetorical_question_usage', '[1-10]'),
+    ('list_usage_tendency', '[1-10]'),
+    ('personal_anecdote_inclusion', '[1-10]'),
+    ('pop_culture_reference_frequency', '[1-10]'),
+    ('technical_jargon_usage', '[1-10]'),
+    ('parenthetical_aside_frequency', '[1-10]'),
+    ('humor_sarcasm_usage', '[1-10]'),
+    ('emotional_expressiveness', '[1-10]'),
+    ('emphatic_device_usage', '[1-10]'),
+    ('quotation_frequency', '[1-10]'),
+    ('analogy_usage', '[1-10]'),
+    ('sensory_detail_inclusion', '[1-10]'),
+    ('onomatopoeia_usage', '[1-10]'),
+    ('alliteration_frequency', '[1-10]'),
+    ('word_length_preference', '"[short/long/varied]"'),
+    ('foreign_phrase_usage', '[1-10]'),
+    ('rhetorical_device_usage', '[1-10]'),
+    ('statistical_data_usage', '[1-10]'),
+    ('personal_opinion_inclusion', '[1-10]'),
+    ('transition_usage', '[1-10]'),
+    ('reader_question_frequency', '[1-10]'),
+    ('imperative_sentence_usage', '[1-10]'),
+    ('dialogue_inclusion', '[1-10]'),
+    ('regional_dialect_usage', '[1-10]'),
+    ('hedging_language_frequency', '[1-10]'),
+    ('language_abstraction', '"[concrete/abstract/mixed]"'),
+    ('personal_belief_inclusion', '[1-10]'),
+    ('repetition_usage', '[1-10]'),
+    ('subordinate_clause_frequency', '[1-10]'),
+    ('verb_type_preference', '"[active/stative/mixed]"'),
+    ('sensory_imagery_usage', '[1-10]'),
+    ('symbolism_usage', '[1-10]'),
+    ('digression_frequency', '[1-10]'),
+    ('formality_level', '[1-10]'),
+    ('reflection_inclusion', '[1-10]'),
+    ('irony_usage', '[1-10]'),
+    ('neologism_frequency', '[1-10]'),
+    ('ellipsis_usage', '[1-10]'),
+    ('cultural_reference_inclusion', '[1-10]'),
+    ('stream_of_consciousness_usage', '[1-10]'),
+    ('openness_to_experience', '[1-10]'),
+    ('conscientiousness', '[1-10]'),
+    ('extraversion', '[1-10]'),
+    ('agreeableness', '[1-10]'),
+    ('emotional_stability', '[1-10]'),
+    ('dominant_motivations', '"[achievement/affiliation/power/etc.]"'),
+    ('core_values', '"[integrity/freedom/knowledge/etc.]"'),
+    ('decision_making_style', '"[analytical/intuitive/spontaneous/etc.]"'),
+    ('empathy_level', '[1-10]'),
+    ('self_confidence', '[1-10]'),
+    ('risk_taking_tendency', '[1-10]'),
+    ('idealism_vs_realism', '"[idealistic/realistic/mixed]"'),
+    ('conflict_resolution_style', '"[assertive/collaborative/avoidant/etc.]"'),
+    ('relationship_orientation', '"[independent/communal/mixed]"'),
+    ('emotional_response_tendency', '"[calm/reactive/intense]"'),
+    ('creativity_level', '[1-10]'),
+    ('age', '"[age or age range]"'),
+    ('gender', '"[gender]"'),
+    ('education_level', '"[highest level of education]"'),
+    ('professional_background', '"[brief description]"'),
+    ('cultural_background', '"[brief description]"'),
+    ('primary_language', '"[language]"'),
+    ('language_fluency', '"[native/fluent/intermediate/beginner]"'),
+]
 
 def extract_json(text):
     """
@@ -23,234 +125,559 @@ def extract_json(text):
     Returns:
     - dict: The extracted JSON data as a dictionary.
     """
-    try:
-        json_str = re.search(r'\{.*\}', text, re.DOTALL).group()
-        return json.loads(json_str)
-    except (AttributeError, json.JSONDecodeError):
+    data = repair_json(text)
+    if data is None:
         logger.error("Failed to extract JSON from the text.")
-        return None
+    return data
     
-def analyze_writing_sample(writing_sample):
+def analyze_writing_sample(writing_sample, mode=None):
     """
     Analyzes a given writing sample to assess various characteristics.
     
+    Outside 'llm' mode, the traits in stylometry.MEASURED_TRAITS are measured
+    locally and left out of the LLM prompt; 'fast' mode returns only those.
+    LLM results are served from the analysis cache when the same sample has
+    already been analyzed with the current model, prompt version and trait set.
+    
     Parameters:
     - writing_sample (str): The text to analyze.
+    - mode (str): One of ANALYSIS_MODES; defaults to settings.ANALYSIS_MODE.
     
     Returns:
     - dict: Analysis results in JSON format.
     """
+    mode = mode or settings.ANALYSIS_MODE
+    measured = stylometry.analyze(writing_sample) if mode != 'llm' else {}
+    if mode == 'fast':
+        return measured or None
+
+    traits = [field for field, _ in ANALYSIS_TRAITS if field not in measured]
+    variant = _trait_variant(traits)
+    analyzed_data = analysis_cache.get_or_compute(
+        writing_sample, ANALYSIS_MODEL, ANALYSIS_PROMPT_VERSION,
+        partial(_analyze_writing_sample, traits=traits), variant=variant
+    )
+    if analyzed_data is None:
+        return None
+    # Also normalizes results cached before responses were schema-checked
+    return {**coerce_analysis(analyzed_data, _analysis_schema(traits)), **measured}
+
+
+def _analyze_writing_sample(writing_sample, traits=None):
+    """
+    Analyzes a sample, splitting long ones into chunks that are analyzed
+    concurrently and merged (map-reduce) so each LLM call stays bounded.
+    """
+    if len(writing_sample) <= settings.ANALYSIS_CHUNK_CHARS:
+        return _analyze_chunk(writing_sample, traits)
+
+    chunks = split_writing_sample(writing_sample, settings.ANALYSIS_CHUNK_CHARS)
+    logger.info(f"Analyzing writing sample in {len(chunks)} chunks")
+
+    def analyze_all(pending):
+        with ThreadPoolExecutor(max_workers=settings.ANALYSIS_CHUNK_CONCURRENCY,
+                                thread_name_prefix='llm-analysis') as executor:
+            # Each chunk thread runs in a copy of this context so the scheduler sees the caller's author
+            contexts = [contextvars.copy_context() for _ in pending]
+            return list(executor.map(
+                lambda context, chunk: context.run(_analyze_chunk, chunk, traits), contexts, pending
+            ))
+
+    # Chunks are cached individually so an edited manuscript reuses unchanged parts
+    analyses = analysis_cache.get_or_compute_many(
+        chunks, ANALYSIS_MODEL, ANALYSIS_PROMPT_VERSION, analyze_all, variant=_trait_variant(traits)
+    )
+    return _merge_chunk_analyses(analyses)
+
+
+def _trait_variant(traits):
+    """Cache key variant for a narrowed trait set; the full set keeps the original keys."""
+    if traits is None or len(traits) == len(ANALYSIS_TRAITS):
+        return ''
+    return ','.join(traits)
+
+
+def _merge_chunk_analyses(analyses):
+    chunk_count = len(analyses)
+    analyses = [analysis for analysis in analyses if analysis]
+    if not analyses:
+        return None
+    if len(analyses) < chunk_count:
+        logger.warning(f"{chunk_count - len(analyses)} of {chunk_count} chunks failed analysis; merging the rest")
+    return merge_analyses(analyses)
+
 
-    prompt = f'''
+def split_writing_sample(writing_sample, max_chars):
+    """
+    Splits a writing sample into chunks of at most max_chars, on paragraph
+    boundaries where possible.
+    
+    Parameters:
+    - writing_sample (str): The text to split.
+    - max_chars (int): Maximum chunk length in characters.
+    
+    Returns:
+    - list[str]: The chunks in order.
+    """
+    paragraphs = []
+    for paragraph in re.split(r'\n\s*\n', writing_sample.strip()):
+        paragraph = paragraph.strip()
+        # Fall back to sentence, then hard, splits for oversized paragraphs
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind('. ', 0, max_chars)
+            cut = cut + 1 if cut > 0 else max_chars
+            paragraphs.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if paragraph:
+            paragraphs.append(paragraph)
+
+    chunks = []
+    current = ''
+    for paragraph in paragraphs:
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def merge_analyses(analyses):
+    """
+    Merges per-chunk analysis results into a single result.
+    
+    Traits whose values are all numeric are averaged (rounded to the nearest
+    integer); any other trait takes the most common value across chunks.
+    
+    Parameters:
+    - analyses (list[dict]): Per-chunk analysis results.
+    
+    Returns:
+    - dict: The merged analysis.
+    """
+    values = {}
+    for analysis in analyses:
+        for field, value in analysis.items():
+            if value is not None and value != '':
+                values.setdefault(field, []).append(value)
+
+    merged = {}
+    for field, field_values in values.items():
+        numbers = [_as_number(value) for value in field_values]
+        if all(number is not None for number in numbers):
+            merged[field] = round(sum(numbers) / len(numbers))
+        else:
+            votes = Counter(json.dumps(value, sort_keys=True) for value in field_values)
+            merged[field] = json.loads(votes.most_common(1)[0][0])
+    return merged
+
+
+def _as_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_analysis_prompt(writing_sample, traits=None):
+    """
+    Builds the LLM analysis prompt, asking only for the given traits.
+    
+    Parameters:
+    - writing_sample (str): The text to analyze.
+    - traits (list[str]): Fields to ask for; defaults to all of ANALYSIS_TRAITS.
+    
+    Returns:
+    - str: The prompt.
+    """
+    wanted = set(traits) if traits is not None else None
+    template = '\n'.join(
+        f'                    "{field}": {hint},'
+        for field, hint in ANALYSIS_TRAITS if wanted is None or field in wanted
+    )
+    return f'''
                     Please analyze the writing style and personality of the given writing sample. Provide a detailed assessment of their characteristics using the following template. Rate each applicable characteristic on a scale of 1-10 where relevant, or provide a descriptive value. Return the results in a JSON format. Strictly only output the JSON object as outlined. If what you output is not in the following format reconstruct it so that it is.
 
-                    "name": "[Author/Character Name]",
-                    "vocabulary_complexity": [1-10],
-                    "sentence_structure": "[simple/complex/varied]",
-                    "paragraph_organization": "[structured/loose/stream-of-consciousness]",
-                    "idiom_usage": [1-10],
-                    "metaphor_frequency": [1-10],
-                    "simile_frequency": [1-10],
-                    "tone": "[formal/informal/academic/conversational/etc.]",
-                    "punctuation_style": "[minimal/heavy/unconventional]",
-                    "contraction_usage": [1-10],
-                    "pronoun_preference": "[first-person/third-person/etc.]",
-                    "passive_voice_frequency": [1-10],
-                    "rhetorical_question_usage": [1-10],
-                    "list_usage_tendency": [1-10],
-                    "personal_anecdote_inclusion": [1-10],
-                    "pop_culture_reference_frequency": [1-10],
-                    "technical_jargon_usage": [1-10],
-                    "parenthetical_aside_frequency": [1-10],
-                    "humor_sarcasm_usage": [1-10],
-                    "emotional_expressiveness": [1-10],
-                    "emphatic_device_usage": [1-10],
-                    "quotation_frequency": [1-10],
-                    "analogy_usage": [1-10],
-                    "sensory_detail_inclusion": [1-10],
-                    "onomatopoeia_usage": [1-10],
-                    "alliteration_frequency": [1-10],
-                    "word_length_preference": "[short/long/varied]",
-                    "foreign_phrase_usage": [1-10],
-                    "rhetorical_device_usage": [1-10],
-                    "statistical_data_usage": [1-10],
-                    "personal_opinion_inclusion": [1-10],
-                    "transition_usage": [1-10],
-                    "reader_question_frequency": [1-10],
-                    "imperative_sentence_usage": [1-10],
-                    "dialogue_inclusion": [1-10],
-                    "regional_dialect_usage": [1-10],
-                    "hedging_language_frequency": [1-10],
-                    "language_abstraction": "[concrete/abstract/mixed]",
-                    "personal_belief_inclusion": [1-10],
-                    "repetition_usage": [1-10],
-                    "subordinate_clause_frequency": [1-10],
-                    "verb_type_preference": "[active/stative/mixed]",
-                    "sensory_imagery_usage": [1-10],
-                    "symbolism_usage": [1-10],
-                    "digression_frequency": [1-10],
-                    "formality_level": [1-10],
-                    "reflection_inclusion": [1-10],
-                    "irony_usage": [1-10],
-                    "neologism_frequency": [1-10],
-                    "ellipsis_usage": [1-10],
-                    "cultural_reference_inclusion": [1-10],
-                    "stream_of_consciousness_usage": [1-10],
-                    "openness_to_experience": [1-10],
-                    "conscientiousness": [1-10],
-                    "extraversion": [1-10],
-                    "agreeableness": [1-10],
-                    "emotional_stability": [1-10],
-                    "dominant_motivations": "[achievement/affiliation/power/etc.]",
-                    "core_values": "[integrity/freedom/knowledge/etc.]",
-                    "decision_making_style": "[analytical/intuitive/spontaneous/etc.]",
-                    "empathy_level": [1-10],
-                    "self_confidence": [1-10],
-                    "risk_taking_tendency": [1-10],
-                    "idealism_vs_realism": "[idealistic/realistic/mixed]",
-                    "conflict_resolution_style": "[assertive/collaborative/avoidant/etc.]",
-                    "relationship_orientation": "[independent/communal/mixed]",
-                    "emotional_response_tendency": "[calm/reactive/intense]",
-                    "creativity_level": [1-10],
-                    "age": "[age or age range]",
-                    "gender": "[gender]",
-                    "education_level": "[highest level of education]",
-                    "professional_background": "[brief description]",
-                    "cultural_background": "[brief description]",
-                    "primary_language": "[language]",
-                    "language_fluency": "[native/fluent/intermediate/beginner]",
+{template}
 
                     Writing Sample:
                     {writing_sample}
                     '''
+
+
+def _analysis_schema(traits=None):
+    wanted = set(traits) if traits is not None else None
+    return analysis_schema(tuple(
+        (field, hint) for field, hint in ANALYSIS_TRAITS if wanted is None or field in wanted
+    ))
+
+
+def _analysis_payload(writing_sample, traits=None):
     payload = {
-        'model': 'qwen2.5:32b',  # Replace with your Ollama model name
-        'prompt': prompt,
+        'model': ANALYSIS_MODEL,
+        'prompt': build_analysis_prompt(writing_sample, traits),
         'stream': False
     }
-    headers = {'Content-Type': 'application/json'}
+    # Constrains decoding so the model can only emit an object matching the schema
+    if settings.ANALYSIS_OUTPUT_FORMAT == 'schema':
+        payload['format'] = _analysis_schema(traits)
+    elif settings.ANALYSIS_OUTPUT_FORMAT == 'json':
+        payload['format'] = 'json'
+    return payload
+
+
+def _parse_analysis(data, traits=None):
+    analyzed_data = parse_analysis(data['response'], _analysis_schema(traits))
+    if analyzed_data is None:
+        raise ValueError("Analysis response contained no usable traits")
+    return analyzed_data
 
+
+def _analyze_chunk(writing_sample, traits=None):
+    payload = _analysis_payload(writing_sample, traits)
+
+    data = None
     try:
-        response = requests.post(OLLAMA_BASE_URL, json=payload, headers=headers)
-        with open("generated_text.md", "w") as f:
-            f.write(response.text)
-        
-        data = json.loads(response.text)
-        response_str = data['response']
-        analyzed_data = json.loads(response_str)
-        
-        
-        
+        with scheduler.slot():
+            data = get_client().generate(payload)
+        analyzed_data = _parse_analysis(data, traits)
+        _record_call('analysis', payload, data)
         return analyzed_data
-    except (requests.RequestException, json.JSONDecodeError, AttributeError) as e:
+    except (requests.RequestException, ValueError, AttributeError, KeyError) as e:
         logger.error(f"Error during analyze_writing_sample: {str(e)}")
+        _record_call('analysis', payload, data, error=str(e))
         return None
     
 
 
-def generate_content(persona, prompt):
+def build_generation_payload(persona, prompt, stream=False):
+    """
+    Builds the Ollama request for writing as a persona.
+    
+    The persona's precompiled system prompt is sent as Ollama's 'system'
+    field ahead of the user's prompt. Because that prefix is identical across
+    requests for the same persona, a kept-alive model can reuse its evaluated
+    prefix and only has to evaluate the user's prompt.
+    A prompt compiled under a different PERSONA_PROMPT_ENCODING or token
+    budget is recompiled and stored first; async callers do that through
+    sync_to_async before calling this.
+    
+    Parameters:
+    - persona (Persona): The persona object with individual fields.
+    - prompt (str): The prompt to write about.
+    - stream (bool): Whether Ollama should stream the response.
+    
+    Returns:
+    - dict: The /api/generate payload.
+    """
+    if not prompt_is_current(persona):
+        persona.refresh_compiled_prompt()
+    return {
+        'model': GENERATION_MODEL,
+        'system': persona.compiled_prompt,
+        'prompt': f"Write about: {prompt}",
+        'keep_alive': settings.OLLAMA_KEEP_ALIVE,
+        'stream': stream
+    }
+
+
+def generate_content(persona, prompt, fresh=False):
     """
     Generates content based on a given persona and prompt.
     
+    Identical requests (same persona snapshot, prompt and model) are served
+    from the generation cache, and concurrent duplicates share one upstream call.
+    
     Parameters:
     - persona (Persona): The persona object with individual fields.
     - prompt (str): The prompt to write about.
+    - fresh (bool): Skip the cache and always generate new output.
     
     Returns:
     - str: The generated content.
     """
-  
-        # Convert persona fields into a format suitable for the prompt
-    persona_traits = {
-            "Writing Style": {
-                "vocabulary_complexity": f"{persona.vocabulary_complexity}/10",
-                "sentence_structure": persona.sentence_structure,
-                "paragraph_organization": persona.paragraph_organization,
-                "tone": persona.tone,
-                "punctuation_style": persona.punctuation_style,
-                "pronoun_preference": persona.pronoun_preference,
-                "formality_level": f"{persona.formality_level}/10",
-            },
-            "Language Patterns": {
-                "idiom_usage": f"{persona.idiom_usage}/10",
-                "metaphor_frequency": f"{persona.metaphor_frequency}/10",
-                "simile_frequency": f"{persona.simile_frequency}/10",
-                "technical_jargon_usage": f"{persona.technical_jargon_usage}/10",
-                "humor_sarcasm_usage": f"{persona.humor_sarcasm_usage}/10",
-            },
-            "Personality": {
-                "openness_to_experience": f"{persona.openness_to_experience}/10",
-                "conscientiousness": f"{persona.conscientiousness}/10",
-                "extraversion": f"{persona.extraversion}/10",
-                "agreeableness": f"{persona.agreeableness}/10",
-                "emotional_stability": f"{persona.emotional_stability}/10",
-                "dominant_motivations": persona.dominant_motivations,
-                "core_values": persona.core_values,
-                "decision_making_style": persona.decision_making_style,
-                "emotional_response_tendency": persona.emotional_response_tendency,
-            "creativity_level": f"{persona.creativity_level}/10",
-            },
-            "Demographics": {
-            "age": persona.age,
-            "gender": persona.gender,
-            "education_level": persona.education_level,
-            "professional_background": persona.professional_background,
-            "cultural_background": persona.cultural_background,
-            "primary_language": persona.primary_language,
-            "language_fluency": persona.language_fluency,
-        },
-        }
-
-        # Create the system prompt
-    system_prompt = f"""You are a writer with the following characteristics:
-
-Writing Style:
-{persona_traits['Writing Style']}
-
-Language Patterns:
-{persona_traits['Language Patterns']}
-
-Personality:
-{persona_traits['Personality']}
-
-Demographics:
-    {persona_traits['Demographics']}
-
-Write in a way that naturally reflects these characteristics. The response should include a title."""
-
-        # Combine system prompt and user prompt
-    combined_prompt = f"{system_prompt}\n\nWrite about: {prompt}"
+    payload = build_generation_payload(persona, prompt)
+    key = generation_cache.make_key(persona.pk, persona.updated_at, payload)
+    return generation_cache.get_or_generate(key, lambda: _generate_content(payload, persona.pk), fresh=fresh)
 
-    payload = {
-        'model': 'qwen2.5:32b',  # Replace with your Ollama model name
-        'prompt': combined_prompt,
-        'stream': False
-    }
-    headers = {'Content-Type': 'application/json'}
 
-    try:
-        logger.info(f"Sending request to OLLAMA API at {OLLAMA_BASE_URL} with payload: {payload}")
-        response = requests.post(OLLAMA_BASE_URL, json=payload, headers=headers)
-        logger.info(f"Received response from OLLAMA API: Status Code {response.status_code}")
+def _generate_content(payload, persona_id=None):
 
-        response.raise_for_status()
+    try:
+        client = get_client()
+        logger.info(f"Sending request to OLLAMA API at {client.base_url} with payload: {payload}")
+        with scheduler.slot():
+            response_json = client.generate(payload)
+        logger.info("Received response from OLLAMA API")
 
-        response_json = response.json()
         response_content = response_json.get('response', '').strip()
         if not response_content:
             logger.error("OLLAMA API response 'response' field is empty.")
+            _record_call('generation', payload, response_json, error='Empty response', persona_id=persona_id)
             return ''
 
+        _record_call('generation', payload, response_json, persona_id=persona_id)
         return response_content
 
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         logger.error(f"Error during generate_content: {e}")
-        if hasattr(e, 'response') and e.response:
+        _record_call('generation', payload, error=str(e), persona_id=persona_id)
+        if getattr(e, 'response', None) is not None:
             logger.error(f"Ollama Response Status: {e.response.status_code}")
             logger.error(f"Ollama Response Body: {e.response.text}")
         return ''
 
 
+def stream_content(persona, prompt):
+    """
+    Streams content for a persona and prompt token by token.
+    
+    Parameters:
+    - persona (Persona): The persona object with individual fields.
+    - prompt (str): The prompt to write about.
+    
+    Yields:
+    - str: Each text fragment as Ollama emits it.
+    
+    Raises:
+    - requests.RequestException: If the request fails or the stream is cut off.
+    """
+    payload = build_generation_payload(persona, prompt, stream=True)
+
+    fragments = []
+    try:
+        client = get_client()
+        logger.info(f"Streaming from OLLAMA API at {client.base_url}")
+        # The slot is held until the stream finishes or the client goes away
+        with scheduler.slot():
+            for chunk in client.stream_generate(payload):
+                if chunk.get('error'):
+                    raise requests.RequestException(chunk['error'])
+                if chunk.get('response'):
+                    fragments.append(chunk['response'])
+                    yield chunk['response']
+                if chunk.get('done'):
+                    # The final chunk carries the timing fields; archive it with the full text
+                    _record_call('generation_stream', payload, dict(chunk, response=''.join(fragments)),
+                                   persona_id=persona.pk)
+                    return
+        raise requests.RequestException("OLLAMA stream ended before completion.")
+    except requests.RequestException as e:
+        logger.error(f"Error during stream_content: {e}")
+        _record_call('generation_stream', payload, {'response': ''.join(fragments)},
+                       error=str(e), persona_id=persona.pk)
+        raise
+    except json.JSONDecodeError as e:
+        logger.error(f"Malformed chunk during stream_content: {e}")
+        _record_call('generation_stream', payload, {'response': ''.join(fragments)},
+                       error=str(e), persona_id=persona.pk)
+        raise requests.RequestException(f"Malformed OLLAMA stream chunk: {e}") from e
+
+
+# Async counterparts for the ASGI views (core.async_views). They use the
+# httpx-based AsyncOllamaClient, so a request waiting on the model holds no thread.
+
+async def aanalyze_writing_sample(writing_sample, mode=None):
+    """
+    Async version of analyze_writing_sample.
+    
+    Parameters:
+    - writing_sample (str): The text to analyze.
+    - mode (str): One of ANALYSIS_MODES; defaults to settings.ANALYSIS_MODE.
+    
+    Returns:
+    - dict: Analysis results in JSON format.
+    """
+    mode = mode or settings.ANALYSIS_MODE
+    measured = stylometry.analyze(writing_sample) if mode != 'llm' else {}
+    if mode == 'fast':
+        return measured or None
+
+    traits = [field for field, _ in ANALYSIS_TRAITS if field not in measured]
+    analyzed_data = await analysis_cache.aget_or_compute(
+        writing_sample, ANALYSIS_MODEL, ANALYSIS_PROMPT_VERSION,
+        partial(_aanalyze_writing_sample, traits=traits), variant=_trait_variant(traits)
+    )
+    if analyzed_data is None:
+        return None
+    # Also normalizes results cached before responses were schema-checked
+    return {**coerce_analysis(analyzed_data, _analysis_schema(traits)), **measured}
+
+
+async def _aanalyze_writing_sample(writing_sample, traits=None):
+    if len(writing_sample) <= settings.ANALYSIS_CHUNK_CHARS:
+        return await _aanalyze_chunk(writing_sample, traits)
+
+    chunks = split_writing_sample(writing_sample, settings.ANALYSIS_CHUNK_CHARS)
+    logger.info(f"Analyzing writing sample in {len(chunks)} chunks")
+    semaphore = asyncio.Semaphore(settings.ANALYSIS_CHUNK_CONCURRENCY)
+
+    async def analyze_one(chunk):
+        async with semaphore:
+            return await _aanalyze_chunk(chunk, traits)
+
+    async def analyze_all(pending):
+        return await asyncio.gather(*(analyze_one(chunk) for chunk in pending))
+
+    analyses = await analysis_cache.aget_or_compute_many(
+        chunks, ANALYSIS_MODEL, ANALYSIS_PROMPT_VERSION, analyze_all, variant=_trait_variant(traits)
+    )
+    return _merge_chunk_analyses(analyses)
+
+
+async def _aanalyze_chunk(writing_sample, traits=None):
+    payload = _analysis_payload(writing_sample, traits)
+
+    data = None
+    try:
+        async with scheduler.aslot():
+            data = await get_async_client().generate(payload)
+        analyzed_data = _parse_analysis(data, traits)
+        _record_call('analysis', payload, data)
+        return analyzed_data
+    except (httpx.HTTPError, ValueError, AttributeError, KeyError) as e:
+        logger.error(f"Error during aanalyze_writing_sample: {str(e)}")
+        _record_call('analysis', payload, data, error=str(e))
+        return None
+
+
+async def agenerate_content(persona, prompt, fresh=False):
+    """
+    Async version of generate_content, sharing its cache.
+    
+    Parameters:
+    - persona (Persona): The persona object with individual fields.
+    - prompt (str): The prompt to write about.
+    - fresh (bool): Skip the cache and always generate new output.
+    
+    Returns:
+    - str: The generated content.
+    """
+    if not prompt_is_current(persona):
+        await sync_to_async(persona.refresh_compiled_prompt)()
+    payload = build_generation_payload(persona, prompt)
+    key = generation_cache.make_key(persona.pk, persona.updated_at, payload)
+    return await generation_cache.aget_or_generate(
+        key, lambda: _agenerate_content(payload, persona.pk), fresh=fresh
+    )
+
+
+async def _agenerate_content(payload, persona_id=None):
+    try:
+        async with scheduler.aslot():
+            response_json = await get_async_client().generate(payload)
+        response_content = response_json.get('response', '').strip()
+        if not response_content:
+            logger.error("OLLAMA API response 'response' field is empty.")
+            _record_call('generation', payload, response_json, error='Empty response', persona_id=persona_id)
+            return ''
+
+        _record_call('generation', payload, response_json, persona_id=persona_id)
+        return response_content
+
+    except (httpx.HTTPError, ValueError) as e:
+        logger.error(f"Error during agenerate_content: {e}")
+        _record_call('generation', payload, error=str(e), persona_id=persona_id)
+        return ''
+
+
+async def astream_content(persona, prompt):
+    """
+    Async version of stream_content.
+    
+    Yields:
+    - str: Each text fragment as Ollama emits it.
+    
+    Raises:
+    - httpx.HTTPError: If the request fails or the stream is cut off.
+    """
+    if not prompt_is_current(persona):
+        await sync_to_async(persona.refresh_compiled_prompt)()
+    payload = build_generation_payload(persona, prompt, stream=True)
+
+    fragments = []
+    try:
+        async with scheduler.aslot():
+            async for chunk in get_async_client().stream_generate(payload):
+                if chunk.get('error'):
+                    raise httpx.HTTPError(chunk['error'])
+                if chunk.get('response'):
+                    fragments.append(chunk['response'])
+                    yield chunk['response']
+                if chunk.get('done'):
+                    _record_call('generation_stream', payload, dict(chunk, response=''.join(fragments)),
+                                 persona_id=persona.pk)
+                    return
+        raise httpx.HTTPError("OLLAMA stream ended before completion.")
+    except httpx.HTTPError as e:
+        logger.error(f"Error during astream_content: {e}")
+        _record_call('generation_stream', payload, {'response': ''.join(fragments)},
+                     error=str(e), persona_id=persona.pk)
+        raise
+    except json.JSONDecodeError as e:
+        logger.error(f"Malformed chunk during astream_content: {e}")
+        _record_call('generation_stream', payload, {'response': ''.join(fragments)},
+                     error=str(e), persona_id=persona.pk)
+        raise httpx.HTTPError(f"Malformed OLLAMA stream chunk: {e}") from e
+
+
+def embed_texts(texts):
+    """
+    Embeds texts with the local Ollama embedding model in one request.
+
+    Parameters:
+    - texts (list[str]): Texts to embed.
+
+    Returns:
+    - list[list[float]]: One vector per text, in order.
+    """
+    payload = {
+        'model': EMBEDDING_MODEL,
+        'input': texts,
+        'keep_alive': settings.OLLAMA_KEEP_ALIVE,
+    }
+    try:
+        with scheduler.slot():
+            response = get_client().embed(payload)
+    except requests.RequestException as e:
+        _record_call('embedding', {'model': EMBEDDING_MODEL, 'prompt': ''}, error=str(e))
+        raise
+    # Vectors are not worth archiving; keep only the timing fields
+    _record_call('embedding', {'model': EMBEDDING_MODEL, 'prompt': ''},
+                 {key: value for key, value in response.items() if key != 'embeddings'})
+    return response['embeddings']
+
+
+def _record_call(operation, payload, response=None, error=None, persona_id=None):
+    """Archives an Ollama call and records its timing metrics."""
+    archive.record(operation, payload, response, error=error, persona_id=persona_id)
+    metrics.observe_llm_call(operation, payload.get('model', ''), response, error=error, persona_id=persona_id)
+
+
+def split_content(generated_content):
+    """
+    Splits generated text into a title and a body.
+    
+    Parameters:
+    - generated_content (str): The raw generated text, title on the first line.
+    
+    Returns:
+    - tuple: (title, content)
+    """
+    lines = generated_content.strip().split('\n')
+    title = lines[0] if lines else 'Untitled'
+    # Remove 'Title:' prefix and quotes from the title
+    title = title.replace('Title:', '').strip().strip('"')
+    content = '\n'.join(lines[1:]) if len(lines) > 1 else ''
+    return title, content
+
+
 def save_blog_post(blog_post, title):
     """
     Saves a blog post to a file.
@@ -3,18 +3,63 @@
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .serializers import PersonaSerializer, ContentPieceSerializer
-from .models import Persona, ContentPiece
-from .utils import generate_content
+from rest_framework.views import APIView
+from .serializers import (
+    PersonaSerializer, ContentPieceSerializer, GenerationJobSerializer, BatchGenerateSerializer,
+    LLMCallSerializer
+)
+from .models import Persona, ContentPiece, GenerationJob, LLMCall
+from .utils import ANALYSIS_MODES, generate_content, stream_content, split_content
+from .ollama import OllamaUnavailable, get_client
+from .cache import analysis_cache
+from .metrics import registry
+from .batch import generate_batch
+from . import embeddings, similarity, transfer
+from .search import search_content
+from .scheduler import LLMBusy, scheduler, context as scheduler_context
+from . import jobs
 import logging
+import requests
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime, parse_date
 from django.views import View
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import json
 logger = logging.getLogger(__name__)
 
+
+def _is_truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def _wants_async(request):
+    """Returns True when the client asked for background processing (?async=true)."""
+    return _is_truthy(request.query_params.get('async', ''))
+
+
+def _semantic_matches(author, text, k=10, min_score=None):
+    """Runs a semantic search and returns the matching pieces, best first."""
+    with scheduler_context(author.id):
+        matches = embeddings.search(author.id, text, k=k, min_score=min_score)
+    pieces = ContentPiece.objects.select_related('persona').in_bulk([piece_id for piece_id, _ in matches])
+    return [
+        {
+            'id': piece_id,
+            'title': pieces[piece_id].title,
+            'persona': pieces[piece_id].persona_id,
+            'persona_name': pieces[piece_id].persona.name if pieces[piece_id].persona else None,
+            'created_at': pieces[piece_id].created_at,
+            'score': score,
+        }
+        for piece_id, score in matches if piece_id in pieces
+    ]
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class RegisterView(View):
     def post(self, request):
@@ -32,12 +77,54 @@ class RegisterView(View):
         user = User.objects.create_user(username=username, password=password, email=email)
         return JsonResponse({'message': 'User created successfully'}, status=201)
 
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. When METRICS_TOKEN is set, scrapers must send
+    it as a bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 class PersonaViewSet(viewsets.ModelViewSet):
     serializer_class = PersonaSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Persona.objects.filter(author=self.request.user.author)
+        # A correlated subquery avoids GROUP BY over every persona column
+        content_counts = ContentPiece.objects.filter(persona=OuterRef('pk')).order_by().values(
+            'persona'
+        ).annotate(count=Count('pk')).values('count')
+        queryset = Persona.objects.filter(author=self.request.user.author).annotate(
+            content_count=Coalesce(Subquery(content_counts), 0)
+        )
+        if self.action == 'list':
+            # Large text columns that the list representation never shows
+            queryset = queryset.defer('writing_sample', 'compiled_prompt', 'data')
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['async_analysis'] = _wants_async(self.request)
+        return context
+
+    def create(self, request, *args, **kwargs):
+        # Synchronous analysis runs as an interactive call for this author
+        with scheduler_context(request.user.author.id):
+            response = super().create(request, *args, **kwargs)
+        if response.data.get('analysis_status') == 'pending':
+            response.status_code = 202
+        return response
+
+    @action(detail=True, methods=['get'], url_path='analysis-status')
+    def analysis_status(self, request, pk=None):
+        persona = self.get_object()
+        return Response({
+            'id': persona.id,
+            'analysis_status': persona.analysis_status,
+            'analysis_error': persona.analysis_error,
+        })
 
     @action(detail=True, methods=['post'], url_path='generate-content')
     def generate_content(self, request, pk=None):
@@ -46,8 +133,28 @@ class PersonaViewSet(viewsets.ModelViewSet):
         
         if not prompt:
             return Response({'error': 'Prompt is required'}, status=400)
+
+        # Callers who want new output rather than a cached result pass "fresh": true
+        fresh = _is_truthy(request.data.get('fresh', False))
+
+        # "check_similar": true reports existing near-duplicates instead of generating
+        if _is_truthy(request.data.get('check_similar', False)):
+            try:
+                matches = _semantic_matches(request.user.author, prompt, k=5,
+                                            min_score=settings.SEMANTIC_DUPLICATE_THRESHOLD)
+            except (requests.RequestException, OllamaUnavailable, LLMBusy) as e:
+                logger.warning(f"Similarity check failed, generating anyway: {e}")
+                matches = []
+            if matches:
+                return Response({'error': 'Similar content already exists', 'matches': matches}, status=409)
+
+        if _wants_async(request):
+            job = jobs.enqueue_generation(request.user.author, persona, prompt, fresh=fresh)
+            serializer = GenerationJobSerializer(job)
+            return Response(serializer.data, status=202)
             
-        generated_content = generate_content(persona, prompt)
+        with scheduler_context(request.user.author.id):
+            generated_content = generate_content(persona, prompt, fresh=fresh)
         
         if generated_content:
             title, content = self._split_content(generated_content)
@@ -62,20 +169,323 @@ class PersonaViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=201)
         return Response({'error': 'Failed to generate content'}, status=500)
 
+    @action(detail=True, methods=['post'], url_path='generate-content-stream')
+    def generate_content_stream(self, request, pk=None):
+        """
+        Streams generated tokens as newline-delimited JSON events.
+
+        Emits {"event": "token", "token": ...} for every fragment, then
+        {"event": "done", "id": ..., "content_piece": {...}} once the piece is
+        saved, or {"event": "error", "error": ...} if generation fails.
+        """
+        persona = self.get_object()
+        prompt = request.data.get('prompt')
+
+        if not prompt:
+            return Response({'error': 'Prompt is required'}, status=400)
+
+        author = request.user.author
+        # Report an open circuit or a full queue (503/429) before the streaming response starts
+        get_client().check_available()
+        scheduler.check_admission(author.id, 'interactive')
+
+        def events():
+            fragments = []
+            try:
+                # The generator runs after the view returns, so tag its LLM call here
+                with scheduler_context(author.id):
+                    for token in stream_content(persona, prompt):
+                        fragments.append(token)
+                        yield json.dumps({'event': 'token', 'token': token}) + '\n'
+            except (requests.RequestException, OllamaUnavailable, LLMBusy):
+                yield json.dumps({'event': 'error', 'error': 'Failed to generate content'}) + '\n'
+                return
+
+            generated_content = ''.join(fragments).strip()
+            if not generated_content:
+                yield json.dumps({'event': 'error', 'error': 'Failed to generate content'}) + '\n'
+                return
+
+            title, content = self._split_content(generated_content)
+            content_piece = ContentPiece.objects.create(
+                author=author,
+                persona=persona,
+                title=title or 'Untitled',
+                content=content or '',
+                status='draft'
+            )
+            serializer = ContentPieceSerializer(content_piece)
+            yield json.dumps({'event': 'done', 'id': content_piece.id, 'content_piece': serializer.data}) + '\n'
+
+        response = StreamingHttpResponse(events(), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """
+        Returns the author's personas closest to this one by trait vector.
+
+        Query params: k (default 10, max 100) and metric ('cosine' or 'euclidean').
+        """
+        persona = self.get_object()
+        metric = request.query_params.get('metric', 'cosine')
+        if metric not in ('cosine', 'euclidean'):
+            return Response({'error': "metric must be 'cosine' or 'euclidean'"}, status=400)
+        try:
+            k = min(max(int(request.query_params.get('k', 10)), 1), 100)
+        except ValueError:
+            return Response({'error': 'k must be an integer'}, status=400)
+
+        matches = similarity.find_similar(persona, k=k, metric=metric)
+        names = dict(Persona.objects.filter(pk__in=[persona_id for persona_id, _ in matches]).values_list('pk', 'name'))
+        return Response([
+            {'id': persona_id, 'name': names.get(persona_id), 'score': score}
+            for persona_id, score in matches if persona_id in names
+        ])
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Streams all of the author's personas as NDJSON, one JSON object per line."""
+        response = StreamingHttpResponse(transfer.export_personas(request.user.author),
+                                         content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="personas.ndjson"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_personas(self, request):
+        """
+        Imports personas from an NDJSON body in the export format, reading it
+        line by line and writing in bulk chunks.
+
+        Query params: skip_analysis (keep the file's traits rather than
+        re-analyzing writing samples), update_existing (update the persona
+        with each line's id rather than creating one) and analysis_mode.
+        Returns created/updated/failed counts and the per-line errors.
+        """
+        analysis_mode = request.query_params.get('analysis_mode')
+        if analysis_mode is not None and analysis_mode not in ANALYSIS_MODES:
+            return Response({'error': f"analysis_mode must be one of {', '.join(ANALYSIS_MODES)}"}, status=400)
+        # The raw body, so lines are parsed as they arrive instead of all at once
+        stream = request.stream
+        if stream is None:
+            return Response({'error': 'Request body is empty'}, status=400)
+
+        summary = transfer.import_personas(
+            request.user.author, stream,
+            skip_analysis=_is_truthy(request.query_params.get('skip_analysis', '')),
+            update_existing=_is_truthy(request.query_params.get('update_existing', '')),
+            analysis_mode=analysis_mode,
+        )
+        return Response(summary)
+
+    @action(detail=False, methods=['post'], url_path='batch-generate')
+    def batch_generate(self, request):
+        """
+        Generates a piece for every combination of prompts and personas.
+
+        persona_ids defaults to all of the author's active personas. With
+        ?async=true, or when the batch has more than
+        BATCH_GENERATION_SYNC_MAX_ITEMS items, each item becomes a
+        GenerationJob and the jobs are returned with 202, so a large batch
+        never holds the request open. Otherwise the items are generated
+        concurrently and the per-item results are returned once the batch
+        finishes.
+        """
+        serializer = BatchGenerateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        personas = self.get_queryset()
+        if 'persona_ids' in data:
+            personas = personas.filter(pk__in=data['persona_ids'])
+            missing = set(data['persona_ids']) - {persona.pk for persona in personas}
+            if missing:
+                return Response({'error': f"Unknown persona ids: {sorted(missing)}"}, status=400)
+        else:
+            personas = personas.filter(is_active=True)
+        personas = list(personas)
+
+        item_count = len(personas) * len(data['prompts'])
+        if item_count > settings.BATCH_GENERATION_MAX_ITEMS:
+            return Response(
+                {'error': f"Batch has {item_count} items; the limit is {settings.BATCH_GENERATION_MAX_ITEMS}"},
+                status=400
+            )
+
+        author = request.user.author
+        if _wants_async(request) or item_count > settings.BATCH_GENERATION_SYNC_MAX_ITEMS:
+            queued = [
+                jobs.enqueue_generation(author, persona, prompt, fresh=data['fresh'])
+                for persona in personas for prompt in data['prompts']
+            ]
+            return Response(GenerationJobSerializer(queued, many=True).data, status=202)
+
+        results = generate_batch(author, personas, data['prompts'],
+                                 concurrency=data['concurrency'], fresh=data['fresh'])
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results,
+        })
+
     def _split_content(self, generated_content):
-        lines = generated_content.strip().split('\n')
-        title = lines[0] if lines else 'Untitled'
-        # Remove 'Title:' prefix and quotes from the title
-        title = title.replace('Title:', '').strip().strip('"')
-        content = '\n'.join(lines[1:]) if len(lines) > 1 else ''
-        return title, content
+        return split_content(generated_content)
 
 class ContentPieceViewSet(viewsets.ModelViewSet):
     serializer_class = ContentPieceSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return ContentPiece.objects.filter(author=self.request.user.author)
+        return ContentPiece.objects.filter(author=self.request.user.author).select_related('persona')
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user.author)
+
+    @action(detail=False, methods=['get'], url_path='low-conformance')
+    def low_conformance(self, request):
+        """
+        Lists scored pieces whose style conformance is below ?threshold=,
+        worst first, as candidates for regeneration. Scores are written by
+        the score_conformance management command.
+        """
+        try:
+            threshold = float(request.query_params.get('threshold', settings.CONFORMANCE_THRESHOLD))
+        except ValueError:
+            return Response({'error': 'threshold must be a number'}, status=400)
+
+        queryset = self.get_queryset().filter(conformance_score__lt=threshold).order_by('conformance_score')
+        if request.query_params.get('persona'):
+            try:
+                queryset = queryset.filter(persona_id=int(request.query_params['persona']))
+            except ValueError:
+                return Response({'error': 'persona must be an integer'}, status=400)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @action(detail=False, methods=['get'], url_path='semantic-search')
+    def semantic_search(self, request):
+        """
+        Finds content closest in meaning to q using Ollama embeddings.
+
+        Query params: q (required), k (max 50), min_score (cosine similarity).
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=400)
+        try:
+            k = min(max(int(request.query_params.get('k', 10)), 1), 50)
+            min_score = request.query_params.get('min_score')
+            min_score = float(min_score) if min_score else None
+        except ValueError:
+            return Response({'error': 'k and min_score must be numbers'}, status=400)
+
+        try:
+            return Response(_semantic_matches(request.user.author, query, k=k, min_score=min_score))
+        except (requests.RequestException, OllamaUnavailable, LLMBusy) as e:
+            logger.error(f"Semantic search failed: {e}")
+            return Response({'error': 'Failed to embed the query'}, status=500)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked full-text search over title and content.
+
+        Query params: q (required), persona, status, created_after,
+        created_before (ISO date or datetime), limit (max 100), offset.
+        """
+        params = request.query_params
+        query = params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=400)
+
+        filters = {}
+        try:
+            if params.get('persona'):
+                filters['persona_id'] = int(params['persona'])
+            for name in ('created_after', 'created_before'):
+                if params.get(name):
+                    value = parse_datetime(params[name]) or parse_date(params[name])
+                    if value is None:
+                        raise ValueError(name)
+                    filters[name] = value
+            limit = min(max(int(params.get('limit', 20)), 1), 100)
+            offset = max(int(params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({'error': 'Invalid filter value'}, status=400)
+        if params.get('status'):
+            filters['status'] = params['status']
+
+        hits = search_content(request.user.author.id, query, limit=limit, offset=offset, **filters)
+        pieces = ContentPiece.objects.select_related('persona').in_bulk([hit['id'] for hit in hits])
+        results = []
+        for hit in hits:
+            piece = pieces.get(hit['id'])
+            if piece is None:
+                continue
+            results.append({
+                'id': piece.id,
+                'title': piece.title,
+                'persona': piece.persona_id,
+                'persona_name': piece.persona.name if piece.persona else None,
+                'status': piece.status,
+                'created_at': piece.created_at,
+                'rank': hit['rank'],
+                'snippet': hit['snippet'],
+            })
+        return Response(results)
+
+class GenerationJobViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = GenerationJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return GenerationJob.objects.filter(author=self.request.user.author).select_related('persona')
+
+    @action(detail=True, methods=['get'])
+    def result(self, request, pk=None):
+        job = self.get_object()
+        if job.status == 'succeeded' and job.content_piece:
+            serializer = ContentPieceSerializer(job.content_piece)
+            return Response(serializer.data)
+        if job.status == 'failed' or job.status == 'succeeded':
+            return Response({'error': job.error or 'Failed to generate content'}, status=500)
+        return Response(GenerationJobSerializer(job).data, status=202)
+
+class AnalysisCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(analysis_cache.stats())
+
+class LLMCallViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Archived Ollama calls for debugging, filterable by ?operation=, ?model=,
+    ?persona= and ?success=.
+    """
+    serializer_class = LLMCallSerializer
+    permission_classes = [permissions.IsAdminUser]
+    filters = {}
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        filters = {field: params[field] for field in ('operation', 'model') if params.get(field)}
+        if params.get('persona'):
+            try:
+                filters['persona_id'] = int(params['persona'])
+            except ValueError:
+                return Response({'error': 'persona must be an integer'}, status=400)
+        if params.get('success'):
+            success = params['success'].lower()
+            if success not in ('1', 'true', 'yes', '0', 'false', 'no'):
+                return Response({'error': 'success must be true or false'}, status=400)
+            filters['success'] = _is_truthy(success)
+        self.filters = filters
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return LLMCall.objects.filter(**self.filters)